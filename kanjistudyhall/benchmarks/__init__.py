@@ -0,0 +1,58 @@
+"""Benchmarks for the hot paths of Kanji Study Hall.
+
+Each benchmark module runs on its own from the project directory, e.g.
+
+    python -m benchmarks.review_queue
+
+benchmarks.suite times every hot path against synthetic users from
+benchmarks.synthetic, and writes JSON results which can be compared
+between commits.
+
+Benchmarks never touch the configured database. They build a throwaway
+test database the same way the test runner does, and destroy it again
+when they are done.
+
+"""
+import contextlib
+import os
+import time
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.base")
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timings(func, repeat=5, number=50):
+    """Return the average time per call, in seconds, of each of repeat
+    runs of number calls.
+
+    """
+    result = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        result.append((time.perf_counter() - start) / number)
+    return result
+
+
+def best_of(func, repeat=5, number=50):
+    """Return the best average time per call, in seconds, out of
+    repeat runs of number calls each.
+
+    """
+    return min(timings(func, repeat, number))
@@ -0,0 +1,45 @@
+"""Times the collection detail page's card listing, which pages with a
+keyset cursor, at the first and the last page of a large collection, and
+compares it with OFFSET pagination of the same ordering. Keyset pages
+should cost the same at any depth.
+
+    python -m benchmarks.card_list
+
+"""
+from benchmarks import best_of, setup, test_database
+from benchmarks.review_queue import create_collection, create_kanji
+
+SIZE = 3000
+PAGE_SIZE = 20
+FIELDS = ('collection', 'mnemonic', 'next_review', 'kanji',
+          'kanji__character', 'kanji__keyword', 'kanji__heisig_index')
+
+
+def run():
+    from django.contrib.auth import get_user_model
+    owner = get_user_model().objects.create(username='bench')
+    collection = create_collection(owner, create_kanji(SIZE), SIZE)
+    cards = collection.kanjicard_set.only(*FIELDS)
+    last_page = SIZE // PAGE_SIZE
+    # The cursor of the last card on the page before the last one
+    cursor = list(cards.order_by('kanji__heisig_index', 'pk').values_list(
+        'kanji__heisig_index', 'pk'))[(last_page - 1) * PAGE_SIZE - 1]
+
+    def offset(page):
+        ordered = cards.select_related('kanji').order_by(
+            'kanji__heisig_index', 'pk')
+        start = (page - 1) * PAGE_SIZE
+        return list(ordered[start:start + PAGE_SIZE])
+
+    print('{:>8}  {:>14}  {:>14}'.format('page', 'keyset', 'offset'))
+    for page, after in ((1, None), (last_page, cursor)):
+        keyset = best_of(lambda: cards.heisig_page(after, size=PAGE_SIZE))
+        offset_time = best_of(lambda: offset(page))
+        print('{:>8}  {:>11.3f} ms  {:>11.3f} ms'.format(
+            page, keyset * 1000, offset_time * 1000))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        run()
@@ -0,0 +1,38 @@
+"""Times a year-long workload forecast for a full 3,000 card Heisig
+collection. The forecast view needs this to stay well under 100 ms.
+
+    python -m benchmarks.forecast
+
+"""
+import datetime
+
+import numpy as np
+
+from benchmarks import best_of, setup
+
+CARDS = 3000
+
+
+def run():
+    from kanji.forecast import forecast
+    rng = np.random.RandomState(2015)
+    today = np.datetime64(datetime.date.today(), 'D')
+    streak = rng.randint(0, 12, CARDS)
+    columns = (
+        rng.uniform(1.3, 2.8, CARDS),
+        streak,
+        streak + rng.randint(0, 10, CARDS),
+        today - rng.randint(0, 90, CARDS).astype('timedelta64[D]'),
+        today + rng.randint(-10, 60, CARDS).astype('timedelta64[D]'),
+    )
+    for days in (30, 90, 365):
+        seconds = best_of(
+            lambda: forecast(*columns, days=days, today=today,
+                             scores=(5, 4, 4, 3, 1)),
+            number=5)
+        print('{:>4} days: {:>8.2f} ms'.format(days, seconds * 1000))
+
+
+if __name__ == '__main__':
+    setup()
+    run()
@@ -0,0 +1,378 @@
+"""End-to-end load test of the review loop, through the real WSGI
+application (config.wsgi.application).
+
+Each virtual user runs in its own thread with its own cookies. It logs
+in through the login form, opens its collection, and then fetches the
+next card from the study queue and scores it, over and over, until it
+has scored --reviews cards or its queue is empty. Requests/s and the
+p50/p95/p99 latency of each endpoint are reported at the end.
+
+By default the virtual users call the WSGI callable directly. With
+--transport http the same application is served from a local socket
+instead, so HTTP parsing and connection handling are included. Either
+way the data is synthetic (see benchmarks.synthetic) in a throwaway
+database, and nothing outside this process is needed.
+
+    python -m benchmarks.loadtest --users 20 --reviews 50
+    python -m benchmarks.loadtest --users 20 --transport http
+
+To load a server that is already running, give its address and a CSV
+file of username,password,collection rows for accounts on it:
+
+    python -m benchmarks.loadtest --url http://localhost:8000 \\
+        --accounts accounts.csv
+
+"""
+import argparse
+import atexit
+import csv
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from benchmarks import setup, test_database
+
+Account = namedtuple('Account', 'username password collection')
+Response = namedtuple('Response', 'status headers body')
+
+LOGIN_URL = '/accounts/login/'
+COLLECTION_URL = '/kanji/collections/{}/'
+STUDY_URL = '/kanji/collections/{}/study/'
+# The scores virtual users give, and how often
+SCORES, SCORE_WEIGHTS = (1, 3, 4, 5), (0.1, 0.15, 0.4, 0.35)
+PERCENTILES = (50, 95, 99)
+
+
+class WSGITransport(object):
+    """Calls a WSGI application directly."""
+
+    def __init__(self, application):
+        self.application = application
+
+    def request(self, method, path, body=b'', headers=None):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in (headers or {}).items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = response_headers
+
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            # Sends request_finished, as a server would
+            if hasattr(result, 'close'):
+                result.close()
+        return Response(started['status'], started['headers'], content)
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(object):
+    """Sends requests over one keep-alive HTTP connection."""
+
+    def __init__(self, url):
+        url = urllib.parse.urlsplit(url)
+        self.connection = http.client.HTTPConnection(url.hostname,
+                                                     url.port or 80)
+
+    def request(self, method, path, body=b'', headers=None):
+        self.connection.request(method, path, body=body,
+                                headers=headers or {})
+        response = self.connection.getresponse()
+        return Response(response.status, response.getheaders(),
+                        response.read())
+
+    def close(self):
+        self.connection.close()
+
+
+class Stats(object):
+    """Latencies of every request, by endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        """A dict of the overall and per-endpoint results."""
+        total = sum(len(values) for values in self.latencies.values())
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[endpoint] = dict(
+                requests=len(values),
+                errors=self.errors[endpoint],
+                requests_per_second=len(values) / elapsed,
+                mean_ms=sum(values) / len(values) * 1000,
+                **{'p{}_ms'.format(p): percentile(values, p) * 1000
+                   for p in PERCENTILES})
+        return {
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'seconds': elapsed,
+            'requests_per_second': total / elapsed,
+            'endpoints': endpoints,
+        }
+
+
+def percentile(ordered, p):
+    """The nearest-rank percentile of a sorted list."""
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class VirtualUser(object):
+
+    def __init__(self, transport, account, stats, rng):
+        self.transport = transport
+        self.account = account
+        self.stats = stats
+        self.rng = rng
+        self.cookies = SimpleCookie()
+
+    def request(self, endpoint, method, path, expect=200, body=b'',
+                headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                '{}={}'.format(name, morsel.value)
+                for name, morsel in self.cookies.items())
+        start = time.perf_counter()
+        response = self.transport.request(method, path, body, headers)
+        self.stats.add(endpoint, time.perf_counter() - start,
+                       response.status == expect)
+        for name, value in response.headers:
+            if name.lower() == 'set-cookie':
+                self.cookies.load(value)
+        return response
+
+    def _csrf_headers(self):
+        return {'X-CSRFToken': self.cookies['csrftoken'].value,
+                'Referer': 'http://localhost/'}
+
+    def log_in(self):
+        self.request('login form', 'GET', LOGIN_URL)
+        form = urllib.parse.urlencode({
+            'login': self.account.username,
+            'password': self.account.password,
+            'csrfmiddlewaretoken': self.cookies['csrftoken'].value,
+        }).encode()
+        headers = self._csrf_headers()
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        response = self.request('log in', 'POST', LOGIN_URL, expect=302,
+                                body=form, headers=headers)
+        return response.status == 302
+
+    def run(self, reviews):
+        if not self.log_in():
+            return
+        name = urllib.parse.quote(self.account.collection)
+        self.request('collection', 'GET', COLLECTION_URL.format(name))
+        study = STUDY_URL.format(name)
+        response = self.request('next card', 'GET', study)
+        headers = self._csrf_headers()
+        headers['Content-Type'] = 'application/json'
+        for _ in range(reviews):
+            if response.status != 200:
+                # Start again from whatever the queue holds now
+                response = self.request('next card', 'GET', study)
+                continue
+            card = json.loads(response.body.decode('utf-8'))['card']
+            if card is None:
+                return
+            score = self.rng.choices(SCORES, SCORE_WEIGHTS)[0]
+            body = json.dumps({'card': card['id'], 'score': score}).encode()
+            # Scoring responds with the next card
+            response = self.request('score', 'POST', study, body=body,
+                                    headers=headers)
+
+
+def run(transport_factory, accounts, reviews, seed):
+    """Run a virtual user for each account at once. Returns the report."""
+    stats = Stats()
+
+    def virtual_user(number):
+        transport = transport_factory()
+        try:
+            VirtualUser(transport, accounts[number], stats,
+                        random.Random(seed + number)).run(reviews)
+        finally:
+            transport.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+        # Raise anything a virtual user raised
+        list(executor.map(virtual_user, range(len(accounts))))
+    return stats.report(time.perf_counter() - start)
+
+
+def print_report(report):
+    print('{:,} requests in {:.2f} s: {:.1f} requests/s, {} errors'.format(
+        report['requests'], report['seconds'],
+        report['requests_per_second'], report['errors']))
+    print('{:<12} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+        'endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms'))
+    for endpoint, result in report['endpoints'].items():
+        print('{:<12} {:>8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+            endpoint, result['requests'], result['errors'],
+            result['requests_per_second'], result['p50_ms'],
+            result['p95_ms'], result['p99_ms']))
+
+
+def read_accounts(path):
+    with open(path, newline='') as f:
+        return [Account(*row) for row in csv.reader(f) if row]
+
+
+def synthetic_accounts(users, cards, seed):
+    from benchmarks.synthetic import COLLECTION_NAME, PASSWORD, generate
+    from kanji.models import KanjiCardCollection
+    generate(users, cards, seed)
+    return [Account(username, PASSWORD, COLLECTION_NAME)
+            for username in KanjiCardCollection.objects.order_by(
+                'pk').values_list('owner__username', flat=True)[:users]]
+
+
+def serve(application):
+    """Serve application from a free local port, in a thread. Returns
+    the server's URL and the server. wsgiref closes the connection after
+    every response, so each request pays for a new one.
+
+    """
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import (WSGIRequestHandler, WSGIServer,
+                                       make_server)
+
+    class Server(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', 0, application, server_class=Server,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(server.server_port), server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10,
+                        help="virtual users, each with its own account")
+    parser.add_argument('--reviews', type=int, default=50,
+                        help="cards each virtual user scores")
+    parser.add_argument('--cards', type=int, default=3000,
+                        help="cards in each synthetic collection")
+    parser.add_argument('--seed', type=int, default=2015)
+    parser.add_argument('--transport', choices=('wsgi', 'http'),
+                        default='wsgi')
+    parser.add_argument('--url', help="load this server instead")
+    parser.add_argument('--accounts',
+                        help="CSV of username,password,collection for --url")
+    parser.add_argument('--output', help="write the report here as JSON")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        if not args.accounts:
+            parser.error("--url needs --accounts")
+        accounts = read_accounts(args.accounts)[:args.users]
+        report = run(lambda: HTTPTransport(args.url), accounts, args.reviews,
+                     args.seed)
+    else:
+        report = run_in_process(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+def run_in_process(args):
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    # Threads can't share an in-memory SQLite database, so use a file, in
+    # WAL mode so readers don't block the writer. SQLite still allows one
+    # writer at a time, and a transaction which read before another wrote
+    # fails with "database is locked" rather than waiting; those requests
+    # are counted as errors. Run with PostgreSQL settings for numbers
+    # that say anything about production.
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, True)
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'loadtest.sqlite3')
+    with test_database(), override_settings(ALLOWED_HOSTS=['localhost',
+                                                           '127.0.0.1']):
+        from config.wsgi import application
+        from kanji import reviewlog
+        accounts = synthetic_accounts(args.users, args.cards, args.seed)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+        # Let every connection go, so each thread opens its own
+        connection.close()
+        try:
+            if args.transport == 'http':
+                url, server = serve(application)
+                try:
+                    return run(lambda: HTTPTransport(url), accounts,
+                               args.reviews, args.seed)
+                finally:
+                    server.shutdown()
+                    server.server_close()
+            return run(lambda: WSGITransport(application), accounts,
+                       args.reviews, args.seed)
+        finally:
+            # Before the database goes
+            reviewlog.flush()
+
+
+if __name__ == '__main__':
+    setup()
+    main()
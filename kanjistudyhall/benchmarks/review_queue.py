@@ -0,0 +1,72 @@
+"""Times KanjiCardCollection.next_scheduled_card against collections of
+increasing size. Roughly three quarters of each collection is overdue,
+so this also covers a large backlog. With the review queue index in
+place the time per call should stay flat as the collection grows.
+
+    python -m benchmarks.review_queue
+
+"""
+import datetime
+import random
+
+from benchmarks import best_of, setup, test_database
+
+SIZES = (100, 1000, 5000, 20000)
+# The CJK Unified Ideographs block is big enough for the largest collection
+FIRST_CHARACTER = 0x4E00
+
+
+def create_kanji(count):
+    from kanji.models import Kanji
+    Kanji.objects.bulk_create(
+        (Kanji(character=chr(FIRST_CHARACTER + i),
+               keyword='keyword {}'.format(i),
+               heisig_index=i + 1)
+         for i in range(count)),
+        batch_size=500
+    )
+    return list(Kanji.objects.order_by('heisig_index'))
+
+
+def create_collection(owner, kanji, size):
+    from kanji.models import KanjiCard, KanjiCardCollection
+    rng = random.Random(size)
+    today = datetime.date.today()
+    collection = KanjiCardCollection.objects.create(
+        owner=owner, name='bench{}'.format(size))
+    cards = []
+    for i, k in enumerate(kanji[:size]):
+        cards.append(KanjiCard(
+            collection=collection,
+            kanji=k,
+            mnemonic='mnemonic {}'.format(i),
+            total_reviews=rng.randint(0, 40),
+            consecutive_correct=rng.randint(0, 8),
+            last_reviewed=today - datetime.timedelta(days=rng.randint(0, 30)),
+            last_missed=today - datetime.timedelta(days=rng.randint(0, 60)),
+            next_review=today + datetime.timedelta(days=rng.randint(-30, 9)),
+            efactor=round(rng.uniform(1.3, 2.8), 2),
+        ))
+    KanjiCard.objects.bulk_create(cards, batch_size=500)
+    return collection
+
+
+def run():
+    from django.contrib.auth import get_user_model
+    owner = get_user_model().objects.create(username='bench')
+    kanji = create_kanji(max(SIZES))
+    print('{:>8}  {:>14}  {:>14}'.format(
+        'cards', 'next card', 'after cursor'))
+    for size in SIZES:
+        collection = create_collection(owner, kanji, size)
+        first = collection.next_scheduled_card()
+        next_card = best_of(collection.next_scheduled_card)
+        after = best_of(lambda: collection.next_scheduled_card(after=first))
+        print('{:>8}  {:>11.3f} ms  {:>11.3f} ms'.format(
+            size, next_card * 1000, after * 1000))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        run()
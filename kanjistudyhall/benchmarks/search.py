@@ -0,0 +1,51 @@
+"""Times kanji.search.search_cards over a user with many cards, for a
+keyword prefix as typed into an autocomplete box and for a word in the
+mnemonics. Both should stay well under 20 ms as the number of cards
+grows.
+
+    python -m benchmarks.search
+
+"""
+import random
+
+from benchmarks import best_of, setup, test_database
+from benchmarks.review_queue import create_kanji
+
+SIZES = (1000, 5000, 20000)
+WORDS = ('samurai', 'moon', 'river', 'sword', 'temple', 'lantern', 'crane',
+         'mountain', 'rice', 'storm', 'gate', 'fisherman', 'drum', 'lotus')
+
+
+def create_cards(owner, kanji, size):
+    from kanji.models import KanjiCard, KanjiCardCollection
+    rng = random.Random(size)
+    collection = KanjiCardCollection.objects.create(
+        owner=owner, name='bench{}'.format(size))
+    KanjiCard.objects.bulk_create(
+        (KanjiCard(collection=collection,
+                   kanji=k,
+                   mnemonic='{} {}'.format(' '.join(rng.sample(WORDS, 6)), i))
+         for i, k in enumerate(kanji[:size])),
+        batch_size=500
+    )
+
+
+def run():
+    from django.contrib.auth import get_user_model
+    from kanji.search import search_cards
+    kanji = create_kanji(max(SIZES))
+    print('{:>8}  {:>14}  {:>14}'.format('cards', 'keyword', 'mnemonic'))
+    for size in SIZES:
+        owner = get_user_model().objects.create(
+            username='bench{}'.format(size))
+        create_cards(owner, kanji, size)
+        keyword = best_of(lambda: search_cards(owner, 'keyword 12'))
+        mnemonic = best_of(lambda: search_cards(owner, 'samurai'))
+        print('{:>8}  {:>11.3f} ms  {:>11.3f} ms'.format(
+            size, keyword * 1000, mnemonic * 1000))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        run()
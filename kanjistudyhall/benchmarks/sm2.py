@@ -0,0 +1,50 @@
+"""Compares rescheduling a million cards with kanji.sm2 against scoring
+KanjiCard instances one at a time in memory.
+
+    python -m benchmarks.sm2
+
+"""
+import datetime
+import time
+
+import numpy as np
+
+from benchmarks import setup
+
+ROWS = 1000000
+CARDS = 20000
+
+
+def run():
+    from kanji import sm2
+    from kanji.models import KanjiCard
+    rng = np.random.RandomState(2015)
+    today = datetime.date.today()
+    efactor = rng.uniform(1.3, 2.8, ROWS)
+    streak = rng.randint(0, 12, ROWS)
+    total = streak + rng.randint(0, 10, ROWS)
+    last_missed = (np.datetime64(today, 'D') -
+                   rng.randint(0, 90, ROWS).astype('timedelta64[D]'))
+    score = rng.randint(0, 6, ROWS)
+
+    start = time.perf_counter()
+    sm2.review(efactor, streak, total, last_missed, score, today)
+    vectorized = time.perf_counter() - start
+
+    cards = [KanjiCard(efactor=efactor[i], consecutive_correct=streak[i],
+                       total_reviews=total[i], last_missed=today)
+             for i in range(CARDS)]
+    start = time.perf_counter()
+    for card, card_score in zip(cards, score):
+        card._calculate_next_review(card_score)
+    per_card = time.perf_counter() - start
+
+    print('sm2.review: {:,} rows in {:.3f} s ({:.3f} us/row)'.format(
+        ROWS, vectorized, vectorized / ROWS * 1e6))
+    print('per card:   {:,} rows in {:.3f} s ({:.3f} us/row)'.format(
+        CARDS, per_card, per_card / CARDS * 1e6))
+
+
+if __name__ == '__main__':
+    setup()
+    run()
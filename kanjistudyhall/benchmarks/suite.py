@@ -0,0 +1,311 @@
+"""Times every hot path of Kanji Study Hall against synthetic users from
+benchmarks.synthetic: the review queue, scoring cards, the card list,
+search, the forecast and dashboard, and the views which use them.
+
+The data and the choice of users and cards come from a fixed seed, so
+runs at the same scale can be compared. Save the results of one commit
+as JSON, and compare another commit's run against them; benchmarks more
+than --threshold times slower are reported, and make the exit status 1.
+
+    python -m benchmarks.suite --users 100 --output before.json
+    python -m benchmarks.suite --users 100 --compare before.json
+
+"""
+import argparse
+import datetime
+import fnmatch
+import itertools
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+
+from benchmarks import setup, test_database, timings
+from benchmarks.synthetic import PASSWORD, generate
+
+# Collections each benchmark cycles through, so no one collection's
+# cached pages or rows flatter it
+SAMPLE = 20
+REVIEW_BATCH = 20
+REPEAT = 5
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Context(object):
+    """The collections and cards the benchmarks work on."""
+
+    def __init__(self, seed):
+        from django.test import Client
+        from kanji.models import KanjiCardCollection
+        self.rng = random.Random(seed)
+        pks = list(KanjiCardCollection.objects.order_by('pk').values_list(
+            'pk', flat=True))
+        self.collections = list(KanjiCardCollection.objects.filter(
+            pk__in=self.rng.sample(pks, min(SAMPLE, len(pks)))
+        ).select_related('owner').order_by('pk'))
+        self.collection = self.collections[0]
+        self.client = Client()
+        self.client.login(username=self.collection.owner.username,
+                          password=PASSWORD)
+
+    def cycle(self, items=None):
+        return itertools.cycle(items or self.collections)
+
+    def card_ids(self, collection, count):
+        pks = list(collection.kanjicard_set.values_list('pk', flat=True))
+        return self.rng.sample(pks, min(count, len(pks)))
+
+    def scores(self, collection):
+        return [(pk, self.rng.choice((1, 3, 4, 4, 5, 5)))
+                for pk in self.card_ids(collection, REVIEW_BATCH)]
+
+
+def next_scheduled_card(context):
+    collections = context.cycle()
+    return lambda: next(collections).next_scheduled_card()
+
+
+def next_scheduled_card_after(context):
+    queue = context.cycle([(collection, collection.next_scheduled_card())
+                           for collection in context.collections])
+
+    def run():
+        collection, after = next(queue)
+        collection.next_scheduled_card(after=after)
+    return run
+
+
+def set_review_score(context):
+    from kanji.models import KanjiCard
+    cards = context.cycle(list(KanjiCard.objects.filter(
+        pk__in=context.card_ids(context.collection, 200))))
+    return lambda: next(cards).set_review_score(4)
+
+
+def set_review_scores(context):
+    batches = context.cycle([(collection, context.scores(collection))
+                             for collection in context.collections])
+
+    def run():
+        collection, scores = next(batches)
+        collection.set_review_scores(scores)
+    return run
+
+
+def heisig_page_first(context):
+    collections = context.cycle()
+    return lambda: next(collections).kanjicard_set.heisig_page(size=50)
+
+
+def heisig_page_last(context):
+    from django.db.models import Max
+    cursors = context.cycle([
+        (collection, (collection.kanjicard_set.aggregate(
+            last=Max('kanji__heisig_index'))['last'] - 50, 0))
+        for collection in context.collections])
+
+    def run():
+        collection, after = next(cursors)
+        collection.kanjicard_set.heisig_page(after, size=50)
+    return run
+
+
+def search_keyword(context):
+    from kanji.search import search_cards
+    owners = context.cycle([c.owner for c in context.collections])
+    return lambda: search_cards(next(owners), 'keyword 12')
+
+
+def search_mnemonic(context):
+    from kanji.search import search_cards
+    owners = context.cycle([c.owner for c in context.collections])
+    return lambda: search_cards(next(owners), 'samurai')
+
+
+def forecast(context):
+    from kanji.cache import touch_collection
+    from kanji.forecast import collection_forecast
+    collections = context.cycle()
+
+    def run():
+        collection = next(collections)
+        # Measure a cache miss
+        touch_collection(collection.pk)
+        collection_forecast(collection, 90)
+    return run
+
+
+def dashboard(context):
+    from kanji.cache import touch_collection
+    from kanji.dashboard import dashboard
+    collections = context.cycle()
+
+    def run():
+        collection = next(collections)
+        touch_collection(collection.pk)
+        dashboard(collection.owner)
+    return run
+
+
+def _get(context, name, **kwargs):
+    from django.core.urlresolvers import reverse
+    url = reverse(name, kwargs=kwargs)
+
+    def run():
+        response = context.client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+    return run
+
+
+def view_collections(context):
+    return _get(context, 'get_collections')
+
+
+def view_collection(context):
+    return _get(context, 'get_collection', slug=context.collection.name)
+
+
+def view_dashboard(context):
+    return _get(context, 'collections_dashboard')
+
+
+def view_review(context):
+    from django.core.urlresolvers import reverse
+    url = reverse('review_collection',
+                  kwargs={'slug': context.collection.name})
+    bodies = context.cycle([json.dumps({'reviews': context.scores(
+        context.collection)}) for _ in range(SAMPLE)])
+
+    def run():
+        response = context.client.post(url, next(bodies),
+                                       content_type='application/json')
+        assert response.status_code == 200, (url, response.status_code)
+    return run
+
+
+# Name, benchmark, and calls per timed run
+BENCHMARKS = (
+    ('next_scheduled_card', next_scheduled_card, 50),
+    ('next_scheduled_card_after', next_scheduled_card_after, 50),
+    ('set_review_score', set_review_score, 50),
+    ('set_review_scores', set_review_scores, 10),
+    ('heisig_page_first', heisig_page_first, 20),
+    ('heisig_page_last', heisig_page_last, 20),
+    ('search_keyword', search_keyword, 20),
+    ('search_mnemonic', search_mnemonic, 20),
+    ('forecast', forecast, 5),
+    ('dashboard', dashboard, 20),
+    ('view_collections', view_collections, 10),
+    ('view_collection', view_collection, 10),
+    ('view_dashboard', view_dashboard, 10),
+    ('view_review', view_review, 10),
+)
+
+
+def run(args):
+    from django.db import connection
+    from django.test.utils import override_settings
+    import django
+    from kanji import reviewlog
+
+    generated = generate(args.users, args.cards, args.seed)
+    context = Context(args.seed)
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for name, benchmark, number in BENCHMARKS:
+            if args.only and not any(fnmatch.fnmatch(name, pattern)
+                                     for pattern in args.only):
+                continue
+            runs = timings(benchmark(context), args.repeat, number)
+            reviewlog.flush()
+            results[name] = {
+                'best_ms': min(runs) * 1000,
+                'median_ms': statistics.median(runs) * 1000,
+                'repeat': args.repeat,
+                'number': number,
+            }
+            print('{:<28} {:>10.3f} ms  (median {:.3f} ms)'.format(
+                name, results[name]['best_ms'], results[name]['median_ms']))
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'users': args.users,
+            'cards': args.cards,
+            'seed': args.seed,
+            'generate_seconds': generated.seconds,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(baseline, results, threshold):
+    """Print each benchmark's change from baseline, and return the names
+    of those which got more than threshold times slower.
+
+    """
+    if baseline['meta'].get('database') != results['meta']['database'] or any(
+            baseline['meta'].get(key) != results['meta'][key]
+            for key in ('users', 'cards', 'seed')):
+        print('Warning: the baseline was run at a different scale or on '
+              'another database')
+    regressions = []
+    print('{:<28} {:>12} {:>12} {:>8}'.format(
+        'benchmark', 'baseline', 'now', 'ratio'))
+    for name, result in sorted(results['benchmarks'].items()):
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            continue
+        ratio = result['best_ms'] / before['best_ms']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  slower'
+        print('{:<28} {:>9.3f} ms {:>9.3f} ms {:>7.2f}x{}'.format(
+            name, before['best_ms'], result['best_ms'], ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--cards', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=2015)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--only', action='append',
+                        help="run only benchmarks matching this pattern")
+    parser.add_argument('--output', help="write the results here as JSON")
+    parser.add_argument('--compare', help="JSON results to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown which counts as a regression")
+    args = parser.parse_args(argv)
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        status = main()
+    sys.exit(status)
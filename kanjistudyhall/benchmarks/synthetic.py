@@ -0,0 +1,291 @@
+"""Synthetic users, each with a Heisig collection whose cards have a
+realistic review history behind them.
+
+Each user adds cards in Heisig order at their own pace, and reviews
+every card that falls due until the day they last studied, which for
+most users is today or a few days ago. Each card has a difficulty which
+sets how often it is forgotten. The reviews go through kanji.sm2, so the
+e-factors, streaks and due dates spread out the way real ones do: easy
+cards drift up from 2.5 and far into the future, and hard ones sink to
+the 1.3 floor and keep coming back.
+
+Rows are written with explicit ids, straight through a cursor: COPY on
+PostgreSQL and executemany() INSERTs elsewhere. No model instances are
+built, so the database's own indexes are what limits the speed; SQLite
+writes about 10,000 cards a second.
+
+    python -m benchmarks.synthetic --users 100 --cards 3000
+
+"""
+import argparse
+import csv
+import datetime
+import io
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from benchmarks import setup, test_database
+
+PASSWORD = 'password'
+USERNAME = 'user{}'
+COLLECTION_NAME = 'heisig'
+WORDS = ('samurai', 'moon', 'river', 'sword', 'temple', 'lantern', 'crane',
+         'mountain', 'rice', 'storm', 'gate', 'fisherman', 'drum', 'lotus')
+# Users simulated together; their cards are reviewed as one set of columns
+USERS_PER_CHUNK = 50
+# Cards added per day, and the chance a user has stopped studying for a
+# while, ending the lapse in days
+MIN_PACE, MAX_PACE = 5, 40
+LAPSE = 0.3
+# Scores given when a card is forgotten and when it is remembered
+FAILED_SCORES, FAILED_WEIGHTS = (0, 1, 2), (0.3, 0.3, 0.4)
+PASSED_SCORES, PASSED_WEIGHTS = (3, 4, 5), (0.15, 0.5, 0.35)
+# Enough for the hardest card reviewed every day for years
+MAX_ROUNDS = 2000
+# The time of day logged reviews are made at
+NOON = datetime.time(12)
+
+Generated = namedtuple('Generated', 'users cards reviews seconds')
+
+
+class Columns(object):
+    """The scheduling state of a set of cards, as NumPy columns."""
+
+    def __init__(self, added):
+        count = len(added)
+        self.total_reviews = np.zeros(count, dtype=np.int64)
+        self.consecutive_correct = np.zeros(count, dtype=np.int64)
+        self.last_reviewed = added.copy()
+        self.last_missed = added.copy()
+        self.next_review = added.copy()
+        self.efactor = np.full(count, 2.5)
+
+
+def simulate(rng, counts, today, history=None):
+    """Review histories for the cards of users with counts cards each.
+    Returns the users' Columns, one after the other, and appends
+    (card, day, score, efactor before, efactor after, interval) arrays
+    to history, if it is given.
+
+    """
+    today = np.datetime64(today, 'D')
+    card_user = np.repeat(np.arange(len(counts)), counts)
+    # How far into their own collection each card is
+    position = np.concatenate([np.arange(count) for count in counts])
+    pace = rng.randint(MIN_PACE, MAX_PACE + 1, len(counts))
+    lapse = rng.geometric(LAPSE, len(counts)) - 1
+    last_day = (today - lapse.astype('timedelta64[D]'))[card_user]
+    counts = np.asarray(counts)
+    age = (counts[card_user] - 1 - position) // pace[card_user]
+    added = last_day - age.astype('timedelta64[D]')
+    difficulty = rng.beta(1.5, 8, len(position))
+
+    columns = Columns(added)
+    # When the card is next looked at. A failed card comes back the next
+    # day, though the schedule says it is due on the day it failed.
+    when = added + np.timedelta64(1, 'D')
+    for _ in range(MAX_ROUNDS):
+        due = np.flatnonzero(when <= last_day)
+        if not len(due):
+            break
+        day = when[due]
+        failed = rng.random_sample(len(due)) < difficulty[due]
+        score = np.where(
+            failed,
+            rng.choice(FAILED_SCORES, len(due), p=FAILED_WEIGHTS),
+            rng.choice(PASSED_SCORES, len(due), p=PASSED_WEIGHTS))
+        before = columns.efactor[due]
+        schedule = sm2_review(columns, due, score, day)
+        for field, values in schedule._asdict().items():
+            getattr(columns, field)[due] = values
+        if history is not None:
+            history.append((due, day, score, before, schedule.efactor,
+                            (schedule.next_review - day).astype(np.int64)))
+        when[due] = np.maximum(schedule.next_review,
+                               day + np.timedelta64(1, 'D'))
+    return columns
+
+
+def sm2_review(columns, due, score, day):
+    from kanji import sm2
+    return sm2.review(columns.efactor[due], columns.consecutive_correct[due],
+                      columns.total_reviews[due], columns.last_missed[due],
+                      score, day)
+
+
+def _dates(values):
+    return values.astype('datetime64[D]').astype(object)
+
+
+def insert(connection, model, fields, rows):
+    """Write rows, tuples of values for fields, into model's table."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(
+        model._meta.get_field(field).column) for field in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH CSV'.format(table, columns),
+                buffer)
+        else:
+            cursor.executemany(
+                'INSERT INTO {} ({}) VALUES ({})'.format(
+                    table, columns, ', '.join(['%s'] * len(fields))),
+                rows)
+
+
+def _next_id(model):
+    from django.db.models import Max
+    return (model.objects.aggregate(id=Max('id'))['id'] or 0) + 1
+
+
+def _reset_sequences(connection, models):
+    from django.core.management.color import no_style
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def generate(users, cards, seed=2015, history=False):
+    """Create users with a collection of cards each, and the Kanji they
+    need. With history, every simulated review is written to the review
+    log too.
+
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    from benchmarks.review_queue import create_kanji
+    from kanji.catalog import invalidate_catalog
+    from kanji.models import (Kanji, KanjiCard, KanjiCardCollection,
+                              ReviewLog)
+
+    User = get_user_model()
+    start = time.perf_counter()
+    rng = np.random.RandomState(seed)
+    today = datetime.date.today()
+    if Kanji.objects.count() < cards:
+        Kanji.objects.all().delete()
+        create_kanji(cards)
+        invalidate_catalog()
+    kanji_ids = list(Kanji.objects.order_by('heisig_index').values_list(
+        'pk', flat=True)[:cards])
+    password = make_password(PASSWORD)
+    now = timezone.now()
+    user_id = _next_id(User)
+    collection_id = _next_id(KanjiCardCollection)
+    card_id = _next_id(KanjiCard)
+    log_id = _next_id(ReviewLog)
+    reviews = 0
+
+    for chunk_start in range(0, users, USERS_PER_CHUNK):
+        chunk = min(USERS_PER_CHUNK, users - chunk_start)
+        user_ids = range(user_id, user_id + chunk)
+        collection_ids = range(collection_id, collection_id + chunk)
+        user_id += chunk
+        collection_id += chunk
+        logs = [] if history else None
+        columns = simulate(rng, [cards] * chunk, today, logs)
+        ids = np.arange(card_id, card_id + chunk * cards)
+        card_id += chunk * cards
+        card_collection = np.repeat(np.asarray(collection_ids), cards)
+        card_user = np.repeat(np.asarray(user_ids), cards)
+        words = rng.randint(0, len(WORDS), (chunk * cards, 6))
+        with transaction.atomic():
+            insert(connection, User,
+                   ('id', 'username', 'password', 'is_superuser',
+                    'is_staff', 'is_active', 'email', 'first_name',
+                    'last_name', 'date_joined'),
+                   [(pk, USERNAME.format(pk), password, False,
+                     False, True, '', '', '', now) for pk in user_ids])
+            # The counters are filled in by recount() at the end
+            insert(connection, KanjiCardCollection,
+                   ('id', 'owner', 'name', 'card_count', 'learned_count',
+                    'due_count', 'due_counted_on', 'efactor_sum'),
+                   [(pk, owner, COLLECTION_NAME, 0, 0, 0, today, 0)
+                    for pk, owner in zip(collection_ids, user_ids)])
+            insert(connection, KanjiCard,
+                   ('id', 'collection', 'kanji', 'mnemonic', 'total_reviews',
+                    'consecutive_correct', 'last_reviewed', 'last_missed',
+                    'next_review', 'efactor'),
+                   zip(ids.tolist(), card_collection.tolist(),
+                       kanji_ids * chunk,
+                       # Mnemonics are unique within a collection
+                       ('{} {}'.format(' '.join(WORDS[word] for word in row),
+                                       number % cards)
+                        for number, row in enumerate(words)),
+                       columns.total_reviews.tolist(),
+                       columns.consecutive_correct.tolist(),
+                       _dates(columns.last_reviewed),
+                       _dates(columns.last_missed),
+                       _dates(columns.next_review),
+                       columns.efactor.tolist()))
+            for due, day, score, before, after, interval in logs or ():
+                reviewed_at = [
+                    timezone.make_aware(datetime.datetime.combine(date, NOON))
+                    for date in _dates(day)]
+                insert(connection, ReviewLog,
+                       ('id', 'card', 'user', 'score', 'reviewed_at',
+                        'efactor_before', 'efactor_after', 'interval'),
+                       zip(range(log_id, log_id + len(due)),
+                           ids[due].tolist(), card_user[due].tolist(),
+                           score.tolist(), reviewed_at, before.tolist(),
+                           after.tolist(), interval.tolist()))
+                log_id += len(due)
+        reviews += int(columns.total_reviews.sum())
+    _reset_sequences(connection,
+                     [User, KanjiCardCollection, KanjiCard, ReviewLog])
+    KanjiCardCollection.recount(
+        range(collection_id - users, collection_id), today)
+    return Generated(users, users * cards, reviews,
+                     time.perf_counter() - start)
+
+
+def describe():
+    """Summary statistics of the generated cards' scheduling state."""
+    from django.db.models import Avg, Max, Min
+    from kanji.models import KanjiCard
+    today = datetime.date.today()
+    cards = KanjiCard.objects.all()
+    return {
+        'cards': cards.count(),
+        'due': cards.filter(next_review__lte=today).count(),
+        'learned': cards.filter(
+            consecutive_correct__gte=KanjiCard.LEARNED_STREAK).count(),
+        'efactor': cards.aggregate(min=Min('efactor'), mean=Avg('efactor'),
+                                   max=Max('efactor')),
+        'streak': cards.aggregate(mean=Avg('consecutive_correct'),
+                                  max=Max('consecutive_correct')),
+        'reviews': cards.aggregate(mean=Avg('total_reviews'),
+                                   max=Max('total_reviews')),
+        'never_reviewed': cards.filter(total_reviews=0).count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--cards', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=2015)
+    parser.add_argument('--history', action='store_true',
+                        help="write every simulated review to the log")
+    args = parser.parse_args(argv)
+    generated = generate(args.users, args.cards, args.seed, args.history)
+    print('{:,} users, {:,} cards and {:,} reviews in {:.1f} s'.format(
+        generated.users, generated.cards, generated.reviews,
+        generated.seconds))
+    for name, value in describe().items():
+        print('{:>16}: {}'.format(name, value))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
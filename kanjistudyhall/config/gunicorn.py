@@ -0,0 +1,30 @@
+"""gunicorn settings: gunicorn -c config/gunicorn.py config.wsgi
+
+Workers write their request metrics to files in PROMETHEUS_MULTIPROC_DIR,
+which must be set before they start and must start out empty. Unless it
+is given, a fresh directory is made for each run. See kanji.metrics.
+
+Workers write out their buffered review log entries as they exit (see
+kanji.reviewlog).
+
+"""
+import os
+import tempfile
+
+if not any(os.environ.get(name) for name in ('PROMETHEUS_MULTIPROC_DIR',
+                                             'prometheus_multiproc_dir')):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(
+        prefix='kanji-metrics-')
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    from kanji import reviewlog
+    try:
+        reviewlog.flush()
+    except Exception:
+        server.log.exception("Couldn't write the review log")
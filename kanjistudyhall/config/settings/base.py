@@ -60,6 +60,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'kanji.middleware.MetricsMiddleware',
+    'kanji.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,6 +70,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'kanji.middleware.ProfilingMiddleware',
 )
 
 ROOT_URLCONF = 'config.urls'
@@ -109,6 +112,46 @@ DATABASES = {
     
 }
 
+# Aliases in DATABASES of read replicas of 'default'. See kanji.routers.
+REPLICA_DATABASES = []
+
+# How long a user's reads stay on the primary after they write
+REPLICA_PIN_SECONDS = 5
+
+DATABASE_ROUTERS = ['kanji.routers.ReplicaRouter']
+
+# Collection and catalog revisions live in the cache, and a bump made by
+# one process has to invalidate what every other process has cached (see
+# kanji.cache), so anything running more than one process needs a cache
+# they share. This one is per process, for tests and runserver; prod.py
+# uses memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Addresses allowed to scrape /metrics
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Request profiles; see kanji.profiling. One in PROFILING_SAMPLE_RATE
+# requests is profiled, or none if it is 0. PROFILING_DIR defaults to a
+# directory in the system's temporary directory.
+PROFILING_SAMPLE_RATE = 0
+PROFILING_DIR = None
+PROFILING_MAX_FILES = 100
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+# Statements slower than this are kept, with their plans, for
+# /admin/slow-queries/; see kanji.slowqueries. None turns this off.
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_BUFFER_SIZE = 200
+
+# Collections with more cards than this are deleted in the background,
+# this many cards per transaction; see kanji.deletion. None deletes every
+# collection in one transaction.
+COLLECTION_DELETE_CHUNK_SIZE = 1000
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
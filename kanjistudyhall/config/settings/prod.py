@@ -1,8 +1,48 @@
+import os
+
 import dj_database_url
 
 DEBUG = False
 
 DATABASES['default'] = dj_database_url.config()
+# Connections come from a per-process pool; see
+# kanji.backends.postgresql_pool. CONN_MAX_AGE stays 0 so they go back to
+# the pool after each request.
+DATABASES['default']['ENGINE'] = 'kanji.backends.postgresql_pool'
+DATABASES['default']['CONN_MAX_AGE'] = 0
+DATABASES['default']['POOL'] = POOL = {
+    'MAX_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+    'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 600)),
+    'CHECK_IDLE': int(os.environ.get('DB_POOL_CHECK_IDLE', 0)),
+    'PGBOUNCER': os.environ.get('DB_PGBOUNCER') == '1',
+}
+
+# Comma-separated URLs of read replicas of the default database
+replica_urls = os.environ.get('REPLICA_DATABASE_URLS', '')
+for number, url in enumerate(filter(None, replica_urls.split(',')), 1):
+    alias = 'replica{}'.format(number)
+    DATABASES[alias] = dj_database_url.parse(url)
+    DATABASES[alias].update(ENGINE=DATABASES['default']['ENGINE'],
+                            CONN_MAX_AGE=0, POOL=POOL,
+                            TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append(alias)
+
+# Comma-separated addresses of the Prometheus servers scraping /metrics
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+PROFILING_SAMPLE_RATE = int(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR')
+
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.1))
+
+# Shared by every worker; see CACHES in base.py. Comma-separated
+# host:port addresses.
+CACHES['default'] = {
+    'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+    'LOCATION': os.environ.get('MEMCACHED_LOCATION',
+                               '127.0.0.1:11211').split(','),
+}
 
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
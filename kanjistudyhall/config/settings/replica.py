@@ -0,0 +1,29 @@
+"""Local settings with two SQLite databases standing in for a primary and
+a read replica, for trying out kanji.routers.ReplicaRouter.
+
+Nothing replicates between them: create both with
+
+    python manage.py migrate
+    python manage.py migrate --database=replica
+
+and copy primary.sqlite3 over replica.sqlite3 to "replicate". Anything
+written since then shows up only once reads are pinned to the primary.
+
+"""
+from .base import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR.joinpath('primary.sqlite3').as_posix(),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR.joinpath('replica.sqlite3').as_posix(),
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+REPLICA_DATABASES = ['replica']
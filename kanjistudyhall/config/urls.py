@@ -17,9 +17,22 @@ from django.conf.urls import include, url
 from django.contrib import admin
 from django.views.generic import TemplateView
 
+from kanji.views import (MetricsView, ProfileDownloadView, ProfileListView,
+                         SlowQueryListView)
+
 urlpatterns = [
     url(r'^$', TemplateView.as_view(template_name="home.html")),
     url(r'^kanji/', include('kanji.urls')),
     url(r'^accounts/', include('allauth.urls')),
+    url(r'^admin/profiles/$',
+        admin.site.admin_view(ProfileListView.as_view()),
+        name='profiles'),
+    url(r'^admin/profiles/(?P<name>[\w.-]+)$',
+        admin.site.admin_view(ProfileDownloadView.as_view()),
+        name='download_profile'),
+    url(r'^admin/slow-queries/$',
+        admin.site.admin_view(SlowQueryListView.as_view()),
+        name='slow_queries'),
     url(r'^admin/', include(admin.site.urls)),
+    url(r'^metrics$', MetricsView.as_view(), name='metrics'),
 ]
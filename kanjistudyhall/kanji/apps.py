@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class KanjiConfig(AppConfig):
+    name = 'kanji'
+
+    def ready(self):
+        from . import checks, signals
@@ -0,0 +1,121 @@
+"""PostgreSQL with a pool of connections shared by the threads of each
+process (see kanji.pool).
+
+Django opens and closes its connection for each request as usual, but
+opening takes a connection from the pool and closing returns it, so
+connection setup is only paid when the pool grows or a connection is
+replaced. Configure the pool with a POOL dict alongside the usual keys of
+the database settings:
+
+    MAX_SIZE      connections per process (10)
+    MAX_LIFETIME  seconds before a connection is replaced (600)
+    CHECK_IDLE    seconds idle before a connection is pinged on
+                  checkout (0: every checkout)
+    TIMEOUT       seconds to wait for a free connection (5)
+    PGBOUNCER     True when connecting through pgbouncer (False)
+
+Leave CONN_MAX_AGE at 0, so that connections go back to the pool at the
+end of each request rather than being held by a thread.
+
+With PGBOUNCER, idle connections aren't pinged, since pgbouncer checks
+its server connections itself, and connections are rolled back rather
+than kept in any session state. Django 1.8 never opens server-side
+(named) cursors, and nothing in this project does either, so queries are
+safe for pgbouncer's transaction pooling.
+
+"""
+import threading
+
+from django.db.backends.postgresql_psycopg2 import base
+from psycopg2 import extensions
+
+from kanji.pool import ConnectionPool, PoolTimeout
+
+Database = base.Database
+
+DEFAULTS = {
+    'MAX_SIZE': 10,
+    'MAX_LIFETIME': 600,
+    'CHECK_IDLE': 0,
+    'TIMEOUT': 5,
+    'PGBOUNCER': False,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pools():
+    """The pools of this process, by database alias and name."""
+    return dict(_pools)
+
+
+def _ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _is_broken(connection):
+    return bool(connection.closed)
+
+
+def _reset(connection):
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    # So the next user reads the server's default isolation level
+    connection.autocommit = False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def pool(self):
+        # Keyed on the database name too: the test runner, and Django's
+        # connection to the 'postgres' database, reuse the alias.
+        key = (self.alias, self.settings_dict['NAME'])
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    pool = _pools[key] = self._create_pool()
+        return pool
+
+    def _create_pool(self):
+        options = dict(DEFAULTS, **self.settings_dict.get('POOL', {}))
+        conn_params = self.get_connection_params()
+        return ConnectionPool(
+            connect=lambda: Database.connect(**conn_params),
+            max_size=options['MAX_SIZE'],
+            max_lifetime=options['MAX_LIFETIME'],
+            check_idle=options['CHECK_IDLE'],
+            timeout=options['TIMEOUT'],
+            ping=None if options['PGBOUNCER'] else _ping,
+            is_broken=_is_broken,
+            reset=_reset,
+        )
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.pool.checkout()
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e))
+        # As in the base class, which connects instead of checking out
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
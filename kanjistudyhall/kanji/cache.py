@@ -0,0 +1,74 @@
+"""Cache helpers shared by the kanji app.
+
+Every collection has a revision number which is bumped whenever the
+collection or one of its cards changes. Cached data derived from a
+collection puts the revision in its key, so after a change the stale
+entries are never read again and simply expire. The Kanji catalog has a
+revision of its own.
+
+"""
+import time
+
+from django.core.cache import cache
+
+REVISION_KEY = 'kanji:collection:{}:revision'
+CATALOG_REVISION_KEY = 'kanji:catalog:revision'
+
+
+def _fresh_revision():
+    # Start from the clock, so a revision that was evicted from the
+    # cache is never handed out again.
+    return int(time.time() * 1000)
+
+
+def _revision(key):
+    revision = cache.get(key)
+    if revision is None:
+        revision = _fresh_revision()
+        if not cache.add(key, revision, None):
+            revision = cache.get(key, revision)
+    return revision
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        revision = _fresh_revision()
+        cache.set(key, revision, None)
+        return revision
+
+
+def collection_revision(collection_id):
+    """Return the current revision of a collection."""
+    return _revision(REVISION_KEY.format(collection_id))
+
+
+def collection_revisions(collection_ids):
+    """Return the current revisions of many collections, as a dict by
+    collection id, with one cache read when they are all cached.
+
+    """
+    keys = {REVISION_KEY.format(pk): pk for pk in collection_ids}
+    revisions = {keys[key]: revision
+                 for key, revision in cache.get_many(list(keys)).items()}
+    for key, pk in keys.items():
+        if pk not in revisions:
+            revisions[pk] = _revision(key)
+    return revisions
+
+
+def touch_collection(collection_id):
+    """Bump the revision of a collection, invalidating everything cached
+    for it. Returns the new revision.
+
+    """
+    return _bump(REVISION_KEY.format(collection_id))
+
+
+def catalog_revision():
+    return _revision(CATALOG_REVISION_KEY)
+
+
+def touch_catalog():
+    return _bump(CATALOG_REVISION_KEY)
@@ -0,0 +1,143 @@
+"""A process-wide copy of the Kanji table.
+
+Keywords and Heisig indexes are never meant to change, and there are
+only a few thousand kanji, so every process loads them all once and
+looks them up in memory from then on. When a kanji does change, the
+catalog revision in the cache is bumped (see kanji.signals), and bumped
+again after the request if the change was made in a transaction, and
+every process reloads its copy within CHECK_INTERVAL seconds. That relies on
+the cache being shared between processes; until the bump is seen, kanji
+the catalog doesn't have are read from the database when asked for.
+
+"""
+import bisect
+import threading
+import time
+
+from . import cache
+from .models import Kanji
+
+# How long a process trusts its copy before checking the revision again
+CHECK_INTERVAL = 1.0
+
+_catalog = None
+_checked = 0.0
+_lock = threading.Lock()
+# Set by invalidate_catalog_later()
+_pending = threading.local()
+
+
+class KanjiCatalog(object):
+
+    def __init__(self, kanji, revision):
+        kanji = list(kanji)
+        self.revision = revision
+        self.by_id = {}
+        self.by_character = {}
+        self.by_keyword = {}
+        self.by_heisig_index = {}
+        for k in kanji:
+            self._index(k)
+        self._keywords = sorted((k.keyword.lower(), k.heisig_index, k.pk)
+                                for k in kanji)
+
+    def _index(self, k):
+        self.by_id[k.pk] = k
+        self.by_character[k.character] = k
+        self.by_keyword[k.keyword] = k
+        self.by_heisig_index[k.heisig_index] = k
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def add_missing(self, kanji_ids):
+        """Load any of kanji_ids the catalog doesn't have: kanji which
+        another process added before this one saw the revision bump, or
+        which were bulk created without invalidating the catalog.
+
+        """
+        missing = set(kanji_ids).difference(self.by_id)
+        if not missing:
+            return
+        with _lock:
+            for k in Kanji.objects.filter(pk__in=missing):
+                self._index(k)
+                bisect.insort(self._keywords,
+                              (k.keyword.lower(), k.heisig_index, k.pk))
+
+    def get(self, kanji_id):
+        """The kanji with the given id, from the database if the catalog
+        doesn't have it yet.
+
+        """
+        if kanji_id not in self.by_id:
+            self.add_missing([kanji_id])
+        return self.by_id[kanji_id]
+
+    def keyword_prefix(self, prefix, limit=None):
+        """Kanji whose keyword starts with prefix, ignoring case, in
+        keyword order. Uses a binary search over the sorted keywords.
+
+        """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keywords, (prefix,))
+        matches = []
+        for keyword, heisig_index, pk in self._keywords[start:]:
+            if not keyword.startswith(prefix) or len(matches) == limit:
+                break
+            matches.append(self.by_id[pk])
+        return matches
+
+    def attach(self, cards):
+        """Set the kanji of each card from the catalog, so that card.kanji
+        doesn't cost a query. Returns the cards.
+
+        """
+        self.add_missing(card.kanji_id for card in cards)
+        for card in cards:
+            card.kanji = self.by_id[card.kanji_id]
+        return cards
+
+
+def get_catalog():
+    global _catalog, _checked
+    catalog = _catalog
+    now = time.monotonic()
+    if catalog is not None and now - _checked < CHECK_INTERVAL:
+        return catalog
+    revision = cache.catalog_revision()
+    if catalog is None or catalog.revision != revision:
+        with _lock:
+            catalog = KanjiCatalog(Kanji.objects.all(), revision)
+            _catalog = catalog
+    _checked = now
+    return catalog
+
+
+def invalidate_catalog():
+    """Make every process reload the catalog. Call this after changing
+    Kanji rows without saving them one by one, e.g. after bulk_create,
+    once the change is committed.
+
+    """
+    global _catalog
+    _pending.invalidate = False
+    cache.touch_catalog()
+    _catalog = None
+
+
+def invalidate_catalog_later():
+    """invalidate_catalog() now, and again by invalidate_pending() at the
+    end of the request, for a change inside a transaction: a process which
+    reloads the catalog before the commit would otherwise keep the old
+    rows under the new revision. Django 1.8 has no on_commit hook.
+
+    """
+    invalidate_catalog()
+    _pending.invalidate = True
+
+
+def invalidate_pending(**kwargs):
+    """request_finished receiver; see invalidate_catalog_later()."""
+    if getattr(_pending, 'invalidate', False):
+        invalidate_catalog()
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Revisions bumped in the cache only invalidate other processes'
+    cached queues, dashboards and catalogs if they share the cache.
+
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in PER_PROCESS_CACHES:
+        return []
+    return [Warning(
+        "The default cache isn't shared between processes, so changes "
+        "made in one won't invalidate what the others have cached.",
+        hint="Use memcached or another shared cache for CACHES['default'].",
+        id='kanji.W001',
+    )]
@@ -0,0 +1,96 @@
+"""Review statistics for all of a user's collections at once.
+
+The statistics come from one aggregate query over the user's collections
+and their cards, and are cached per user. The cache key is built from the
+revisions of the user's collections (see kanji.cache), read before the
+query, so reviewing, adding or removing a card in any of them is enough
+to invalidate it. The list of the user's collections is cached as well,
+and dropped whenever a collection is created, renamed or deleted.
+
+"""
+import datetime
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, IntegerField, Min, Sum, When
+
+from .cache import collection_revisions
+from .models import KanjiCard, KanjiCardCollection
+
+COLLECTIONS_KEY = 'kanji:dashboard:{user}:collections'
+CACHE_KEY = 'kanji:dashboard:{user}:{date}:{revisions}'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _count_if(**lookups):
+    return Sum(Case(When(then=1, **lookups), default=0,
+                    output_field=IntegerField()))
+
+
+def collection_stats(user, date=None):
+    """The user's collections ordered by name, as dicts of their id, name
+    and review statistics for date (today by default), from one query.
+
+    """
+    if date is None:
+        date = datetime.date.today()
+    rows = KanjiCardCollection.objects.filter(owner=user).order_by(
+        'name').values('id', 'name').annotate(
+        card_count=Count('kanjicard'),
+        due_count=_count_if(kanjicard__next_review__lte=date),
+        reviewed_today=_count_if(kanjicard__last_reviewed=date),
+        learned_count=_count_if(
+            kanjicard__consecutive_correct__gte=KanjiCard.LEARNED_STREAK),
+        next_review=Min('kanjicard__next_review'),
+        mean_efactor=Avg('kanjicard__efactor'),
+    )
+    stats = []
+    for row in rows:
+        # Sums over a collection without cards are NULL
+        for name in ('due_count', 'reviewed_today', 'learned_count'):
+            row[name] = row[name] or 0
+        stats.append(row)
+    return stats
+
+
+def dashboard(user):
+    """collection_stats for today, from the cache when nothing in the
+    user's collections has changed since it was computed.
+
+    """
+    today = datetime.date.today()
+    collections_key = COLLECTIONS_KEY.format(user=user.pk)
+    collection_ids = cache.get(collections_key)
+    if collection_ids is None:
+        collection_ids = sorted(KanjiCardCollection.objects.filter(
+            owner=user).values_list('pk', flat=True))
+        cache.set(collections_key, collection_ids, CACHE_TIMEOUT)
+    # The key is built from the revisions as they were before the query,
+    # so that a change made meanwhile leaves the result under a stale key
+    key = _key(user, today, collection_ids)
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+    stats = collection_stats(user, today)
+    if sorted(row['id'] for row in stats) == collection_ids:
+        cache.set(key, stats, CACHE_TIMEOUT)
+    else:
+        # A collection was created or deleted since the list was cached
+        forget_collections(user.pk)
+    return stats
+
+
+def _key(user, date, collection_ids):
+    revisions = collection_revisions(collection_ids)
+    signature = ','.join('{}:{}'.format(pk, revisions[pk])
+                         for pk in collection_ids)
+    return CACHE_KEY.format(
+        user=user.pk,
+        date=date.isoformat(),
+        revisions=hashlib.md5(signature.encode('ascii')).hexdigest(),
+    )
+
+
+def forget_collections(user_id):
+    """Drop the cached list of a user's collections."""
+    cache.delete(COLLECTIONS_KEY.format(user=user_id))
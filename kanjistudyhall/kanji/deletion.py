@@ -0,0 +1,82 @@
+"""Deleting collections without Django's deletion collector.
+
+delete() on a collection loads every card, and every review log row
+pointing at one, into memory before deleting anything, and holds one
+transaction throughout. delete_collection() uses
+KanjiCardCollection.purge() instead, which runs a few set-based
+statements.
+
+Collections with more than COLLECTION_DELETE_CHUNK_SIZE cards are deleted
+in a background thread, that many cards per transaction, so other users'
+writes never wait long behind it. The collection itself goes last, and is
+listed with its remaining cards until then.
+
+Collections are marked as deleting before anything is deleted. If the
+process exits first (a worker being recycled ends its threads), the
+collection is left marked, with the cards not yet deleted; the
+purge_collections management command, run periodically, finishes every
+marked collection, and deleting the collection again resumes it too.
+
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from . import reviewlog
+from .dashboard import forget_collections
+from .models import KanjiCardCollection
+
+logger = logging.getLogger(__name__)
+
+
+def delete_collection(collection):
+    """Deletes a collection and its cards. Big collections are deleted
+    in the background; the thread is returned for them, and None once
+    the collection is gone otherwise.
+
+    """
+    chunk_size = settings.COLLECTION_DELETE_CHUNK_SIZE
+    KanjiCardCollection.objects.filter(pk=collection.pk).update(deleting=True)
+    collection.deleting = True
+    if not chunk_size or collection.card_count <= chunk_size:
+        _purge(collection)
+        return None
+    thread = threading.Thread(
+        target=_purge_in_background, args=(collection, chunk_size),
+        name='delete-collection-{}'.format(collection.pk))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def resume_deletions():
+    """Finishes deleting every collection marked as deleting, in the
+    calling thread. Returns the number of collections deleted.
+
+    """
+    collections = list(KanjiCardCollection.objects.filter(
+        deleting=True).order_by('pk'))
+    for collection in collections:
+        _purge(collection, settings.COLLECTION_DELETE_CHUNK_SIZE)
+    return len(collections)
+
+
+def _purge(collection, chunk_size=None):
+    # This process's buffered reviews of the cards are written while the
+    # collection is still there to say whose they are; see kanji.reviewlog
+    reviewlog.flush()
+    collection.purge(chunk_size)
+    forget_collections(collection.owner_id)
+
+
+def _purge_in_background(collection, chunk_size):
+    try:
+        _purge(collection, chunk_size)
+    except Exception:
+        logger.exception("Couldn't delete collection %s", collection.pk)
+    finally:
+        # The thread's own connections
+        for connection in connections.all():
+            connection.close()
@@ -0,0 +1,58 @@
+"""Streams a collection's cards out as CSV or JSON, one chunk of rows at
+a time.
+
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .catalog import get_catalog
+
+COLUMNS = ('heisig_index', 'character', 'keyword', 'mnemonic',
+           'total_reviews', 'consecutive_correct', 'last_reviewed',
+           'last_missed', 'next_review', 'efactor')
+CHUNK_SIZE = 1000
+
+
+class Echo(object):
+    """A file-like object which hands back whatever is written to it, so
+    csv.writer can format rows for a generator.
+
+    """
+    def write(self, value):
+        return value
+
+
+def card_rows(collection):
+    catalog = get_catalog()
+    for card in collection.kanjicard_set.chunked(CHUNK_SIZE):
+        kanji = catalog.get(card.kanji_id)
+        yield (kanji.heisig_index, kanji.character, kanji.keyword,
+               card.mnemonic, card.total_reviews, card.consecutive_correct,
+               card.last_reviewed, card.last_missed, card.next_review,
+               card.efactor)
+
+
+def export_csv(collection):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in card_rows(collection):
+        yield writer.writerow(row)
+
+
+def export_json(collection):
+    yield '['
+    separator = '\n'
+    for row in card_rows(collection):
+        yield separator + json.dumps(dict(zip(COLUMNS, row)),
+                                     cls=DjangoJSONEncoder,
+                                     ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+FORMATS = {
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'json': (export_json, 'application/json; charset=utf-8'),
+}
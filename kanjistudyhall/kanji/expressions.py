@@ -0,0 +1,51 @@
+"""Query expressions used to run the SM2 schedule inside the database."""
+from django.db.models import DateField, Func
+
+from .sm2 import MICROSECONDS_PER_DAY
+
+
+class AtLeast(Func):
+    """The value of expression, or minimum if expression is smaller."""
+
+    def __init__(self, expression, minimum, **extra):
+        super(AtLeast, self).__init__(expression, minimum, **extra)
+
+    def as_sql(self, compiler, connection):
+        expression, minimum = self.get_source_expressions()
+        expression_sql, expression_params = compiler.compile(expression)
+        minimum_sql, minimum_params = compiler.compile(minimum)
+        sql = 'CASE WHEN ({e}) < {m} THEN {m} ELSE ({e}) END'.format(
+            e=expression_sql, m=minimum_sql)
+        params = expression_params + minimum_params * 2 + expression_params
+        return sql, params
+
+
+class AddDays(Func):
+    """date plus an interval in days, truncated to whole days the same way
+    as kanji.sm2.interval_days.
+
+    """
+
+    def __init__(self, date, days, **extra):
+        extra.setdefault('output_field', DateField())
+        super(AddDays, self).__init__(date, days, **extra)
+
+    def _compile(self, compiler):
+        date, days = self.get_source_expressions()
+        date_sql, date_params = compiler.compile(date)
+        days_sql, days_params = compiler.compile(days)
+        return date_sql, days_sql, date_params + days_params
+
+    def as_sql(self, compiler, connection):
+        date_sql, days_sql, params = self._compile(compiler)
+        sql = ('({date} + CAST(FLOOR(ROUND(({days}) * {usec}.0) / {usec}.0) '
+               'AS integer))')
+        return sql.format(date=date_sql, days=days_sql,
+                          usec=MICROSECONDS_PER_DAY), params
+
+    def as_sqlite(self, compiler, connection):
+        date_sql, days_sql, params = self._compile(compiler)
+        sql = ("date({date}, '+' || (CAST(ROUND(({days}) * {usec}.0) "
+               "AS INTEGER) / {usec}) || ' days')")
+        return sql.format(date=date_sql, days=days_sql,
+                          usec=MICROSECONDS_PER_DAY), params
@@ -0,0 +1,110 @@
+"""Projects how many reviews a collection will have each day, by running
+the SM2 schedule forward over the collection's scheduling columns.
+
+Every card that comes due is given a score drawn from the assumed
+scores. A card scored below 4 stays due, so, like a real study session,
+it is drilled again the same day; the projection assumes the second
+attempt scores 4.
+
+"""
+import datetime
+
+import numpy as np
+from django.core.cache import cache
+
+from . import sm2
+from .cache import collection_revision
+
+DEFAULT_SCORES = (4,)
+CACHE_KEY = 'kanji:forecast:{collection}:{revision}:{date}:{days}:{scores}'
+CACHE_TIMEOUT = 60 * 60 * 24
+RELEARN_SCORE = 4
+
+
+def forecast(efactor, consecutive_correct, total_reviews, last_missed,
+             next_review, days, today, scores=DEFAULT_SCORES, seed=0):
+    """Project the daily workload for days days starting with today.
+    scores is a sequence of review scores which are drawn uniformly, so
+    (5, 4, 4, 1) means half the cards score 4, a quarter 5 and a quarter
+    are missed. Overdue cards are all due today.
+    Returns two arrays of length days: the number of cards due each day,
+    and the number of reviews including same-day repeats.
+
+    """
+    rng = np.random.RandomState(seed)
+    scores = np.asarray(scores, dtype=np.int64)
+    efactor = np.array(efactor, dtype=np.float64)
+    consecutive_correct = np.array(consecutive_correct, dtype=np.int64)
+    total_reviews = np.array(total_reviews, dtype=np.int64)
+    last_missed = np.array(last_missed, dtype='datetime64[D]')
+    today = np.datetime64(today, 'D')
+    end = today + np.timedelta64(days, 'D')
+    next_review = np.maximum(np.array(next_review, dtype='datetime64[D]'),
+                             today)
+
+    due_counts = np.zeros(days, dtype=np.int64)
+    review_counts = np.zeros(days, dtype=np.int64)
+    # Rather than stepping through the calendar, review every card that
+    # is due before the end of the forecast on its own review date, and
+    # repeat until every card has been pushed past the end.
+    due = np.flatnonzero(next_review < end)
+    while len(due):
+        day = next_review[due]
+        day_scores = scores[rng.randint(len(scores), size=len(due))]
+        schedule = sm2.review(efactor[due], consecutive_correct[due],
+                              total_reviews[due], last_missed[due],
+                              day_scores, day)
+        relearn = np.flatnonzero(day_scores < 4)
+        if len(relearn):
+            retry = sm2.review(schedule.efactor[relearn],
+                               schedule.consecutive_correct[relearn],
+                               schedule.total_reviews[relearn],
+                               schedule.last_missed[relearn],
+                               RELEARN_SCORE, day[relearn])
+            for column, retried in zip(schedule, retry):
+                column[relearn] = retried
+        offsets = (day - today).astype(np.int64)
+        reviewed = np.bincount(offsets, minlength=days)
+        due_counts += reviewed
+        review_counts += reviewed + np.bincount(offsets[relearn],
+                                                minlength=days)
+        efactor[due] = schedule.efactor
+        consecutive_correct[due] = schedule.consecutive_correct
+        total_reviews[due] = schedule.total_reviews
+        last_missed[due] = schedule.last_missed
+        next_review[due] = schedule.next_review
+        due = due[schedule.next_review < end]
+    return due_counts, review_counts
+
+
+def collection_forecast(collection, days, scores=DEFAULT_SCORES):
+    """Forecast for a collection, as a list of dicts with the date, cards
+    due and total reviews for each day. Results are cached until the
+    collection changes.
+
+    """
+    today = datetime.date.today()
+    key = CACHE_KEY.format(
+        collection=collection.pk,
+        revision=collection_revision(collection.pk),
+        date=today.isoformat(),
+        days=days,
+        scores='-'.join(str(score) for score in scores),
+    )
+    result = cache.get(key)
+    if result is None:
+        columns = list(zip(*collection.kanjicard_set.values_list(
+            'efactor', 'consecutive_correct', 'total_reviews',
+            'last_missed', 'next_review'))) or [()] * 5
+        due, reviews = forecast(*columns, days=days, today=today,
+                                scores=scores)
+        result = [
+            {
+                'date': today + datetime.timedelta(days=offset),
+                'due': int(due[offset]),
+                'reviews': int(reviews[offset]),
+            }
+            for offset in range(days)
+        ]
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
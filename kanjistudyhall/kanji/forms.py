@@ -1,6 +1,10 @@
+import codecs
+
 from django import forms
 
+from .forecast import DEFAULT_SCORES
 from .models import KanjiCardCollection
+from .search import MAX_RESULTS
 
 class KanjiCardCollectionForm(forms.ModelForm):
     name = forms.CharField(max_length=50, min_length=1)
@@ -8,3 +12,66 @@ class KanjiCardCollectionForm(forms.ModelForm):
     class Meta:
         model = KanjiCardCollection
         fields = ['name']
+
+
+class ForecastForm(forms.Form):
+    days = forms.IntegerField(min_value=1, max_value=365, required=False)
+    # Comma-separated review scores to assume, drawn uniformly
+    scores = forms.CharField(max_length=100, required=False)
+
+    def clean_days(self):
+        return self.cleaned_data['days'] or 30
+
+    def clean_scores(self):
+        scores = self.cleaned_data['scores']
+        if not scores:
+            return DEFAULT_SCORES
+        try:
+            scores = tuple(int(score) for score in scores.split(','))
+        except ValueError:
+            raise forms.ValidationError("Scores must be whole numbers")
+        if any(score not in range(0, 6) for score in scores):
+            raise forms.ValidationError("Scores must be between 0 and 5")
+        return scores
+
+
+class HeisigRangeForm(forms.Form):
+    first = forms.IntegerField(min_value=1)
+    last = forms.IntegerField(min_value=1)
+
+    def clean(self):
+        cleaned_data = super(HeisigRangeForm, self).clean()
+        first = cleaned_data.get('first')
+        last = cleaned_data.get('last')
+        if first and last and first > last:
+            raise forms.ValidationError("The range must not be reversed")
+        return cleaned_data
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField()
+    # The day the Anki collection was created; Anki counts due days from it
+    anki_created = forms.DateField(required=False)
+
+    def clean_file(self):
+        # The whole file is checked first, since cards are saved a batch
+        # at a time as it is imported
+        upload = self.cleaned_data['file']
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        try:
+            for chunk in upload.chunks():
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file must be UTF-8 text")
+        upload.seek(0)
+        return upload
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(max_length=100)
+    limit = forms.IntegerField(min_value=1, max_value=MAX_RESULTS,
+                               required=False)
+
+    def clean_limit(self):
+        return self.cleaned_data['limit'] or 20
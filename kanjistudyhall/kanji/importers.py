@@ -0,0 +1,276 @@
+"""Imports decks from other SRS tools, or from our own CSV export, into a
+KanjiCardCollection.
+
+The file is read a line at a time and cards are inserted in fixed-size
+batches, so memory use doesn't depend on the size of the file. Rows that
+can't be imported are reported, and the rest of the file is still
+imported.
+
+"""
+import csv
+import datetime
+import itertools
+import math
+
+from django.db import DataError, IntegrityError, transaction
+from django.utils.dateparse import parse_date
+
+from .cache import touch_collection
+from .catalog import get_catalog
+from .models import KanjiCard
+from .sm2 import MIN_EFACTOR
+
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+# The largest value the review count columns hold
+MAX_COUNT = 2 ** 31 - 1
+
+# Column names used by our own export, and their equivalents in Anki
+# and other tools' exports.
+ALIASES = {
+    'character': ('character', 'kanji', 'front'),
+    'mnemonic': ('mnemonic', 'story', 'back'),
+    'efactor': ('efactor',),
+    'ease': ('ease', 'factor'),
+    'interval': ('interval', 'ivl'),
+    'consecutive_correct': ('consecutive_correct',),
+    'total_reviews': ('total_reviews', 'reviews', 'reps'),
+    'last_reviewed': ('last_reviewed',),
+    'last_missed': ('last_missed',),
+    'next_review': ('next_review',),
+    'due': ('due',),
+}
+# Anki's due column holds a Unix time for cards being learned, and a day
+# number for cards in review; no day number is this big
+ANKI_TIMESTAMP_MIN = 10 ** 9
+
+
+class ImportResult(object):
+
+    def __init__(self):
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+class RowError(ValueError):
+    pass
+
+
+def _columns(header):
+    """Map our field names to their positions in the header."""
+    names = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    return columns
+
+
+def _efactor(value, is_ease):
+    efactor = float(value)
+    if is_ease:
+        # Anki stores ease as a permille (2500) or percentage (250)
+        if efactor >= 1000:
+            efactor /= 1000
+        elif efactor > 10:
+            efactor /= 100
+    return max(efactor, MIN_EFACTOR)
+
+
+def _streak(interval, efactor):
+    """The run of correct answers the SM2 schedule would need to reach
+    an interval, for decks that only record the interval.
+
+    """
+    if interval < 1:
+        return 0
+    if interval < 6:
+        return 1
+    return max(2, int(interval // efactor) + 1)
+
+
+def _date(value, field):
+    date = parse_date(value)
+    if date is None:
+        raise RowError("{} is not a YYYY-MM-DD date".format(field))
+    return date
+
+
+def _anki_due(value, interval, day_zero):
+    """The date in Anki's due column, or None if it can't be worked out.
+    Review cards are due a number of days after day_zero, the day the
+    Anki collection was created; cards being learned at a Unix time; new
+    cards have their position in the queue instead. Other tools put a
+    date in the column.
+
+    """
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is not None:
+        return date
+    try:
+        due = int(value)
+    except ValueError:
+        raise RowError("due must be a YYYY-MM-DD date or a whole number")
+    try:
+        if due >= ANKI_TIMESTAMP_MIN:
+            return datetime.date.fromtimestamp(due)
+        if interval < 1 or day_zero is None:
+            return None
+        return day_zero + datetime.timedelta(days=due)
+    except (OverflowError, ValueError, OSError):
+        raise RowError("the due date is out of range")
+
+
+def _card(values, columns, today, day_zero=None):
+    def get(field, default=None):
+        if field not in columns:
+            return default
+        value = values[columns[field]].strip()
+        return value if value else default
+
+    try:
+        if 'efactor' in columns:
+            efactor = _efactor(get('efactor', 2.5), is_ease=False)
+        else:
+            efactor = _efactor(get('ease', 2.5), is_ease=True)
+        interval = float(get('interval', 0))
+        if not (math.isfinite(efactor) and math.isfinite(interval)):
+            raise ValueError
+        streak = get('consecutive_correct')
+        streak = int(streak) if streak else _streak(interval, efactor)
+        total_reviews = int(get('total_reviews', streak))
+    except (ValueError, OverflowError):
+        raise RowError("ease, interval and review counts must be numbers")
+    if streak < 0 or total_reviews < 0 or interval < 0:
+        raise RowError("review counts and intervals can't be negative")
+    if streak > MAX_COUNT or total_reviews > MAX_COUNT:
+        raise RowError("review counts can't be more than {}".format(
+            MAX_COUNT))
+
+    last_reviewed = get('last_reviewed')
+    last_reviewed = _date(last_reviewed, 'last_reviewed') if last_reviewed \
+        else today
+    next_review = get('next_review')
+    if next_review:
+        next_review = _date(next_review, 'next_review')
+    elif get('due'):
+        next_review = _anki_due(get('due'), interval, day_zero)
+    if not next_review:
+        try:
+            next_review = last_reviewed + datetime.timedelta(days=interval)
+        except (OverflowError, ValueError):
+            raise RowError("the interval is too long")
+    last_missed = get('last_missed')
+    last_missed = _date(last_missed, 'last_missed') if last_missed \
+        else last_reviewed
+    return KanjiCard(mnemonic=get('mnemonic', ''),
+                     efactor=efactor,
+                     consecutive_correct=streak,
+                     total_reviews=total_reviews,
+                     last_reviewed=last_reviewed,
+                     last_missed=last_missed,
+                     next_review=next_review)
+
+
+def import_cards(collection, lines, batch_size=BATCH_SIZE, day_zero=None):
+    """Import cards into collection from lines of CSV (or tab-separated)
+    text with a header row. Kanji are matched on their character, using
+    the kanji catalog. day_zero is the day an Anki deck's collection was
+    created, which its due days are counted from; without it, cards are
+    scheduled from their intervals instead.
+    Returns an ImportResult with the number of cards imported and the
+    rows which were skipped, with the reason.
+
+    """
+    result = ImportResult()
+    lines = iter(lines)
+    try:
+        first = next(lines)
+    except StopIteration:
+        return result
+    delimiter = '\t' if '\t' in first else ','
+    reader = csv.reader(itertools.chain([first], lines),
+                        delimiter=delimiter)
+    columns = _columns(next(reader))
+    if 'character' not in columns or 'mnemonic' not in columns:
+        result.add_error(1, "The header must name the kanji and mnemonic "
+                            "columns")
+        return result
+
+    catalog = get_catalog()
+    cards = list(collection.kanjicard_set.values_list('kanji_id',
+                                                      'mnemonic'))
+    used_kanji = set(kanji_id for kanji_id, mnemonic in cards)
+    used_mnemonics = set(mnemonic for kanji_id, mnemonic in cards)
+    today = datetime.date.today()
+    batch = []
+    for values in reader:
+        line = reader.line_num
+        if not any(value.strip() for value in values):
+            continue
+        try:
+            if len(values) <= max(columns.values()):
+                raise RowError("missing columns")
+            kanji = catalog.by_character.get(
+                values[columns['character']].strip())
+            if kanji is None:
+                raise RowError("unknown kanji")
+            kanji_id = kanji.pk
+            if kanji_id in used_kanji:
+                raise RowError("the collection already has this kanji")
+            card = _card(values, columns, today, day_zero)
+            if not card.mnemonic:
+                raise RowError("the mnemonic is empty")
+            if card.mnemonic in used_mnemonics:
+                raise RowError("the collection already has this mnemonic")
+        except RowError as e:
+            result.add_error(line, str(e))
+            continue
+        card.collection = collection
+        card.kanji_id = kanji_id
+        used_kanji.add(kanji_id)
+        used_mnemonics.add(card.mnemonic)
+        batch.append((line, card))
+        if len(batch) >= batch_size:
+            _insert(batch, result)
+            batch = []
+    if batch:
+        _insert(batch, result)
+    if result.imported:
+        collection.recount([collection.pk])
+        touch_collection(collection.pk)
+    return result
+
+
+def _insert(batch, result):
+    try:
+        with transaction.atomic():
+            KanjiCard.objects.bulk_create([card for line, card in batch])
+    except (IntegrityError, DataError):
+        # Someone else added a clashing card meanwhile, or a value is out
+        # of the column's range; find out which card by inserting the
+        # batch a card at a time.
+        for line, card in batch:
+            try:
+                with transaction.atomic():
+                    card.save(force_insert=True)
+            except IntegrityError:
+                result.add_error(line, "the collection already has this "
+                                       "kanji or mnemonic")
+            except DataError:
+                result.add_error(line, "a value is out of range")
+            else:
+                result.imported += 1
+    else:
+        result.imported += len(batch)
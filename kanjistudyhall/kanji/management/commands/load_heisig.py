@@ -0,0 +1,102 @@
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from kanji.catalog import invalidate_catalog
+from kanji.models import Kanji
+
+FIELDS = ('character', 'keyword', 'heisig_index')
+
+
+class Command(BaseCommand):
+    help = ("Load the Heisig catalog (character, keyword, heisig_index) "
+            "from a CSV file with a header row, or a JSON list of objects. "
+            "Kanji are matched on character, so loading the same file "
+            "twice changes nothing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        if file_format not in ('csv', 'json'):
+            raise CommandError("Can't tell the format of {}; "
+                               "use --format".format(path))
+        with open(path, encoding='utf-8', newline='') as f:
+            if file_format == 'csv':
+                records = list(csv.DictReader(f))
+            else:
+                records = json.load(f)
+        rows = self._clean(records)
+
+        existing = {k.character: k for k in Kanji.objects.all()}
+        new = []
+        changed = []
+        for character, keyword, heisig_index in rows:
+            kanji = existing.get(character)
+            if kanji is None:
+                new.append(Kanji(character=character,
+                                 keyword=keyword,
+                                 heisig_index=heisig_index))
+            elif (kanji.keyword, kanji.heisig_index) != (keyword,
+                                                         heisig_index):
+                kanji.keyword = keyword
+                kanji.heisig_index = heisig_index
+                changed.append(kanji)
+        try:
+            with transaction.atomic():
+                for kanji in changed:
+                    kanji.save(update_fields=['keyword', 'heisig_index'])
+                Kanji.objects.bulk_create(new,
+                                          batch_size=options['batch_size'])
+        except IntegrityError as e:
+            raise CommandError(
+                "The catalog clashes with existing kanji: {}".format(e))
+        if new or changed:
+            # bulk_create sends no signals, and the saves' signals came
+            # before the commit
+            invalidate_catalog()
+        self.stdout.write("Created {}, updated {}, unchanged {} kanji.".format(
+            len(new), len(changed), len(rows) - len(new) - len(changed)))
+
+    def _clean(self, records):
+        """Validate the records and return (character, keyword, index)
+        tuples. Every field must be unique across the file.
+
+        """
+        rows = []
+        seen = [set() for _ in FIELDS]
+        for number, record in enumerate(records, 1):
+            try:
+                character, keyword, heisig_index = (
+                    str(record[field]).strip() for field in FIELDS)
+                heisig_index = int(heisig_index)
+            except (KeyError, TypeError, ValueError):
+                raise CommandError(
+                    "Record {}: expected {}".format(number, ', '.join(FIELDS)))
+            if len(character) != 1:
+                raise CommandError(
+                    "Record {}: {!r} is not a single character".format(
+                        number, character))
+            if not keyword or len(keyword) > 50:
+                raise CommandError(
+                    "Record {}: keywords must be 1-50 characters".format(
+                        number))
+            if heisig_index < 1:
+                raise CommandError(
+                    "Record {}: heisig_index must be positive".format(number))
+            row = (character, keyword, heisig_index)
+            for field, value, values in zip(FIELDS, row, seen):
+                if value in values:
+                    raise CommandError("Record {}: duplicate {} {!r}".format(
+                        number, field, value))
+                values.add(value)
+            rows.append(row)
+        return rows
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from kanji.deletion import resume_deletions
+
+
+class Command(BaseCommand):
+    help = ("Finish deleting collections whose deletion was started but "
+            "not finished, e.g. because the worker deleting them exited. "
+            "Meant to be run periodically.")
+
+    def handle(self, *args, **options):
+        deleted = resume_deletions()
+        self.stdout.write("Deleted {} collections.".format(deleted))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from kanji.models import KanjiCardCollection
+
+
+class Command(BaseCommand):
+    help = ("Recompute the card, learned, due and e-factor counters of "
+            "collections from their cards, e.g. after cards were changed "
+            "with bulk queries. Recounts every collection unless ids are "
+            "given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = options['ids']
+        if not ids:
+            ids = list(KanjiCardCollection.objects.order_by('pk').values_list(
+                'pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            KanjiCardCollection.recount(ids[start:start + batch_size])
+        self.stdout.write("Recounted {} collections.".format(len(ids)))
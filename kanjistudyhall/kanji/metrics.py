@@ -0,0 +1,218 @@
+"""Per-view request metrics, in the Prometheus text format.
+
+kanji.middleware.MetricsMiddleware times each request and counts the SQL
+it runs, labelled by URL name. Query counts come from a thin wrapper
+around every cursor, installed when a connection is opened, rather than
+from DEBUG's query log, so this is cheap enough to leave on. The wrapper
+also hands slow statements to kanji.slowqueries.
+
+The connection pools of kanji.backends.postgresql_pool are reported too,
+by PoolCollector, which reads their sizes and stats at each scrape.
+
+Under gunicorn, each worker has its own counters. Set
+PROMETHEUS_MULTIPROC_DIR (config/gunicorn.py does) and they are written
+to memory-mapped files there, which render() merges, so a scrape sees
+every worker whichever one serves it. Pools can't be merged that way, so
+there each scrape reports the pools of the worker serving it, labelled
+with its pid.
+
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from . import slowqueries
+
+MULTIPROC_DIR_VARIABLES = ('PROMETHEUS_MULTIPROC_DIR',
+                           'prometheus_multiproc_dir')
+# Requests which didn't match a URL are counted together
+UNMATCHED = '<unmatched>'
+
+REQUEST_DURATION = Histogram(
+    'kanji_request_duration_seconds',
+    "Time to handle a request, by URL name",
+    ['view', 'method'],
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10))
+REQUEST_QUERIES = Histogram(
+    'kanji_request_queries',
+    "SQL queries run while handling a request, by URL name",
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144))
+REQUEST_DB_DURATION = Histogram(
+    'kanji_request_db_duration_seconds',
+    "Time spent running SQL while handling a request, by URL name",
+    ['view'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+RESPONSES = Counter(
+    'kanji_responses_total',
+    "Responses, by URL name and status code",
+    ['view', 'status'])
+
+# ConnectionPool.stats, and what they are reported as
+POOL_COUNTERS = (
+    ('checkouts', 'kanji_db_pool_checkouts',
+     "Connections handed out by the pool"),
+    ('connects', 'kanji_db_pool_connects',
+     "Connections opened by the pool"),
+    ('discards', 'kanji_db_pool_discards',
+     "Connections closed by the pool, as broken, old or surplus"),
+    ('waits', 'kanji_db_pool_waits',
+     "Checkouts which had to wait for a free connection"),
+    ('wait_seconds', 'kanji_db_pool_wait_seconds',
+     "Time spent waiting for a free connection"),
+    ('timeouts', 'kanji_db_pool_timeouts',
+     "Checkouts which gave up waiting for a free connection"),
+    ('pings', 'kanji_db_pool_pings',
+     "Health checks of connections on checkout"),
+    ('errors', 'kanji_db_pool_errors',
+     "Failed connects and health checks"),
+)
+
+_local = threading.local()
+
+
+class TimedCursor(object):
+    """Counts and times the statements run through a cursor."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.cursor.__exit__(type, value, traceback)
+
+    def _timed(self, method, sql, params, many=False):
+        start = time.perf_counter()
+        try:
+            result = method(sql, params)
+        finally:
+            duration = time.perf_counter() - start
+            _local.queries = getattr(_local, 'queries', 0) + 1
+            _local.db_time = getattr(_local, 'db_time', 0.0) + duration
+        threshold = settings.SLOW_QUERY_SECONDS
+        if threshold is not None and duration >= threshold:
+            slowqueries.record(self.cursor.db, sql, params, duration, many)
+        return result
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list, True)
+
+    def callproc(self, procname, params=None):
+        return self._timed(self.cursor.callproc, procname, params, True)
+
+
+def instrument(connection):
+    """Wrap the cursors a database connection makes in TimedCursor."""
+    if getattr(connection, '_kanji_metrics', False):
+        return
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TimedCursor(make_cursor(cursor))
+    connection.make_debug_cursor = (
+        lambda cursor: TimedCursor(make_debug_cursor(cursor)))
+    connection._kanji_metrics = True
+
+
+def start_request():
+    """Start counting queries for this thread's request."""
+    _local.queries = 0
+    _local.db_time = 0.0
+    _local.started = time.perf_counter()
+
+
+def finish_request(view, method, status):
+    """Record the metrics of this thread's request."""
+    started = getattr(_local, 'started', None)
+    if started is None:
+        # Another middleware answered before ours saw the request
+        return
+    duration = time.perf_counter() - started
+    REQUEST_DURATION.labels(view, method).observe(duration)
+    REQUEST_QUERIES.labels(view).observe(_local.queries)
+    REQUEST_DB_DURATION.labels(view).observe(_local.db_time)
+    RESPONSES.labels(view, str(status)).inc()
+    _local.started = None
+
+
+def view_name(request):
+    """The label a request is counted under: its URL name."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED
+    return match.url_name or match.view_name
+
+
+class PoolCollector(object):
+    """Reports the connection pools of this process (see
+    kanji.backends.postgresql_pool), labelled by database alias and name,
+    and by pid if one is given.
+
+    """
+
+    def __init__(self, pid=None):
+        self.pid = pid
+
+    def collect(self):
+        from .backends.postgresql_pool.base import pools
+        labels = ['database', 'name'] + (
+            ['pid'] if self.pid is not None else [])
+        extra = [str(self.pid)] if self.pid is not None else []
+        size = GaugeMetricFamily(
+            'kanji_db_pool_size', "Connections open in the pool",
+            labels=labels)
+        idle = GaugeMetricFamily(
+            'kanji_db_pool_idle', "Connections idle in the pool",
+            labels=labels)
+        max_size = GaugeMetricFamily(
+            'kanji_db_pool_max_size', "Most connections the pool will open",
+            labels=labels)
+        counters = [(stat, CounterMetricFamily(name, documentation,
+                                               labels=labels))
+                    for stat, name, documentation in POOL_COUNTERS]
+        for (alias, name), pool in sorted(pools().items()):
+            values = [alias, name] + extra
+            size.add_metric(values, pool.size)
+            idle.add_metric(values, pool.idle)
+            max_size.add_metric(values, pool.max_size)
+            for stat, counter in counters:
+                counter.add_metric(values, pool.stats[stat])
+        yield size
+        yield idle
+        yield max_size
+        for stat, counter in counters:
+            yield counter
+
+
+REGISTRY.register(PoolCollector())
+
+
+def is_multiprocess():
+    return any(os.environ.get(name) for name in MULTIPROC_DIR_VARIABLES)
+
+
+def render():
+    """The metrics of every worker, and their content type."""
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector(os.getpid()))
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,68 @@
+from django.conf import settings
+
+from . import metrics, profiling, routers
+
+PIN_COOKIE = 'kanji_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaPinningMiddleware(object):
+    """Read-your-writes for kanji.routers.ReplicaRouter.
+
+    Requests which may write, and every request for REPLICA_PIN_SECONDS
+    after one that did write, read from the primary. The window is kept
+    in a cookie, so it holds whichever worker serves the next request.
+    This should come before every other middleware which may write, such
+    as SessionMiddleware, so that it sees their writes.
+
+    """
+
+    def process_request(self, request):
+        routers.reset()
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            routers.pin_to_primary()
+
+    def process_response(self, request, response):
+        if routers.has_written():
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True)
+        return response
+
+
+class MetricsMiddleware(object):
+    """Records each request's latency, SQL query count and time in SQL,
+    labelled by URL name, for the /metrics endpoint. This should come
+    first in MIDDLEWARE_CLASSES, so that the other middleware is timed
+    too.
+
+    """
+
+    def process_request(self, request):
+        metrics.start_request()
+
+    def process_response(self, request, response):
+        metrics.finish_request(metrics.view_name(request), request.method,
+                               response.status_code)
+        return response
+
+
+class ProfilingMiddleware(object):
+    """Profiles requests chosen by kanji.profiling.should_profile, from
+    here until the response is rendered. This should come after
+    AuthenticationMiddleware, which it needs to recognize staff.
+
+    """
+
+    def process_request(self, request):
+        if profiling.should_profile(request):
+            request.profiler = profiling.RequestProfiler()
+            request.profiler.start()
+
+    def process_response(self, request, response):
+        profiler = getattr(request, 'profiler', None)
+        if profiler is not None:
+            name = profiler.finish(metrics.view_name(request))
+            if request.user.is_staff:
+                response['X-Profile-Name'] = name
+        return response
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    """Composite index for KanjiCard.queue. index_together can't express
+    the descending last_missed column, so the index is created by hand.
+
+    """
+
+    dependencies = [
+        ('kanji', '0012_auto_20150807_1746'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                'CREATE INDEX kanji_kanjicard_review_queue '
+                'ON kanji_kanjicard (collection_id, next_review, '
+                'last_missed DESC, consecutive_correct, efactor, id)'
+            ],
+            reverse_sql=['DROP INDEX kanji_kanjicard_review_queue'],
+        ),
+    ]
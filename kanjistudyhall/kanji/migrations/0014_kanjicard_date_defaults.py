@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import datetime
+
+
+class Migration(migrations.Migration):
+    """auto_now_add overwrote any dates given when a card was created,
+    which made it impossible to import cards with their history.
+
+    """
+
+    dependencies = [
+        ('kanji', '0013_kanjicard_review_queue_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='kanjicard',
+            name='last_missed',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='kanjicard',
+            name='last_reviewed',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='kanjicard',
+            name='next_review',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        # SQLite alters fields by rebuilding the table, which loses the
+        # hand-made review queue index from 0013.
+        migrations.RunSQL(
+            sql=[
+                'CREATE INDEX IF NOT EXISTS kanji_kanjicard_review_queue '
+                'ON kanji_kanjicard (collection_id, next_review, '
+                'last_missed DESC, consecutive_correct, efactor, id)'
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
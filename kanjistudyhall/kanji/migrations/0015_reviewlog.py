@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.conf import settings
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('kanji', '0014_kanjicard_date_defaults'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewLog',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('score', models.PositiveSmallIntegerField()),
+                ('reviewed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('efactor_before', models.FloatField(null=True)),
+                ('efactor_after', models.FloatField()),
+                ('interval', models.PositiveIntegerField()),
+                ('card', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='kanji.KanjiCard', db_index=False)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL, db_index=False)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='reviewlog',
+            index_together=set([('card', 'reviewed_at'), ('user', 'reviewed_at')]),
+        ),
+    ]
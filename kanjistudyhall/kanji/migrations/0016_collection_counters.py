@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+import datetime
+
+# KanjiCard.LEARNED_STREAK when this migration was written
+LEARNED_STREAK = 3
+
+
+def count_cards(apps, schema_editor):
+    KanjiCard = apps.get_model('kanji', 'KanjiCard')
+    KanjiCardCollection = apps.get_model('kanji', 'KanjiCardCollection')
+    today = datetime.date.today()
+    rows = KanjiCard.objects.order_by().values('collection_id').annotate(
+        card_count=Count('id'),
+        learned_count=Sum(Case(
+            When(consecutive_correct__gte=LEARNED_STREAK, then=Value(1)),
+            default=Value(0), output_field=IntegerField())),
+        due_count=Sum(Case(
+            When(next_review__lte=today, then=Value(1)),
+            default=Value(0), output_field=IntegerField())),
+        efactor_sum=Sum('efactor'),
+    )
+    for row in rows:
+        KanjiCardCollection.objects.filter(
+            pk=row.pop('collection_id')).update(due_counted_on=today, **row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kanji', '0015_reviewlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kanjicardcollection',
+            name='card_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kanjicardcollection',
+            name='due_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kanjicardcollection',
+            name='due_counted_on',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AddField(
+            model_name='kanjicardcollection',
+            name='efactor_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kanjicardcollection',
+            name='learned_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# PostgreSQL: a trigram index on the expression Django compares for
+# mnemonic__icontains, i.e. UPPER("mnemonic"::text) LIKE UPPER(%s).
+POSTGRESQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX kanji_kanjicard_mnemonic_trgm ON kanji_kanjicard '
+    'USING gin (UPPER(mnemonic::text) gin_trgm_ops)',
+]
+POSTGRESQL_REVERSE = [
+    'DROP INDEX kanji_kanjicard_mnemonic_trgm',
+]
+
+# SQLite: an FTS5 index over the mnemonics, kept up to date by triggers.
+SQLITE = [
+    "CREATE VIRTUAL TABLE kanji_kanjicard_fts USING fts5("
+    "mnemonic, content='kanji_kanjicard', content_rowid='id')",
+    "INSERT INTO kanji_kanjicard_fts(kanji_kanjicard_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER kanji_kanjicard_fts_insert AFTER INSERT ON "
+    "kanji_kanjicard BEGIN "
+    "INSERT INTO kanji_kanjicard_fts(rowid, mnemonic) "
+    "VALUES (new.id, new.mnemonic); END",
+    "CREATE TRIGGER kanji_kanjicard_fts_delete AFTER DELETE ON "
+    "kanji_kanjicard BEGIN "
+    "INSERT INTO kanji_kanjicard_fts(kanji_kanjicard_fts, rowid, mnemonic) "
+    "VALUES ('delete', old.id, old.mnemonic); END",
+    "CREATE TRIGGER kanji_kanjicard_fts_update AFTER UPDATE OF mnemonic ON "
+    "kanji_kanjicard BEGIN "
+    "INSERT INTO kanji_kanjicard_fts(kanji_kanjicard_fts, rowid, mnemonic) "
+    "VALUES ('delete', old.id, old.mnemonic); "
+    "INSERT INTO kanji_kanjicard_fts(rowid, mnemonic) "
+    "VALUES (new.id, new.mnemonic); END",
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER kanji_kanjicard_fts_update',
+    'DROP TRIGGER kanji_kanjicard_fts_delete',
+    'DROP TRIGGER kanji_kanjicard_fts_insert',
+    'DROP TABLE kanji_kanjicard_fts',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, ()):
+            schema_editor.execute(sql, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+    """Text indexes for searching mnemonics (see kanji.search).
+    On SQLite, altering a field of kanji_kanjicard rebuilds the table and
+    drops the triggers; a migration doing that has to create them again.
+
+    """
+
+    dependencies = [
+        ('kanji', '0016_collection_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRESQL, 'sqlite': SQLITE}),
+            _run({'postgresql': POSTGRESQL_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kanji', '0017_kanjicard_mnemonic_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kanjicardcollection',
+            name='deleting',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,7 +1,18 @@
 import datetime
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import (Case, Count, DateField, F, IntegerField, Q,
+                              Sum, Value, When)
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from . import reviewlog, sm2
+from .cache import touch_collection
+from .expressions import AddDays, AtLeast
 
 
 class Kanji(models.Model):
@@ -15,32 +26,601 @@ class Kanji(models.Model):
     keyword = models.CharField(max_length=50, unique=True)
     heisig_index = models.PositiveIntegerField(unique=True)
 
-    
+    def delete(self, *args, **kwargs):
+        with KanjiCardCollection.deferred_counts():
+            super(Kanji, self).delete(*args, **kwargs)
+
+
+# Counter changes held back by KanjiCardCollection.deferred_counts()
+_deferred = threading.local()
+
+
 class KanjiCardCollection(models.Model):
     """Represents a collection of KanjiCards for a given user.
     Users can have multiple collections, but a given Kanji should
     not be represented on more than one card per collection.
     Mnemonics should also be unique per collection.
 
+    The collection keeps running totals of its cards so that listing
+    collections doesn't have to count them. Saving or deleting a card
+    adjusts them; bulk changes recount the affected collections. The
+    number of cards due is only right for the day it was counted on
+    (due_counted_on), since cards fall due without anything changing,
+    so it is recounted on the first read of a new day.
+
+    deleting marks a collection whose deletion was started but may not
+    have finished; see kanji.deletion.
+
     """
     owner = models.ForeignKey(settings.AUTH_USER_MODEL)
     name = models.CharField(max_length=250)
+    card_count = models.IntegerField(default=0)
+    learned_count = models.IntegerField(default=0)
+    due_count = models.IntegerField(default=0)
+    due_counted_on = models.DateField(default=datetime.date.today)
+    efactor_sum = models.FloatField(default=0)
+    deleting = models.BooleanField(default=False)
 
     class Meta:
         unique_together = (('owner', 'name'),)
 
-    def next_scheduled_card(self):
+    COUNTER_FIELDS = ('card_count', 'learned_count', 'due_count',
+                      'efactor_sum')
+
+    @property
+    def mean_efactor(self):
+        if not self.card_count:
+            return None
+        return self.efactor_sum / self.card_count
+
+    @classmethod
+    def recount(cls, collection_ids=None, date=None):
+        """Recomputes the counters of the given collections (all of them
+        by default) from their cards, with one aggregate query and one
+        UPDATE per batch of collections. Returns a dict of the new
+        counters by collection id.
+
+        """
+        if date is None:
+            date = datetime.date.today()
+        # The counts are read from the database they are written to, as
+        # a replica may be behind; see kanji.routers
+        connection = connections[router.db_for_write(cls)]
+        with transaction.atomic(using=connection.alias):
+            return cls._recount(connection.alias, collection_ids, date)
+
+    @classmethod
+    def _recount(cls, db, collection_ids, date):
+        if collection_ids is None:
+            collection_ids = cls.objects.using(db).values_list(
+                'pk', flat=True)
+        counters = {
+            pk: dict.fromkeys(cls.COUNTER_FIELDS, 0) for pk in collection_ids
+        }
+        if not counters:
+            return counters
+        one = Value(1)
+        zero = Value(0)
+        rows = KanjiCard.objects.using(db).filter(
+            collection_id__in=list(counters)
+        ).order_by().values('collection_id').annotate(
+            card_count=Count('id'),
+            learned_count=Sum(Case(
+                When(consecutive_correct__gte=KanjiCard.LEARNED_STREAK,
+                     then=one),
+                default=zero, output_field=IntegerField())),
+            due_count=Sum(Case(
+                When(next_review__lte=date, then=one),
+                default=zero, output_field=IntegerField())),
+            efactor_sum=Sum('efactor'),
+        )
+        for row in rows:
+            counters[row.pop('collection_id')].update(row)
+
+        connection = connections[db]
+        pks = list(counters)
+        params = ['pk'] * (2 * len(cls.COUNTER_FIELDS))
+        batch_size = max(connection.ops.bulk_batch_size(params, pks), 1)
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            updates = {'due_counted_on': date}
+            for name in cls.COUNTER_FIELDS:
+                field = cls._meta.get_field(name)
+                updates[name] = Case(
+                    *[When(pk=pk,
+                           then=Value(counters[pk][name], output_field=field))
+                      for pk in batch],
+                    output_field=field
+                )
+            cls.objects.using(db).filter(pk__in=batch).update(**updates)
+        return counters
+
+    @classmethod
+    def refresh_due_counts(cls, collections, date=None):
+        """Recounts any of the given collections whose due count is from
+        an earlier day, and updates them in place.
+
+        """
+        if date is None:
+            date = datetime.date.today()
+        stale = [c for c in collections if c.due_counted_on != date]
+        if not stale:
+            return
+        counters = cls.recount([c.pk for c in stale], date)
+        for collection in stale:
+            collection.__dict__.update(counters[collection.pk])
+            collection.due_counted_on = date
+
+    @classmethod
+    def count_card_changes(cls, changes):
+        """Adjusts the counters for changed cards. changes is a sequence
+        of (before, after) pairs of KanjiCard.counted_state() values, with
+        None for a card that didn't exist before or doesn't any more.
+        Issues one UPDATE per collection affected, or, inside
+        deferred_counts(), leaves that to the end of the block.
+
+        """
+        deferred = getattr(_deferred, 'changes', None)
+        if deferred is not None:
+            deferred.extend(changes)
+            return
+        deltas = {}
+        for before, after in changes:
+            for state, sign in ((before, -1), (after, 1)):
+                if state is None:
+                    continue
+                collection_id, learned, next_review, efactor = state
+                delta = deltas.setdefault(
+                    collection_id, [0, 0, 0.0, Counter()])
+                delta[0] += sign
+                delta[1] += sign * learned
+                delta[2] += sign * efactor
+                delta[3][next_review] += sign
+        for collection_id, (cards, learned, efactor, due) in deltas.items():
+            updates = {}
+            if cards:
+                updates['card_count'] = F('card_count') + cards
+            if learned:
+                updates['learned_count'] = F('learned_count') + learned
+            if efactor:
+                updates['efactor_sum'] = F('efactor_sum') + efactor
+            # A card counts as due if it was due on due_counted_on
+            due_delta = [
+                Case(When(due_counted_on__gte=next_review, then=Value(n)),
+                     default=Value(0), output_field=IntegerField())
+                for next_review, n in due.items() if n
+            ]
+            if due_delta:
+                updates['due_count'] = sum(due_delta, F('due_count'))
+            if updates:
+                cls.objects.filter(pk=collection_id).update(**updates)
+
+    @classmethod
+    @contextmanager
+    def deferred_counts(cls, skip=()):
+        """Collects the counter changes made inside the block, e.g. by
+        the post_delete signal of every card in a cascade, and applies
+        them at the end with one UPDATE per collection rather than one
+        per card, in the same transaction. Changes to the collections in
+        skip, which are being deleted as well, are dropped.
+
+        """
+        if getattr(_deferred, 'changes', None) is not None:
+            _deferred.skip.update(skip)
+            yield
+            return
+        _deferred.changes, _deferred.skip = [], set(skip)
+        try:
+            with transaction.atomic(using=router.db_for_write(cls)):
+                yield
+                changes = [
+                    (before, after) for before, after in _deferred.changes
+                    if (before or after)[0] not in _deferred.skip
+                ]
+                _deferred.changes = None
+                cls.count_card_changes(changes)
+        finally:
+            _deferred.changes = _deferred.skip = None
+
+    def delete(self, *args, **kwargs):
+        # Its cards go first, each with a post_delete signal
+        with self.deferred_counts(skip=[self.pk]):
+            super(KanjiCardCollection, self).delete(*args, **kwargs)
+
+    def next_scheduled_card(self, after=None):
         """Find the next scheduled card.
-        Save cards that were already reviewed today until last.
+        Overdue cards come first, most overdue first, so that a missed
+        day doesn't lose any cards. Save cards that were already
+        reviewed today until last.
+        If after is given, skip ahead to the first card that follows it
+        in the review queue.
+
+        """
+        queue = KanjiCard.queue.due(self)
+        if after is not None:
+            queue = queue.after(after)
+        return queue.first()
+
+    PLACEHOLDER_MNEMONIC = 'Write a story for "{}"'
+
+    def add_heisig_range(self, first, last):
+        """Adds a card for every kanji with a heisig_index between first
+        and last inclusive, in one INSERT ... SELECT. Kanji which already
+        have a card in the collection are skipped. New cards get a
+        placeholder mnemonic built from the keyword.
+        Returns the number of cards inserted and skipped.
+
+        """
+        connection = connections[router.db_for_write(KanjiCard)]
+        qn = connection.ops.quote_name
+        kanji_table = qn(Kanji._meta.db_table)
+        prefix, suffix = self.PLACEHOLDER_MNEMONIC.split('{}')
+        insert, conflict = 'INSERT', ' ON CONFLICT DO NOTHING'
+        if (connection.vendor == 'sqlite' and
+                connection.Database.sqlite_version_info < (3, 24)):
+            insert, conflict = 'INSERT OR IGNORE', ''
+        columns = ('collection_id', 'kanji_id', 'mnemonic', 'total_reviews',
+                   'consecutive_correct', 'last_reviewed', 'last_missed',
+                   'next_review', 'efactor')
+        sql = (
+            '{insert} INTO {card_table} ({columns}) '
+            'SELECT %s, {kanji_table}.{id}, '
+            '%s || {kanji_table}.{keyword} || %s, 0, 0, %s, %s, %s, %s '
+            'FROM {kanji_table} '
+            'WHERE {kanji_table}.{index} BETWEEN %s AND %s{conflict}'
+        ).format(
+            insert=insert,
+            conflict=conflict,
+            card_table=qn(KanjiCard._meta.db_table),
+            kanji_table=kanji_table,
+            columns=', '.join(qn(c) for c in columns),
+            id=qn('id'),
+            keyword=qn('keyword'),
+            index=qn('heisig_index'),
+        )
+        today = connection.ops.value_to_db_date(datetime.date.today())
+        efactor = KanjiCard._meta.get_field('efactor').get_default()
+        params = [self.pk, prefix, suffix, today, today, today, efactor,
+                  first, last]
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                inserted = cursor.rowcount
+            matched = Kanji.objects.using(connection.alias).filter(
+                heisig_index__range=(first, last)).count()
+        if inserted:
+            self.recount([self.pk])
+            touch_collection(self.pk)
+        return inserted, matched - inserted
+
+    def set_review_scores(self, scores):
+        """Scores many cards at once. scores is a sequence of
+        (card_id, score) pairs, applied in order, so a card may be scored
+        more than once. Each card ends up exactly as set_review_score
+        would leave it, but the cards are written back in one transaction
+        with bulk UPDATEs rather than one save() per card.
+        Returns the scored cards in the order they were first scored.
+
+        """
+        scores = list(scores)
+        for card_id, score in scores:
+            KanjiCard.check_score(score)
+        with transaction.atomic():
+            card_ids = list(OrderedDict.fromkeys(
+                card_id for card_id, score in scores))
+            cards = self.kanjicard_set.select_for_update().in_bulk(card_ids)
+            missing = set(card_ids) - set(cards)
+            if missing:
+                raise KanjiCard.DoesNotExist(
+                    "No cards with ids {} in this collection".format(
+                        sorted(missing)))
+            before = [card.counted_state() for card in cards.values()]
+            logs = [cards[card_id]._calculate_next_review(score)
+                    for card_id, score in scores]
+            scored = [cards[card_id] for card_id in card_ids]
+            KanjiCard.save_schedules(scored)
+            after = [card.counted_state() for card in cards.values()]
+            self.count_card_changes(list(zip(before, after)))
+            for card in cards.values():
+                card._counted = card.counted_state()
+        touch_collection(self.pk)
+        reviewlog.record(logs)
+        return scored
+
+    def purge(self, chunk_size=None):
+        """Deletes the collection and its cards with set-based statements,
+        rather than delete(), whose collector loads every card and review
+        log row first. No signals are sent. The cards' review log rows are
+        kept and detached from them, as delete() leaves them.
+        Everything goes in one transaction, unless chunk_size is given:
+        then the cards go that many at a time, lowest ids first, each
+        chunk in a transaction of its own followed by a recount, and the
+        collection goes last.
+
+        """
+        connection = connections[router.db_for_write(KanjiCard)]
+        if chunk_size:
+            while True:
+                with transaction.atomic(using=connection.alias):
+                    deleted = self._delete_cards(connection, chunk_size)
+                if deleted < chunk_size:
+                    break
+                self.recount([self.pk])
+                touch_collection(self.pk)
+        qn = connection.ops.quote_name
+        with transaction.atomic(using=connection.alias):
+            self._delete_cards(connection)
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM {} WHERE {} = %s'.format(
+                    qn(self._meta.db_table), qn(self._meta.pk.column)),
+                    [self.pk])
+        touch_collection(self.pk)
+
+    def _delete_cards(self, connection, limit=None):
+        """Deletes the collection's cards, or the first limit of them by
+        id, with one UPDATE of the review log and one DELETE. Returns the
+        number of cards deleted.
+
+        """
+        qn = connection.ops.quote_name
+        where = '{} = %s'.format(qn('collection_id'))
+        params = [self.pk]
+        if limit:
+            last = list(KanjiCard.objects.using(connection.alias).filter(
+                collection=self).order_by('pk').values_list(
+                'pk', flat=True)[limit - 1:limit])
+            if last:
+                where += ' AND {} <= %s'.format(qn('id'))
+                params.extend(last)
+        card_table = qn(KanjiCard._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {log_table} SET {card} = NULL WHERE {card} IN '
+                '(SELECT {id} FROM {card_table} WHERE {where})'.format(
+                    log_table=qn(ReviewLog._meta.db_table),
+                    card=qn(ReviewLog._meta.get_field('card').column),
+                    id=qn('id'),
+                    card_table=card_table,
+                    where=where),
+                params)
+            cursor.execute('DELETE FROM {} WHERE {}'.format(card_table, where),
+                           params)
+            return cursor.rowcount
+
+
+class ReviewQueueQuerySet(models.QuerySet):
+    """Walks the cards that are due for review in queue order.
+    The ordering matches the kanji_kanjicard_review_queue index
+    (see migration 0013), so the database range scans the index from
+    the oldest due date and stops at the first row instead of sorting
+    the whole backlog.
+
+    """
+    ordering = ('next_review', '-last_missed', 'consecutive_correct',
+                'efactor', 'id')
+
+    def due(self, collection, date=None):
+        """Cards due on or before date (today by default)."""
+        if date is None:
+            date = datetime.date.today()
+        return self.filter(
+            collection=collection,
+            next_review__lte=date
+        ).order_by(*self.ordering)
+
+    def after(self, card):
+        """Keyset cursor: only cards which sort after the given card."""
+        keyset = Q()
+        tied = {}
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = getattr(card, name)
+            lookup = '{}__{}'.format(name, 'lt' if field[0] == '-' else 'gt')
+            keyset |= Q(**dict(tied, **{lookup: value}))
+            tied[name] = value
+        return self.filter(keyset)
+
+
+ReviewQueueManager = models.Manager.from_queryset(ReviewQueueQuerySet)
+
+
+class KanjiCardQuerySet(models.QuerySet):
+
+    def heisig_page(self, after=None, before=None, size=50):
+        """One page of cards in Heisig order, found with a keyset cursor
+        on (kanji.heisig_index, id) rather than an OFFSET, so every page
+        costs the same however deep it is. after and before are the
+        (heisig_index, id) of the cards either side of the wanted page.
+        Returns the cards, and whether there are more beyond the page in
+        the direction of travel.
+
+        """
+        queryset = self.select_related('kanji')
+        if before is not None:
+            heisig_index, pk = before
+            queryset = queryset.filter(
+                Q(kanji__heisig_index__lt=heisig_index) |
+                Q(kanji__heisig_index=heisig_index, pk__lt=pk)
+            ).order_by('-kanji__heisig_index', '-pk')
+        else:
+            if after is not None:
+                heisig_index, pk = after
+                queryset = queryset.filter(
+                    Q(kanji__heisig_index__gt=heisig_index) |
+                    Q(kanji__heisig_index=heisig_index, pk__gt=pk))
+            queryset = queryset.order_by('kanji__heisig_index', 'pk')
+        cards = list(queryset[:size + 1])
+        more = len(cards) > size
+        cards = cards[:size]
+        if before is not None:
+            cards.reverse()
+        return cards, more
+
+    def delete(self):
+        with KanjiCardCollection.deferred_counts():
+            super(KanjiCardQuerySet, self).delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def chunked(self, size=1000):
+        """Iterates over the cards in primary key order, fetching size
+        rows at a time with a keyset query, so only one chunk is ever held
+        in memory no matter how big the queryset is.
+
+        """
+        queryset = self.order_by('pk')
+        last_pk = None
+        while True:
+            chunk = queryset
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            chunk = list(chunk[:size])
+            for card in chunk:
+                yield card
+            if len(chunk) < size:
+                return
+            last_pk = chunk[-1].pk
+
+    def _supports_returning(self, connection):
+        if connection.vendor == 'postgresql':
+            return True
+        if connection.vendor == 'sqlite':
+            return connection.Database.sqlite_version_info >= (3, 35)
+        return False
+
+    # What a review reads from each card before updating it: the old
+    # e-factor for the review log, and what the card counted for in its
+    # collection's counters
+    BEFORE_FIELDS = ('id', 'collection_id', 'consecutive_correct',
+                     'next_review', 'efactor')
+
+    def review(self, score):
+        """Scores every card in the queryset, like set_review_score, with
+        an UPDATE which computes the new schedule from the values already
+        in the row, so two concurrent reviews of a card can't overwrite
+        each other. The rows are locked and their old values read first,
+        for the review log and to adjust the collection counters by the
+        change. On PostgreSQL that is one statement: the locking SELECT
+        is a CTE joined to the UPDATE, and RETURNING gives back the old
+        values beside the new. Elsewhere the rows are read and then
+        updated in one transaction, and the updated rows come back via
+        RETURNING where the database supports it.
+        Returns the updated cards.
+
+        """
+        KanjiCard.check_score(score)
+        db = self._db or router.db_for_write(self.model, **self._hints)
+        connection = connections[db]
+        today = Value(datetime.date.today(), output_field=DateField())
+        updates = {
+            'total_reviews': F('total_reviews') + 1,
+            'last_reviewed': today,
+        }
+        if score > 2:
+            delta = sm2.efactor_delta(score)
+            efactor = AtLeast(F('efactor') + Value(delta),
+                              Value(sm2.MIN_EFACTOR))
+            updates['efactor'] = efactor
+            updates['consecutive_correct'] = F('consecutive_correct') + 1
+        else:
+            updates['consecutive_correct'] = Value(0)
+            updates['last_missed'] = today
+        if score < 4:
+            updates['next_review'] = today
+        else:
+            # Every expression sees the row as it was before the UPDATE,
+            # so the new streak is consecutive_correct + 1.
+            updates['next_review'] = Case(
+                When(consecutive_correct=0, then=AddDays(today, Value(1))),
+                When(consecutive_correct=1, then=AddDays(today, Value(6))),
+                default=AddDays(today, F('consecutive_correct') * efactor),
+                output_field=DateField()
+            )
+        fields = self.model._meta.concrete_fields
+        qn = connection.ops.quote_name
+        with transaction.atomic(using=db, savepoint=False):
+            locked = self.using(db).order_by().select_for_update(
+            ).values_list(*self.BEFORE_FIELDS)
+            if connection.vendor == 'postgresql':
+                rows, before = self._review_returning_before(
+                    connection, locked, updates)
+            else:
+                before = {row[0]: row[1:] for row in locked}
+                query = self.query.clone(UpdateQuery)
+                query.add_update_values(updates)
+                sql, params = query.get_compiler(db).as_sql()
+                if self._supports_returning(connection):
+                    sql += ' RETURNING {}'.format(', '.join(
+                        qn(f.column) for f in fields))
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        rows = cursor.fetchall()
+                else:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
+                    rows = self.model.objects.using(db).filter(
+                        pk__in=list(before)).values_list(
+                        *[f.attname for f in fields])
+        cards = [
+            self.model.from_db(
+                db,
+                [f.attname for f in fields],
+                [f.to_python(value) for f, value in zip(fields, row)])
+            for row in rows
+        ]
+        changes = []
+        for card in cards:
+            collection_id, streak, next_review, efactor = before[card.pk]
+            changes.append((
+                (collection_id, streak >= KanjiCard.LEARNED_STREAK,
+                 next_review, efactor),
+                card.counted_state()))
+        KanjiCardCollection.count_card_changes(changes)
+        for collection_id in set(card.collection_id for card in cards):
+            touch_collection(collection_id)
+        reviewed_at = timezone.now()
+        reviewlog.record([
+            ReviewLog.for_card(card, score, before[card.pk][3], reviewed_at)
+            for card in cards
+        ])
+        return cards
+
+    def _review_returning_before(self, connection, locked, updates):
+        """Runs a review's UPDATE joined to the SELECT ... FOR UPDATE of
+        the cards' old values. Returns the updated rows and the old
+        values by card id.
 
         """
-        today = datetime.date.today()
-        next_card = self.kanjicard_set.filter(
-            next_review=today).order_by(
-                '-last_missed', 'consecutive_correct', 'efactor'
-            ).first()
-        return next_card
-        
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        fields = self.model._meta.concrete_fields
+        query = UpdateQuery(self.model)
+        query.add_update_values(updates)
+        update_sql, update_params = query.get_compiler(
+            connection.alias).as_sql()
+        before_sql, before_params = locked.query.get_compiler(
+            connection.alias).as_sql()
+        sql = (
+            'WITH before AS ({before}) {update} FROM before '
+            'WHERE {table}.{id} = before.{id} '
+            'RETURNING {columns}, {before_columns}'
+        ).format(
+            before=before_sql,
+            update=update_sql,
+            table=table,
+            id=qn('id'),
+            columns=', '.join('{}.{}'.format(table, qn(f.column))
+                              for f in fields),
+            before_columns=', '.join('before.{}'.format(qn(name))
+                                     for name in self.BEFORE_FIELDS[1:]),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, tuple(before_params) + tuple(update_params))
+            returned = cursor.fetchall()
+        count = len(fields)
+        rows = [row[:count] for row in returned]
+        before = {row[0]: row[count:] for row in returned}
+        return rows, before
 
 
 class KanjiCard(models.Model):
@@ -55,54 +635,155 @@ class KanjiCard(models.Model):
     mnemonic = models.TextField()
     total_reviews = models.PositiveIntegerField(default=0)
     consecutive_correct = models.PositiveIntegerField(default=0)
-    last_reviewed = models.DateField(auto_now_add=True)
-    last_missed = models.DateField(auto_now_add=True)
-    next_review = models.DateField(auto_now_add=True)
+    last_reviewed = models.DateField(default=datetime.date.today)
+    last_missed = models.DateField(default=datetime.date.today)
+    next_review = models.DateField(default=datetime.date.today)
     efactor = models.FloatField(default=2.5)
 
+    objects = KanjiCardQuerySet.as_manager()
+    queue = ReviewQueueManager()
+
     class Meta:
         unique_together = (
             ('collection', 'kanji'),
             ('collection', 'mnemonic'),
         )
 
-    def set_review_score(self, score):
-        """Scores a card on a range of 0-5 and adjusts the review
-        schedule accordingly.
+    # Cards with at least this many correct answers in a row count as
+    # learned: they are past the fixed 1 and 6 day steps.
+    LEARNED_STREAK = 3
+
+    # Fields written by _calculate_next_review
+    SCHEDULE_FIELDS = ('total_reviews', 'consecutive_correct', 'last_reviewed',
+                       'last_missed', 'next_review', 'efactor')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        card = super(KanjiCard, cls).from_db(db, field_names, values)
+        # Remember what the collection counters were told about this card
+        card._counted = card.counted_state()
+        return card
+
+    def counted_state(self):
+        """What this card contributes to its collection's counters, or
+        None if the fields needed haven't been loaded.
 
         """
+        names = ('collection_id', 'consecutive_correct', 'next_review',
+                 'efactor')
+        if not all(name in self.__dict__ for name in names):
+            return None
+        return (self.collection_id,
+                self.consecutive_correct >= self.LEARNED_STREAK,
+                self.next_review,
+                self.efactor)
+
+    @staticmethod
+    def check_score(score):
         if score not in range(0, 6):
             raise ValueError("Review Score must be between 0 and 5")
-        self._calculate_next_review(score)
+
+    @classmethod
+    def save_schedules(cls, cards, using=None):
+        """Writes the scheduling fields of many cards with one UPDATE
+        statement per batch, instead of one save() per card. Signals are
+        not sent.
+
+        """
+        if not cards:
+            return
+        connection = connections[using or router.db_for_write(cls)]
+        # Each card needs its pk and a value for every field, per field
+        params = ['pk'] * (2 * len(cls.SCHEDULE_FIELDS))
+        batch_size = max(connection.ops.bulk_batch_size(params, cards), 1)
+        for start in range(0, len(cards), batch_size):
+            batch = cards[start:start + batch_size]
+            updates = {}
+            for name in cls.SCHEDULE_FIELDS:
+                field = cls._meta.get_field(name)
+                updates[name] = Case(
+                    *[When(pk=card.pk,
+                           then=Value(getattr(card, name), output_field=field))
+                      for card in batch],
+                    output_field=field
+                )
+            cls.objects.using(connection.alias).filter(
+                pk__in=[card.pk for card in batch]).update(**updates)
+
+    def set_review_score(self, score):
+        """Scores a card on a range of 0-5 and adjusts the review
+        schedule accordingly. The new schedule is computed by the
+        database from the row as it stands (see KanjiCardQuerySet.review),
+        not from this instance's copy, which is updated to match.
+
+        """
+        reviewed = KanjiCard.objects.filter(pk=self.pk).review(score)
+        if not reviewed:
+            raise KanjiCard.DoesNotExist(
+                "Card {} no longer exists".format(self.pk))
+        for name in self.SCHEDULE_FIELDS:
+            setattr(self, name, getattr(reviewed[0], name))
+        self._counted = self.counted_state()
 
     def _calculate_next_review(self, score):
         """Adjusts the e-factor and the next scheduled review according
-        to the SM2 algorithm.
-        Algorithm described here: http://www.supermemo.com/english/ol/sm2.htm
-        
-        """
-        today = datetime.date.today()
-        self.last_reviewed = today
-        new_total = self.total_reviews + 1
-        self.total_reviews = new_total
-        if score > 2:
-            ef = self.efactor + (0.1 - (5 - score) * (0.08 + (5 - score) * 0.02))
-            if ef < 1.3:
-                ef = 1.3
-            self.efactor = ef
-            new_streak = self.consecutive_correct + 1
-            self.consecutive_correct = new_streak
-        else:
-            self.consecutive_correct = 0
-            self.last_missed = today
-        if score < 4:
-            self.next_review = today
-        else:
-            interval = 1
-            if self.consecutive_correct == 2:
-                interval = 6
-            elif self.consecutive_correct > 2:
-                interval = (self.consecutive_correct - 1) * self.efactor
-            scheduled_review = today + datetime.timedelta(days=interval)
-            self.next_review = scheduled_review
-        self.save()
+        to the SM2 algorithm. See kanji.sm2 for the details.
+        Returns an unsaved ReviewLog for the review.
+
+        """
+        efactor_before = self.efactor
+        schedule = sm2.review(
+            efactor=self.efactor,
+            consecutive_correct=self.consecutive_correct,
+            total_reviews=self.total_reviews,
+            last_missed=self.last_missed,
+            score=score,
+            today=datetime.date.today(),
+        )
+        for name in self.SCHEDULE_FIELDS:
+            setattr(self, name, getattr(schedule, name).item())
+        return ReviewLog.for_card(self, score, efactor_before)
+
+
+class ReviewLog(models.Model):
+    """One review of a card: the score it was given, and the schedule
+    it produced. Rows are only ever appended, and they are written in
+    batches off the request path (see kanji.reviewlog).
+    The owner of the card's collection is stored on each row so that a
+    user's history can be read from the (user, reviewed_at) index
+    without a join. Deleting a card keeps its history.
+
+    """
+    # The composite indexes below start with these columns, so they don't
+    # need indexes of their own.
+    card = models.ForeignKey(KanjiCard, null=True, on_delete=models.SET_NULL,
+                             db_index=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, db_index=False)
+    score = models.PositiveSmallIntegerField()
+    reviewed_at = models.DateTimeField(default=timezone.now)
+    efactor_before = models.FloatField(null=True)
+    efactor_after = models.FloatField()
+    # Days from the review until the card is next due
+    interval = models.PositiveIntegerField()
+
+    class Meta:
+        index_together = (
+            ('user', 'reviewed_at'),
+            ('card', 'reviewed_at'),
+        )
+
+    @classmethod
+    def for_card(cls, card, score, efactor_before, reviewed_at=None):
+        """An unsaved log entry for a card which has just been scored.
+        The user is filled in when the entry is written, from the card's
+        collection, which is noted on the entry (it isn't a column).
+
+        """
+        entry = cls(card_id=card.pk,
+                    score=score,
+                    reviewed_at=reviewed_at or timezone.now(),
+                    efactor_before=efactor_before,
+                    efactor_after=card.efactor,
+                    interval=(card.next_review - card.last_reviewed).days)
+        entry.collection_id = card.collection_id
+        return entry
@@ -0,0 +1,186 @@
+"""A thread-safe pool of database connections, shared by the threads of a
+process. Used by the kanji.backends.postgresql_pool database backend.
+
+Connections are handed out newest first, so the idle ones at the bottom
+of the pool are the ones that age out. Every connection is pinged before
+it is handed out, outside the pool's lock, so a slow ping doesn't hold up
+other threads' checkouts; check_idle can be raised to only ping those
+idle for at least that many seconds, saving a round trip per request at
+the risk of handing out a connection the server has dropped. One which
+is older
+than max_lifetime seconds is closed instead of being reused. When all
+max_size connections are in use, checkout() waits up to timeout seconds
+for one to be returned.
+
+"""
+import collections
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+
+    def __init__(self, connect, max_size=10, max_lifetime=600, check_idle=0,
+                 timeout=5, ping=None, is_broken=None, reset=None):
+        """connect() opens a new connection. ping(connection) raises if a
+        connection doesn't work; with no ping, idle connections aren't
+        checked. is_broken(connection) is a cheap check made on every
+        checkout and checkin. reset(connection) readies a connection for
+        its next user, and returns False if it can't be reused.
+
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.timeout = timeout
+        self.ping = ping
+        self.is_broken = is_broken or (lambda connection: False)
+        self.reset = reset or (lambda connection: True)
+        self._idle = collections.deque()
+        self._opened_at = {}
+        self._size = 0
+        self._condition = threading.Condition()
+        self.stats = collections.Counter()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def checkout(self):
+        deadline = None
+        while True:
+            closing = []
+            with self._condition:
+                connection, idle_for = self._take_idle(closing)
+                if connection is None and self._size < self.max_size:
+                    self._size += 1
+                elif connection is None:
+                    now = time.monotonic()
+                    if deadline is None:
+                        deadline = now + self.timeout
+                        self.stats['waits'] += 1
+                    if now >= deadline:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            "No connection free after {} seconds".format(
+                                self.timeout))
+                    started = now
+                    self._condition.wait(deadline - now)
+                    self.stats['wait_seconds'] += time.monotonic() - started
+                    continue
+            self._close(closing)
+            if connection is None:
+                return self._open()
+            # The connection is counted as in use while it is checked, so
+            # a slow or hung ping holds up nobody else
+            if self._healthy(connection, idle_for):
+                with self._condition:
+                    self.stats['checkouts'] += 1
+                return connection
+            with self._condition:
+                self.stats['errors'] += 1
+                self._discard(connection)
+                self._condition.notify()
+            self._close([connection])
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self.stats['errors'] += 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opened_at[id(connection)] = time.monotonic()
+            self.stats['connects'] += 1
+            self.stats['checkouts'] += 1
+        return connection
+
+    def _take_idle(self, closing):
+        """The newest idle connection which hasn't expired, and how long it
+        was idle, or (None, None). Expired ones are discarded and added to
+        closing. Call with the lock held.
+
+        """
+        while self._idle:
+            connection, last_used = self._idle.pop()
+            now = time.monotonic()
+            if self._expired(connection, now):
+                self._discard(connection)
+                closing.append(connection)
+                continue
+            return connection, now - last_used
+        return None, None
+
+    def _expired(self, connection, now):
+        return now - self._opened_at[id(connection)] > self.max_lifetime
+
+    def _healthy(self, connection, idle_for):
+        if self.is_broken(connection):
+            return False
+        if self.ping is not None and idle_for >= self.check_idle:
+            with self._condition:
+                self.stats['pings'] += 1
+            try:
+                self.ping(connection)
+            except Exception:
+                return False
+        return True
+
+    def checkin(self, connection):
+        """Return a connection to the pool, or close it if it is broken or
+        too old.
+
+        """
+        try:
+            reusable = (not self.is_broken(connection) and
+                        self.reset(connection))
+        except Exception:
+            reusable = False
+        with self._condition:
+            now = time.monotonic()
+            if reusable and not self._expired(connection, now):
+                self._idle.append((connection, now))
+                connection = None
+            else:
+                self._discard(connection)
+            self._condition.notify()
+        if connection is not None:
+            self._close([connection])
+
+    def _discard(self, connection):
+        """Stop counting a connection. Call with the lock held, and close
+        the connection once it is released.
+
+        """
+        self._opened_at.pop(id(connection), None)
+        self._size -= 1
+        self.stats['discards'] += 1
+
+    def _close(self, connections):
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close_idle(self):
+        """Close every idle connection, e.g. before forking."""
+        closing = []
+        with self._condition:
+            while self._idle:
+                connection = self._idle.pop()[0]
+                self._discard(connection)
+                closing.append(connection)
+        self._close(closing)
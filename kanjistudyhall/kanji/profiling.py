@@ -0,0 +1,190 @@
+"""Opt-in cProfile capture of single requests, for production.
+
+kanji.middleware.ProfilingMiddleware profiles a request when a staff user
+sends their profile token, as a "profile" query parameter or an
+X-Profile header, or at random for one in PROFILING_SAMPLE_RATE requests.
+Each profile is written to PROFILING_DIR, which keeps only the newest
+PROFILING_MAX_FILES, and can be downloaded from /admin/profiles/ as a
+pstats file or as folded stacks for flamegraph.pl or speedscope.
+
+"""
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import random
+import re
+import tempfile
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import signing
+
+TOKEN_SALT = 'kanji.profiling'
+TOKEN_PARAMETER = 'profile'
+TOKEN_HEADER = 'HTTP_X_PROFILE'
+SUFFIX = '.prof'
+# Deeper call chains, and calls taking less time, are left out of
+# folded stacks
+MAX_DEPTH = 100
+MIN_SECONDS = 0.000001
+
+Profile = namedtuple('Profile', 'name recorded pid duration view')
+
+
+def make_token(user):
+    """A token which lets user profile their own requests, for
+    PROFILING_TOKEN_MAX_AGE seconds.
+
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def _has_valid_token(request):
+    token = (request.GET.get(TOKEN_PARAMETER) or
+             request.META.get(TOKEN_HEADER))
+    user = getattr(request, 'user', None)
+    if not token or user is None or not user.is_staff:
+        return False
+    try:
+        pk = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return pk == str(user.pk)
+
+
+def should_profile(request):
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate and random.randrange(rate) == 0:
+        return True
+    return _has_valid_token(request)
+
+
+def profile_dir():
+    return (settings.PROFILING_DIR or
+            os.path.join(tempfile.gettempdir(), 'kanji-profiles'))
+
+
+def save(profiler, view, duration):
+    """Write a finished profile to the store, dropping the oldest ones
+    beyond PROFILING_MAX_FILES. Returns its name.
+
+    """
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    # Names sort in the order the profiles were recorded
+    name = '{:%Y%m%dT%H%M%S%f}-{}-{}-{}{}'.format(
+        datetime.datetime.utcnow(), os.getpid(), int(duration * 1000),
+        re.sub(r'[^\w.]', '_', view), SUFFIX)
+    path = os.path.join(directory, name)
+    # Written under another name first, so it is never listed half-written
+    profiler.dump_stats(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    _rotate(directory)
+    return name
+
+
+def _rotate(directory):
+    names = sorted(name for name in os.listdir(directory)
+                   if name.endswith(SUFFIX))
+    for name in names[:-settings.PROFILING_MAX_FILES]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Another worker rotated it away first
+            pass
+
+
+def _parse(name):
+    stamp, pid, duration, view = name[:-len(SUFFIX)].split('-', 3)
+    recorded = datetime.datetime.strptime(stamp, '%Y%m%dT%H%M%S%f')
+    return Profile(name, recorded, int(pid), int(duration), view)
+
+
+def profiles():
+    """Every stored profile, newest first."""
+    try:
+        names = os.listdir(profile_dir())
+    except FileNotFoundError:
+        return []
+    return [_parse(name)
+            for name in sorted(names, reverse=True) if name.endswith(SUFFIX)]
+
+
+def path(name):
+    """The path of a stored profile, or None if there is no such profile."""
+    if os.path.basename(name) != name or not name.endswith(SUFFIX):
+        return None
+    full_path = os.path.join(profile_dir(), name)
+    return full_path if os.path.isfile(full_path) else None
+
+
+def _label(function):
+    filename, line, name = function
+    if filename == '~':
+        # A builtin, such as "<method 'execute' of 'sqlite3.Cursor'>"
+        return name
+    return '{}:{}:{}'.format(os.path.basename(filename), line, name)
+
+
+def folded_stacks(stats):
+    """Collapse a pstats.Stats into "frame;frame;frame microseconds"
+    lines, the input of flamegraph.pl and speedscope.
+
+    cProfile only records which function called which, so a function's
+    time is shared out among its callers in proportion to the time each
+    spent calling it.
+
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative))
+    lines = {}
+
+    def walk(function, stack, seen, share):
+        own = stats.stats[function][2]
+        stack = stack + [_label(function)]
+        if own * share > 0:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + own * share
+        if len(stack) >= MAX_DEPTH:
+            return
+        for callee, edge in callees.get(function, []):
+            # Recursion is folded into the outermost call
+            seconds = share * edge
+            if callee not in seen and seconds >= MIN_SECONDS:
+                walk(callee, stack, seen | {callee},
+                     seconds / stats.stats[callee][3])
+
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            walk(function, [], {function}, 1.0)
+    output = io.StringIO()
+    for stack, seconds in sorted(lines.items()):
+        microseconds = int(round(seconds * 1000000))
+        if microseconds:
+            output.write('{} {}\n'.format(stack, microseconds))
+    return output.getvalue()
+
+
+def load(name):
+    return pstats.Stats(path(name))
+
+
+class RequestProfiler(object):
+    """Profiles the current thread from start() until finish()."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def finish(self, view):
+        self.profiler.disable()
+        return save(self.profiler, view, time.perf_counter() - self.started)
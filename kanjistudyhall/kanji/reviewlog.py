@@ -0,0 +1,149 @@
+"""Buffered writes for the review log.
+
+Scoring a card only appends its ReviewLog entry to an in-process buffer.
+The buffer is written with one bulk INSERT when a request finishes, which
+is after the response has been handed to the client, and only once it
+holds BATCH_SIZE entries or its oldest entry is MAX_DELAY seconds old.
+Entries still buffered when the process exits are written then; under
+gunicorn that includes workers recycled by max_requests or a timeout,
+and config/gunicorn.py flushes in worker_exit as well. Only a process
+that is killed outright (SIGKILL, the OOM killer) loses its buffer, at
+most BATCH_SIZE entries or MAX_DELAY seconds of reviews.
+
+If the write fails the entries go back into the buffer, to be tried
+again MAX_DELAY seconds later. Should the database stay unreachable the
+buffer is capped at MAX_PENDING entries, and the oldest are dropped.
+
+Outside of a request (in management commands or the shell) call flush()
+to write the buffer straight away.
+
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.db import DatabaseError, router, transaction
+
+BATCH_SIZE = 200
+MAX_DELAY = 5.0
+MAX_PENDING = 50 * BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_oldest = None
+# After a failed write, no new attempt is made before this time
+_retry_after = 0.0
+_lock = threading.Lock()
+
+
+def record(entries):
+    """Queue unsaved ReviewLog entries to be written later."""
+    global _oldest
+    if not entries:
+        return
+    with _lock:
+        if not _buffer:
+            _oldest = time.monotonic()
+        _buffer.extend(entries)
+
+
+def pending():
+    return len(_buffer)
+
+
+def _take():
+    global _buffer, _oldest, _retry_after
+    with _lock:
+        entries, _buffer, _oldest = _buffer, [], None
+        _retry_after = 0.0
+    return entries
+
+
+def _restore(entries):
+    """Put entries which couldn't be written back at the head of the
+    buffer, so they are tried again after MAX_DELAY.
+
+    """
+    global _buffer, _oldest, _retry_after
+    with _lock:
+        _buffer = entries + _buffer
+        dropped = len(_buffer) - MAX_PENDING
+        if dropped > 0:
+            del _buffer[:dropped]
+            logger.error("Dropped %d review log entries", dropped)
+        _oldest = time.monotonic()
+        _retry_after = _oldest + MAX_DELAY
+
+
+def flush():
+    """Write every buffered entry. Returns the number of rows written.
+    Entries for cards which were deleted before they could be written are
+    kept without their card, as deleting a card leaves its history; only
+    those whose collection is gone as well, so that there is no owner to
+    file them under, are dropped.
+
+    """
+    from .models import KanjiCard, KanjiCardCollection, ReviewLog
+
+    entries = _take()
+    if not entries:
+        return 0
+    try:
+        owners = dict(KanjiCard.objects.filter(
+            pk__in=set(entry.card_id for entry in entries
+                       if entry.card_id is not None)
+        ).values_list('pk', 'collection__owner_id'))
+        detached = set(entry.collection_id for entry in entries
+                       if entry.card_id not in owners)
+        collection_owners = {}
+        if detached:
+            collection_owners = dict(KanjiCardCollection.objects.filter(
+                pk__in=detached).values_list('pk', 'owner_id'))
+        written = []
+        for entry in entries:
+            if entry.card_id in owners:
+                entry.user_id = owners[entry.card_id]
+            elif entry.collection_id in collection_owners:
+                entry.card_id = None
+                entry.user_id = collection_owners[entry.collection_id]
+            else:
+                continue
+            written.append(entry)
+        with transaction.atomic(using=router.db_for_write(ReviewLog)):
+            ReviewLog.objects.bulk_create(written, batch_size=BATCH_SIZE)
+    except DatabaseError:
+        _restore(entries)
+        raise
+    if len(written) < len(entries):
+        logger.warning("Dropped %d review log entries of deleted collections",
+                       len(entries) - len(written))
+    return len(written)
+
+
+def flush_if_due(**kwargs):
+    """request_finished receiver; writes the buffer once it is big or old
+    enough.
+
+    """
+    oldest = _oldest
+    if oldest is None:
+        return
+    now = time.monotonic()
+    if now < _retry_after:
+        return
+    if len(_buffer) < BATCH_SIZE and now - oldest < MAX_DELAY:
+        return
+    try:
+        flush()
+    except DatabaseError:
+        logger.exception("Couldn't write the review log")
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Couldn't write the review log")
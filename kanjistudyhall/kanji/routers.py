@@ -0,0 +1,78 @@
+"""Sends reads to read replicas and everything else to the primary.
+
+The replicas are the database aliases listed in settings.REPLICA_DATABASES;
+with none configured every query goes to the primary ('default').
+
+Replicas lag behind the primary, so after a thread writes, its reads go
+to the primary as well for REPLICA_PIN_SECONDS. Queries inside a
+transaction on the primary also stay there, so that select_for_update
+and reads that follow a write in the same transaction see its rows.
+ReplicaPinningMiddleware (kanji.middleware) extends the window across a
+user's requests, which may be served by other threads or processes.
+
+Each thread reads from one replica, chosen at random on its first read
+after reset() (the middleware resets at the start of every request), so
+a request's reads see one consistent replica and connection.
+
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+def pin_to_primary(seconds=None):
+    """Send this thread's reads to the primary for the next seconds
+    (REPLICA_PIN_SECONDS by default).
+
+    """
+    if seconds is None:
+        seconds = settings.REPLICA_PIN_SECONDS
+    _state.pinned_until = max(getattr(_state, 'pinned_until', 0),
+                              time.monotonic() + seconds)
+
+
+def is_pinned():
+    return getattr(_state, 'pinned_until', 0) > time.monotonic()
+
+
+def has_written():
+    """Whether this thread has written since the last reset()."""
+    return getattr(_state, 'written', False)
+
+
+def reset():
+    _state.__dict__.clear()
+
+
+def _replica(replicas):
+    replica = getattr(_state, 'replica', None)
+    if replica not in replicas:
+        replica = _state.replica = random.choice(replicas)
+    return replica
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if (not replicas or is_pinned() or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return _replica(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model=None, **hints):
+        return None
@@ -0,0 +1,78 @@
+"""Searching a user's cards by kanji keyword and by mnemonic.
+
+Keywords are matched by prefix against the in-memory kanji catalog, so
+looking a kanji up while typing its keyword doesn't search any table.
+Mnemonics are matched with a text index (see migration 0017): a trigram
+index on PostgreSQL, which finds any substring, and FTS5 on SQLite,
+which matches whole words and word prefixes.
+
+"""
+from django.db import connections
+from django.db.models.functions import Lower
+
+from .catalog import get_catalog
+from .models import KanjiCard
+
+# Trigram indexes can't help with shorter search terms
+MIN_MNEMONIC_QUERY = 3
+MAX_RESULTS = 50
+# Kanji matched by keyword looked up per query
+KEYWORD_BATCH_SIZE = 500
+
+
+def _fts_query(query):
+    """An FTS5 query matching every word of query as a prefix."""
+    words = query.replace('"', ' ').split()
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def _mnemonic_matches(cards, query):
+    vendor = connections[cards.db].vendor
+    if vendor == 'sqlite':
+        fts_query = _fts_query(query)
+        if not fts_query:
+            return cards.none()
+        return cards.extra(
+            where=['kanji_kanjicard.id IN (SELECT rowid FROM '
+                   'kanji_kanjicard_fts WHERE kanji_kanjicard_fts MATCH %s)'],
+            params=[fts_query],
+        )
+    return cards.filter(mnemonic__icontains=query)
+
+
+def search_cards(user, query, limit=20):
+    """Cards in the user's collections whose kanji keyword starts with
+    query, followed by cards whose mnemonic contains it. Returns at most
+    limit cards, with their kanji and collection attached.
+
+    """
+    query = query.strip()
+    if not query:
+        return []
+    limit = min(limit, MAX_RESULTS)
+    catalog = get_catalog()
+    cards = KanjiCard.objects.filter(
+        collection__owner=user).select_related('collection')
+
+    # The user may own cards for only a few of the matching kanji, so
+    # look through all of them, a batch at a time, until there are
+    # enough cards. Each batch fetches no more cards than are still
+    # needed, the first ones in the catalog's order.
+    kanji = catalog.keyword_prefix(query)
+    order = {k.pk: i for i, k in enumerate(kanji)}
+    by_keyword = cards.annotate(
+        lower_keyword=Lower('kanji__keyword')).order_by(
+        'lower_keyword', 'kanji__heisig_index', 'pk')
+    results = []
+    for start in range(0, len(kanji), KEYWORD_BATCH_SIZE):
+        batch = kanji[start:start + KEYWORD_BATCH_SIZE]
+        results.extend(sorted(
+            by_keyword.filter(kanji__in=batch)[:limit - len(results)],
+            key=lambda card: (order[card.kanji_id], card.pk)))
+        if len(results) >= limit:
+            break
+    if len(results) < limit and len(query) >= MIN_MNEMONIC_QUERY:
+        found = set(card.pk for card in results)
+        matches = _mnemonic_matches(cards, query).exclude(pk__in=found)
+        results.extend(matches.order_by('pk')[:limit - len(results)])
+    return catalog.attach(results)
@@ -0,0 +1,71 @@
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics, reviewlog
+from .cache import touch_collection
+from .catalog import (invalidate_catalog, invalidate_catalog_later,
+                      invalidate_pending)
+from .dashboard import forget_collections
+from .models import Kanji, KanjiCard, KanjiCardCollection
+
+
+@receiver(post_save, sender=Kanji)
+@receiver(post_delete, sender=Kanji)
+def kanji_changed(sender, instance, using, **kwargs):
+    if connections[using].in_atomic_block:
+        invalidate_catalog_later()
+    else:
+        invalidate_catalog()
+
+
+@receiver(post_save, sender=KanjiCardCollection)
+@receiver(post_delete, sender=KanjiCardCollection)
+def collection_changed(sender, instance, **kwargs):
+    touch_collection(instance.pk)
+    forget_collections(instance.owner_id)
+
+
+@receiver(post_save, sender=KanjiCard)
+@receiver(post_delete, sender=KanjiCard)
+def card_changed(sender, instance, **kwargs):
+    touch_collection(instance.collection_id)
+
+
+@receiver(post_save, sender=KanjiCard)
+def count_saved_card(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    after = instance.counted_state()
+    if created:
+        KanjiCardCollection.count_card_changes([(None, after)])
+    else:
+        before = getattr(instance, '_counted', None)
+        if before is None or after is None:
+            # Don't know what changed
+            KanjiCardCollection.recount([instance.collection_id])
+        elif before != after:
+            KanjiCardCollection.count_card_changes([(before, after)])
+    instance._counted = after
+
+
+@receiver(post_delete, sender=KanjiCard)
+def count_deleted_card(sender, instance, **kwargs):
+    before = getattr(instance, '_counted', None) or instance.counted_state()
+    if before is None:
+        KanjiCardCollection.recount([instance.collection_id])
+    else:
+        KanjiCardCollection.count_card_changes([(before, None)])
+
+
+request_finished.connect(reviewlog.flush_if_due,
+                         dispatch_uid='kanji.reviewlog.flush_if_due')
+request_finished.connect(invalidate_pending,
+                         dispatch_uid='kanji.catalog.invalidate_pending')
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    metrics.instrument(connection)
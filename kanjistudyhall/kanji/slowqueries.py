@@ -0,0 +1,140 @@
+"""Capture of SQL statements slower than SLOW_QUERY_SECONDS.
+
+kanji.metrics.TimedCursor hands every statement that took longer than
+that here, with the time it took. Each is kept, with the line in the
+kanji app which ran it, in a ring buffer of the newest
+SLOW_QUERY_BUFFER_SIZE held in the cache, which production shares
+between workers (see CACHES in config/settings), so every worker's show
+up at /admin/slow-queries/. The first time a statement of a given shape is
+slow, its plan is captured with EXPLAIN (EXPLAIN QUERY PLAN on SQLite),
+which doesn't run the statement.
+
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+COUNT_KEY = 'kanji:slowqueries:count'
+ENTRY_KEY = 'kanji:slowqueries:{}'
+PLAN_KEY = 'kanji:slowqueries:plan:{}'
+EXPLAIN = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+# Statements EXPLAIN can describe without side effects
+EXPLAINABLE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.I)
+MAX_SQL_LENGTH = 10000
+MAX_PARAMS_LENGTH = 500
+
+KANJI_DIR = os.path.dirname(os.path.abspath(__file__))
+# Modules which pass statements on, rather than make them
+PASS_THROUGH = {os.path.join(KANJI_DIR, name)
+                for name in ('metrics.py', 'slowqueries.py')}
+
+_local = threading.local()
+
+
+def shape(sql):
+    """The statement with what varies between runs of it taken out: the
+    length of IN lists and literal numbers, such as LIMITs.
+
+    """
+    sql = re.sub(r'\((?:%s, )+%s\)', '(%s, ...)', sql)
+    return re.sub(r'\b\d+\b', '0', sql)
+
+
+def fingerprint(sql):
+    return hashlib.sha1(shape(sql).encode('utf-8')).hexdigest()
+
+
+def call_site():
+    """Where in the kanji app the statement being run came from, as
+    "models.py:171 in next_scheduled_card", or None.
+
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (filename.startswith(KANJI_DIR + os.sep) and
+                filename not in PASS_THROUGH):
+            return '{}:{} in {}'.format(
+                os.path.relpath(filename, KANJI_DIR), frame.f_lineno,
+                frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, sql, params):
+    """The plan of a statement as text, or None if it can't be had."""
+    prefix = EXPLAIN.get(connection.vendor)
+    if prefix is None or not EXPLAINABLE.match(sql):
+        return None
+    if connection.needs_rollback:
+        return None
+    try:
+        # A failed EXPLAIN must not break the transaction it runs in
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except Exception:
+        return None
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+def record(connection, sql, params, duration, many=False):
+    """Keep a slow statement, and its plan if its shape is new."""
+    if getattr(_local, 'busy', False):
+        # Statements run by recording one aren't recorded themselves
+        return
+    _local.busy = True
+    try:
+        key = fingerprint(sql)
+        if not many and cache.get(PLAN_KEY.format(key)) is None:
+            plan = explain(connection, sql, params)
+            if plan is not None:
+                cache.add(PLAN_KEY.format(key), plan, None)
+        cache.add(COUNT_KEY, 0, None)
+        number = cache.incr(COUNT_KEY)
+        slot = number % settings.SLOW_QUERY_BUFFER_SIZE
+        cache.set(ENTRY_KEY.format(slot), {
+            'number': number,
+            'sql': sql[:MAX_SQL_LENGTH],
+            'params': repr(params)[:MAX_PARAMS_LENGTH],
+            'duration': duration,
+            'database': connection.alias,
+            'call_site': call_site(),
+            'fingerprint': key,
+            'recorded': timezone.now(),
+        }, None)
+    finally:
+        _local.busy = False
+
+
+def recent():
+    """The slow statements in the buffer, newest first, each with the
+    plan of its shape under 'plan'.
+
+    """
+    count = cache.get(COUNT_KEY) or 0
+    size = settings.SLOW_QUERY_BUFFER_SIZE
+    keys = [ENTRY_KEY.format(number % size)
+            for number in range(count, max(count - size, 0), -1)]
+    found = cache.get_many(keys)
+    entries = [found[key] for key in keys if key in found]
+    # Slots may have been overwritten since the count was read
+    entries = [entry for entry in entries
+               if count - size < entry['number'] <= count]
+    plans = cache.get_many(
+        list({PLAN_KEY.format(entry['fingerprint']) for entry in entries}))
+    for entry in entries:
+        entry['plan'] = plans.get(PLAN_KEY.format(entry['fingerprint']))
+    return sorted(entries, key=lambda entry: entry['number'], reverse=True)
+
@@ -0,0 +1,80 @@
+"""The SM2 spaced repetition schedule, on whole columns of cards at once.
+Algorithm described here: http://www.supermemo.com/english/ol/sm2.htm
+
+review() takes the scheduling columns of any number of cards as NumPy
+arrays (or anything np.asarray accepts, including plain scalars) and
+returns the columns after scoring. KanjiCard._calculate_next_review
+delegates here with one-element columns, so bulk recomputation and
+simulations follow exactly the same rules as a single review.
+
+"""
+from collections import namedtuple
+
+import numpy as np
+
+MIN_EFACTOR = 1.3
+# date + timedelta(days=interval) rounds the interval to the microsecond
+# and then drops the fraction of a day. Intervals are truncated the
+# same way here, and in the SQL version of the schedule.
+MICROSECONDS_PER_DAY = 86400000000
+
+Schedule = namedtuple('Schedule', [
+    'total_reviews',
+    'consecutive_correct',
+    'last_reviewed',
+    'last_missed',
+    'next_review',
+    'efactor',
+])
+
+
+def efactor_delta(score):
+    """How much a score moves the e-factor, before the floor is applied."""
+    return 0.1 - (5 - score) * (0.08 + (5 - score) * 0.02)
+
+
+def interval_days(interval):
+    """Whole days in an interval, rounded the way timedelta rounds it."""
+    microseconds = np.rint(np.asarray(interval, dtype=np.float64) *
+                           MICROSECONDS_PER_DAY)
+    return (microseconds // MICROSECONDS_PER_DAY).astype(np.int64)
+
+
+def review(efactor, consecutive_correct, total_reviews, last_missed,
+           score, today):
+    """Apply review scores (0-5) to columns of cards reviewed on today,
+    which may be a single date or a column with each card's own review
+    date. The new next_review depends only on today and the card's
+    history, so the old one isn't needed. Dates may be datetime.date
+    objects or datetime64 values; the returned dates are datetime64[D].
+
+    """
+    score = np.asarray(score, dtype=np.int64)
+    if np.any((score < 0) | (score > 5)):
+        raise ValueError("Review Score must be between 0 and 5")
+    efactor = np.asarray(efactor, dtype=np.float64)
+    consecutive_correct = np.asarray(consecutive_correct, dtype=np.int64)
+    total_reviews = np.asarray(total_reviews, dtype=np.int64)
+    last_missed = np.asarray(last_missed, dtype='datetime64[D]')
+    today = np.asarray(today, dtype='datetime64[D]')
+
+    passed = score > 2
+    new_efactor = efactor + efactor_delta(score)
+    new_efactor = np.where(new_efactor < MIN_EFACTOR, MIN_EFACTOR, new_efactor)
+    efactor = np.where(passed, new_efactor, efactor)
+    streak = np.where(passed, consecutive_correct + 1, 0)
+    last_missed = np.where(passed, last_missed, today)
+
+    interval = np.where(streak > 2, (streak - 1) * efactor,
+                        np.where(streak == 2, 6, 1))
+    scheduled = today + interval_days(interval).astype('timedelta64[D]')
+    next_review = np.where(score < 4, today, scheduled)
+
+    return Schedule(
+        total_reviews=total_reviews + 1,
+        consecutive_correct=streak,
+        last_reviewed=np.broadcast_to(today, next_review.shape).copy(),
+        last_missed=last_missed,
+        next_review=next_review,
+        efactor=efactor,
+    )
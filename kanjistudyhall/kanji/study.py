@@ -0,0 +1,103 @@
+import datetime
+
+from django.core.cache import cache
+
+from .cache import collection_revision
+from .catalog import get_catalog
+from .models import KanjiCard
+
+CARD_FIELDS = tuple(f.attname for f in KanjiCard._meta.concrete_fields)
+
+
+class StudySession(object):
+    """A day's review queue for a KanjiCardCollection, held in the cache.
+
+    The due cards are loaded in review order with a single query the
+    first time the queue is needed. After that, serving the next card is
+    a cache read; only scoring a card touches the database. Missed cards
+    go back on the tail of the queue, so they come up again after
+    everything else that is due. Cards come with their kanji attached
+    from the kanji catalog, so showing one costs no queries at all.
+
+    The cache key includes the collection revision, so any change to the
+    collection or its cards made outside the session starts a new queue.
+    That holds across processes only because they share the cache (see
+    CACHES in config/settings).
+
+    """
+    KEY = 'kanji:study:{collection}:{revision}:{date}'
+    TIMEOUT = 60 * 60 * 24
+
+    def __init__(self, collection, date=None):
+        self.collection = collection
+        self.date = date or datetime.date.today()
+        self._rows = None
+
+    def _key(self, revision=None):
+        if revision is None:
+            revision = collection_revision(self.collection.pk)
+        return self.KEY.format(
+            collection=self.collection.pk,
+            revision=revision,
+            date=self.date.isoformat(),
+        )
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            key = self._key()
+            self._rows = cache.get(key)
+            if self._rows is None:
+                self._load(key)
+        return self._rows
+
+    def load(self):
+        """(Re)load the queue from the database."""
+        self._load(self._key())
+
+    def _load(self, key):
+        # key is taken before the query, so that a change made meanwhile
+        # leaves the queue under an old revision rather than the current
+        self._rows = list(
+            KanjiCard.queue.due(self.collection, self.date).values_list(
+                *CARD_FIELDS)
+        )
+        cache.set(key, self._rows, self.TIMEOUT)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def card_ids(self):
+        return [row[0] for row in self.rows]
+
+    def next_card(self):
+        """Return the card at the head of the queue, or None when the
+        day's reviews are done.
+
+        """
+        if not self.rows:
+            return None
+        card = KanjiCard.from_db(
+            KanjiCard.objects.db, CARD_FIELDS, self.rows[0])
+        return get_catalog().attach([card])[0]
+
+    def set_review_score(self, card, score):
+        """Score a card, take it off the queue, and put it back on the tail
+        if it is still due today.
+
+        """
+        rows = [row for row in self.rows if row[0] != card.pk]
+        revision = collection_revision(self.collection.pk)
+        card.set_review_score(score)
+        if card.next_review <= self.date:
+            rows.append(tuple(getattr(card, name) for name in CARD_FIELDS))
+        self._rows = rows
+        # Scoring the card bumped the collection revision once; the
+        # updated queue is still accurate, so carry it over to the new
+        # key, unless something else changed the collection meanwhile
+        if collection_revision(self.collection.pk) == revision + 1:
+            cache.set(self._key(revision + 1), rows, self.TIMEOUT)
+
+    def invalidate(self):
+        cache.delete(self._key())
+        self._rows = None
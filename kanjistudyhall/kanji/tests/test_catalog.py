@@ -0,0 +1,112 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.test import TestCase
+
+from kanji import cache as kanji_cache, exports
+from kanji.catalog import get_catalog, invalidate_catalog
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+from kanji.study import StudySession
+
+User = get_user_model()
+
+
+class KanjiCatalogTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sun = Kanji.objects.create(character='日', keyword='day',
+                                        heisig_index=12)
+        self.moon = Kanji.objects.create(character='月', keyword='month',
+                                         heisig_index=13)
+
+    def test_lookups(self):
+        catalog = get_catalog()
+        self.assertEqual(len(catalog), 2)
+        self.assertEqual(catalog.by_id[self.sun.pk], self.sun)
+        self.assertEqual(catalog.by_character['月'], self.moon)
+        self.assertEqual(catalog.by_keyword['day'], self.sun)
+        self.assertEqual(catalog.by_heisig_index[13], self.moon)
+
+    def test_loaded_once(self):
+        get_catalog()
+        with self.assertNumQueries(0):
+            catalog = get_catalog()
+            self.assertEqual(catalog.by_character['日'], self.sun)
+
+    def test_saving_kanji_invalidates(self):
+        get_catalog()
+        self.sun.keyword = 'sun'
+        self.sun.save()
+        self.assertEqual(get_catalog().by_keyword['sun'], self.sun)
+        self.assertNotIn('day', get_catalog().by_keyword)
+
+    def test_new_kanji_invalidates(self):
+        get_catalog()
+        bright = Kanji.objects.create(character='明', keyword='bright',
+                                      heisig_index=20)
+        self.assertEqual(get_catalog().by_heisig_index[20], bright)
+
+    def test_deleting_kanji_invalidates(self):
+        get_catalog()
+        self.moon.delete()
+        self.assertNotIn('月', get_catalog().by_character)
+
+    def test_change_in_a_transaction_invalidates_again_after(self):
+        get_catalog()
+        with mock.patch.object(kanji_cache, 'touch_catalog') as touch:
+            self.sun.keyword = 'sun'
+            self.sun.save()
+            self.assertEqual(touch.call_count, 1)
+            request_finished.send(sender=None)
+            self.assertEqual(touch.call_count, 2)
+            request_finished.send(sender=None)
+            self.assertEqual(touch.call_count, 2)
+
+    def test_bulk_changes_need_explicit_invalidation(self):
+        get_catalog()
+        Kanji.objects.bulk_create([
+            Kanji(character='明', keyword='bright', heisig_index=20)])
+        invalidate_catalog()
+        self.assertIn('明', get_catalog().by_character)
+
+    def test_attach(self):
+        owner = User.objects.create()
+        collection = KanjiCardCollection.objects.create(owner=owner,
+                                                        name='default')
+        KanjiCard.objects.create(kanji=self.sun, collection=collection,
+                                 mnemonic='midday sun')
+        card = KanjiCard.objects.get()
+        get_catalog().attach([card])
+        with self.assertNumQueries(0):
+            self.assertEqual(card.kanji.keyword, 'day')
+
+    def test_kanji_unknown_to_the_catalog_are_loaded(self):
+        # As if another process had added it
+        get_catalog()
+        Kanji.objects.bulk_create([
+            Kanji(character='明', keyword='bright', heisig_index=20)])
+        bright = Kanji.objects.get(character='明')
+        owner = User.objects.create()
+        collection = KanjiCardCollection.objects.create(owner=owner,
+                                                        name='default')
+        KanjiCard.objects.create(kanji=bright, collection=collection,
+                                 mnemonic='sun and moon')
+        card = get_catalog().attach([KanjiCard.objects.get()])[0]
+        self.assertEqual(card.kanji.keyword, 'bright')
+        self.assertEqual([row[2] for row in exports.card_rows(collection)],
+                         ['bright'])
+        self.assertEqual(get_catalog().keyword_prefix('br'), [bright])
+
+    def test_study_session_card_kanji_without_queries(self):
+        owner = User.objects.create()
+        collection = KanjiCardCollection.objects.create(owner=owner,
+                                                        name='default')
+        KanjiCard.objects.create(kanji=self.sun, collection=collection,
+                                 mnemonic='midday sun')
+        StudySession(collection).next_card()
+        session = StudySession(collection)
+        with self.assertNumQueries(0):
+            self.assertEqual(session.next_card().kanji.character, '日')
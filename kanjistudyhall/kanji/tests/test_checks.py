@@ -0,0 +1,26 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from kanji.checks import shared_cache_check
+
+LOCMEM = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+MEMCACHED = {'default': {
+    'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+    'LOCATION': '127.0.0.1:11211'}}
+
+
+class SharedCacheCheckTest(TestCase):
+
+    @override_settings(DEBUG=False, CACHES=LOCMEM)
+    def test_per_process_cache_warns(self):
+        [warning] = shared_cache_check(None)
+        self.assertEqual(warning.id, 'kanji.W001')
+
+    @override_settings(DEBUG=False, CACHES=MEMCACHED)
+    def test_shared_cache(self):
+        self.assertEqual(shared_cache_check(None), [])
+
+    @override_settings(DEBUG=True, CACHES=LOCMEM)
+    def test_debug(self):
+        self.assertEqual(shared_cache_check(None), [])
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from kanji.models import Kanji
+
+
+class LoadHeisigTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def _load(self, path, **options):
+        out = StringIO()
+        call_command('load_heisig', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_load_csv(self):
+        path = self._write('heisig.csv',
+                           'heisig_index,character,keyword\n'
+                           '1,一,one\n2,二,two\n3,三,three\n')
+        self._load(path, batch_size=2)
+        self.assertEqual(
+            list(Kanji.objects.order_by('heisig_index').values_list(
+                'character', 'keyword', 'heisig_index')),
+            [('一', 'one', 1), ('二', 'two', 2), ('三', 'three', 3)])
+
+    def test_load_json(self):
+        path = self._write('heisig.json', json.dumps([
+            {'character': '日', 'keyword': 'day', 'heisig_index': 12},
+            {'character': '月', 'keyword': 'month', 'heisig_index': 13},
+        ]))
+        self._load(path)
+        self.assertEqual(Kanji.objects.get(character='月').keyword, 'month')
+
+    def test_loading_twice_changes_nothing(self):
+        path = self._write('heisig.csv',
+                           'character,keyword,heisig_index\n一,one,1\n')
+        self._load(path)
+        output = self._load(path)
+        self.assertEqual(Kanji.objects.count(), 1)
+        self.assertIn('Created 0, updated 0, unchanged 1', output)
+
+    def test_changed_keyword_is_updated(self):
+        Kanji.objects.create(character='一', keyword='uno', heisig_index=1)
+        path = self._write('heisig.csv',
+                           'character,keyword,heisig_index\n一,one,1\n')
+        with mock.patch(
+                'kanji.management.commands.load_heisig.invalidate_catalog'
+        ) as invalidate:
+            self._load(path)
+        self.assertEqual(Kanji.objects.get(character='一').keyword, 'one')
+        # Once the changes are committed
+        invalidate.assert_called_once_with()
+
+    def test_duplicate_keyword_in_file_rejected(self):
+        path = self._write('heisig.csv',
+                           'character,keyword,heisig_index\n'
+                           '一,one,1\n二,one,2\n')
+        with self.assertRaises(CommandError):
+            self._load(path)
+        self.assertEqual(Kanji.objects.count(), 0)
+
+    def test_clash_with_existing_kanji_rejected(self):
+        Kanji.objects.create(character='日', keyword='day', heisig_index=12)
+        path = self._write('heisig.csv',
+                           'character,keyword,heisig_index\n'
+                           '一,one,1\n月,day,13\n')
+        with self.assertRaises(CommandError):
+            self._load(path)
+        self.assertEqual(Kanji.objects.count(), 1)
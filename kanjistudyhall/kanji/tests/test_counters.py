@@ -0,0 +1,212 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from kanji import routers
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+
+class CollectionCountersTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(
+            owner=self.owner, name='default')
+        self.today = datetime.date.today()
+
+    def _create_card(self, index, collection=None, **fields):
+        kanji = Kanji.objects.create(character=chr(0x4E00 + index),
+                                     keyword='keyword {}'.format(index),
+                                     heisig_index=index)
+        return KanjiCard.objects.create(
+            kanji=kanji,
+            mnemonic='story {}'.format(index),
+            collection=collection or self.collection,
+            **fields)
+
+    def _counters(self, collection=None):
+        collection = collection or self.collection
+        collection = KanjiCardCollection.objects.get(pk=collection.pk)
+        return (collection.card_count, collection.due_count,
+                collection.learned_count, collection.efactor_sum)
+
+    def _assert_counts_match_cards(self, collection=None):
+        collection = collection or self.collection
+        counted = self._counters(collection)
+        KanjiCardCollection.recount([collection.pk])
+        recounted = self._counters(collection)
+        self.assertEqual(counted[:3], recounted[:3])
+        self.assertAlmostEqual(counted[3], recounted[3])
+
+    def test_new_collection_is_empty(self):
+        self.assertEqual(self._counters(), (0, 0, 0, 0))
+        self.assertIsNone(self.collection.mean_efactor)
+
+    def test_creating_cards(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        self._create_card(1, efactor=2.0)
+        self._create_card(2, efactor=3.0, next_review=tomorrow,
+                          consecutive_correct=KanjiCard.LEARNED_STREAK)
+        self.assertEqual(self._counters(), (2, 1, 1, 5.0))
+        collection = KanjiCardCollection.objects.get()
+        self.assertEqual(collection.mean_efactor, 2.5)
+
+    def test_deleting_cards(self):
+        card = self._create_card(1)
+        self._create_card(2)
+        KanjiCard.objects.get(pk=card.pk).delete()
+        self.assertEqual(self._counters(), (1, 1, 0, 2.5))
+
+    def test_deleting_card_that_was_just_created(self):
+        card = self._create_card(1)
+        card.delete()
+        self.assertEqual(self._counters(), (0, 0, 0, 0))
+
+    def _counter_updates(self, queries):
+        return [q for q in queries
+                if 'UPDATE "kanji_kanjicardcollection"' in q['sql']]
+
+    def test_deleting_cards_in_bulk_is_one_update(self):
+        cards = [self._create_card(i) for i in range(1, 5)]
+        with CaptureQueriesContext(connection) as queries:
+            KanjiCard.objects.filter(pk__in=[c.pk for c in cards[1:]]).delete()
+        self.assertEqual(len(self._counter_updates(queries)), 1)
+        self.assertEqual(self._counters(), (1, 1, 0, 2.5))
+
+    def test_deleting_collection_skips_its_counters(self):
+        for i in range(1, 4):
+            self._create_card(i)
+        with CaptureQueriesContext(connection) as queries:
+            KanjiCardCollection.objects.get(pk=self.collection.pk).delete()
+        self.assertEqual(self._counter_updates(queries), [])
+        self.assertFalse(KanjiCard.objects.exists())
+
+    def test_deleting_kanji_adjusts_each_collection(self):
+        other = KanjiCardCollection.objects.create(owner=self.owner,
+                                                   name='other')
+        card = self._create_card(1)
+        KanjiCard.objects.create(kanji=card.kanji, collection=other,
+                                 mnemonic='story')
+        self._create_card(2, collection=other)
+        with CaptureQueriesContext(connection) as queries:
+            Kanji.objects.get(pk=card.kanji_id).delete()
+        self.assertEqual(len(self._counter_updates(queries)), 2)
+        self.assertEqual(self._counters()[:3], (0, 0, 0))
+        self.assertEqual(self._counters(other), (1, 1, 0, 2.5))
+
+    def test_failed_delete_changes_no_counters(self):
+        self._create_card(1)
+        with self.assertRaises(RuntimeError):
+            with KanjiCardCollection.deferred_counts():
+                KanjiCard.objects.all().delete()
+                raise RuntimeError
+        self.assertEqual(self._counters(), (1, 1, 0, 2.5))
+
+    def test_recount_reads_from_the_primary(self):
+        self._create_card(1)
+        # There is no 'replica' connection to read from
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read',
+                               return_value='replica'):
+            KanjiCardCollection.recount([self.collection.pk])
+        self.assertEqual(self._counters(), (1, 1, 0, 2.5))
+
+    def test_set_review_score(self):
+        card = self._create_card(1, consecutive_correct=2)
+        card = KanjiCard.objects.get(pk=card.pk)
+        card.set_review_score(5)
+        self.assertEqual(self._counters(), (1, 0, 1, card.efactor))
+        card.set_review_score(1)
+        self.assertEqual(self._counters(), (1, 1, 0, card.efactor))
+        self._assert_counts_match_cards()
+
+    def test_set_review_score_queries(self):
+        card = KanjiCard.objects.get(pk=self._create_card(1).pk)
+        # The locking read of the old row, the card's UPDATE, and the
+        # counters; PostgreSQL joins the first two into one statement
+        expected = 2 if connection.vendor == 'postgresql' else 3
+        with self.assertNumQueries(expected):
+            card.set_review_score(5)
+
+    def test_review_adjusts_counters_without_recounting(self):
+        cards = [self._create_card(i, consecutive_correct=2)
+                 for i in range(1, 4)]
+        with mock.patch.object(KanjiCardCollection, 'recount') as recount:
+            KanjiCard.objects.filter(pk__in=[c.pk for c in cards]).review(5)
+            cards[0].set_review_score(1)
+        self.assertFalse(recount.called)
+        self.assertEqual(self._counters()[:3], (3, 1, 2))
+        self._assert_counts_match_cards()
+
+    def test_set_review_scores(self):
+        cards = [self._create_card(i) for i in range(1, 5)]
+        self.collection.set_review_scores(
+            [(card.pk, 5) for card in cards] + [(cards[0].pk, 1)])
+        self.assertEqual(self._counters()[:3], (4, 1, 0))
+        self._assert_counts_match_cards()
+
+    def test_queryset_review(self):
+        for i in range(1, 4):
+            self._create_card(i)
+        KanjiCard.objects.all().review(5)
+        self.assertEqual(self._counters()[:2], (3, 0))
+        self._assert_counts_match_cards()
+
+    def test_moving_card_between_collections(self):
+        other = KanjiCardCollection.objects.create(owner=self.owner,
+                                                   name='other')
+        card = KanjiCard.objects.get(pk=self._create_card(1).pk)
+        card.collection = other
+        card.save()
+        self.assertEqual(self._counters(), (0, 0, 0, 0))
+        self.assertEqual(self._counters(other), (1, 1, 0, 2.5))
+
+    def test_add_heisig_range(self):
+        for i in range(1, 4):
+            Kanji.objects.create(character=chr(0x4E00 + i),
+                                 keyword='keyword {}'.format(i),
+                                 heisig_index=i)
+        self.collection.add_heisig_range(1, 3)
+        self.assertEqual(self._counters(), (3, 3, 0, 7.5))
+
+    def test_due_count_refreshed_on_a_new_day(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        self._create_card(1, next_review=tomorrow)
+        collections = list(KanjiCardCollection.objects.all())
+        KanjiCardCollection.refresh_due_counts(collections)
+        self.assertEqual(collections[0].due_count, 0)
+        KanjiCardCollection.refresh_due_counts(collections, date=tomorrow)
+        self.assertEqual(collections[0].due_count, 1)
+        self.assertEqual(collections[0].due_counted_on, tomorrow)
+        self.assertEqual(self._counters()[1], 1)
+
+    def test_due_counts_for_today_not_requeried(self):
+        collections = list(KanjiCardCollection.objects.all())
+        with self.assertNumQueries(0):
+            KanjiCardCollection.refresh_due_counts(collections)
+
+    def test_recount_command_repairs_counters(self):
+        self._create_card(1)
+        self._create_card(2)
+        KanjiCardCollection.objects.update(card_count=7, due_count=0,
+                                           efactor_sum=0)
+        out = StringIO()
+        call_command('recount_collections', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Recounted 1 collections.")
+        self.assertEqual(self._counters(), (2, 2, 0, 5.0))
+
+    def test_recount_command_with_ids(self):
+        other = KanjiCardCollection.objects.create(owner=self.owner,
+                                                   name='other')
+        self._create_card(1, collection=other)
+        KanjiCardCollection.objects.update(card_count=7)
+        call_command('recount_collections', str(other.pk), stdout=StringIO())
+        self.assertEqual(self._counters()[0], 7)
+        self.assertEqual(self._counters(other)[0], 1)
@@ -0,0 +1,136 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from kanji.dashboard import COLLECTIONS_KEY, collection_stats, dashboard
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+
+class DashboardTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create()
+        self.today = datetime.date.today()
+        self.index = 0
+
+    def _create_collection(self, name, cards=0, owner=None, **fields):
+        collection = KanjiCardCollection.objects.create(
+            owner=owner or self.owner, name=name)
+        for _ in range(cards):
+            self._create_card(collection, **fields)
+        return collection
+
+    def _create_card(self, collection, **fields):
+        self.index += 1
+        kanji = Kanji.objects.create(character=chr(0x4E00 + self.index),
+                                     keyword='keyword {}'.format(self.index),
+                                     heisig_index=self.index)
+        return KanjiCard.objects.create(
+            kanji=kanji, collection=collection,
+            mnemonic='story {}'.format(self.index), **fields)
+
+    def test_stats(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        collection = self._create_collection('b', cards=2)
+        self._create_card(collection, next_review=tomorrow, efactor=1.5,
+                          consecutive_correct=KanjiCard.LEARNED_STREAK)
+        self._create_collection('a')
+        a, b = collection_stats(self.owner)
+        self.assertEqual(a['name'], 'a')
+        self.assertEqual((a['card_count'], a['due_count'], a['learned_count'],
+                          a['next_review'], a['mean_efactor']),
+                         (0, 0, 0, None, None))
+        self.assertEqual(b['id'], collection.pk)
+        self.assertEqual(b['card_count'], 3)
+        self.assertEqual(b['due_count'], 2)
+        self.assertEqual(b['learned_count'], 1)
+        self.assertEqual(b['reviewed_today'], 3)
+        self.assertEqual(b['next_review'], self.today)
+        self.assertAlmostEqual(b['mean_efactor'], 6.5 / 3)
+
+    def test_only_the_users_collections(self):
+        self._create_collection('mine', cards=1)
+        other = User.objects.create(username='other')
+        self._create_collection('theirs', cards=1, owner=other)
+        self.assertEqual([row['name'] for row in dashboard(self.owner)],
+                         ['mine'])
+
+    def test_one_query_for_any_number_of_collections(self):
+        for name in 'abc':
+            self._create_collection(name, cards=1)
+        # The collections' ids, then their statistics
+        with self.assertNumQueries(2):
+            dashboard(self.owner)
+        for name in 'defg':
+            self._create_collection(name, cards=2)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(dashboard(self.owner)), 7)
+
+    def test_cached(self):
+        self._create_collection('a', cards=2)
+        dashboard(self.owner)
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard(self.owner)[0]['card_count'], 2)
+
+    def test_review_invalidates(self):
+        collection = self._create_collection('a')
+        card = self._create_card(collection)
+        self.assertEqual(dashboard(self.owner)[0]['due_count'], 1)
+        card.set_review_score(5)
+        self.assertEqual(dashboard(self.owner)[0]['due_count'], 0)
+
+    def test_batch_review_invalidates(self):
+        collection = self._create_collection('a')
+        card = self._create_card(collection)
+        dashboard(self.owner)
+        collection.set_review_scores([(card.pk, 5)])
+        self.assertEqual(dashboard(self.owner)[0]['due_count'], 0)
+
+    def test_card_changes_invalidate(self):
+        collection = self._create_collection('a', cards=1)
+        dashboard(self.owner)
+        card = self._create_card(collection)
+        self.assertEqual(dashboard(self.owner)[0]['card_count'], 2)
+        card.delete()
+        self.assertEqual(dashboard(self.owner)[0]['card_count'], 1)
+
+    def test_collection_changes_invalidate(self):
+        collection = self._create_collection('a')
+        dashboard(self.owner)
+        self._create_collection('b')
+        self.assertEqual(len(dashboard(self.owner)), 2)
+        collection.delete()
+        self.assertEqual([row['name'] for row in dashboard(self.owner)],
+                         ['b'])
+
+    def test_change_during_query_not_cached_as_current(self):
+        collection = self._create_collection('a')
+        card = self._create_card(collection)
+
+        def review_meanwhile(user, date):
+            stats = collection_stats(user, date)
+            card.set_review_score(5)
+            return stats
+
+        with mock.patch('kanji.dashboard.collection_stats',
+                        side_effect=review_meanwhile):
+            self.assertEqual(dashboard(self.owner)[0]['due_count'], 1)
+        self.assertEqual(dashboard(self.owner)[0]['due_count'], 0)
+
+    def test_out_of_date_collection_list_dropped(self):
+        collection = self._create_collection('a')
+        self._create_collection('b')
+        key = COLLECTIONS_KEY.format(user=self.owner.pk)
+        # As if 'b' was created after the list was read
+        cache.set(key, [collection.pk])
+        self.assertEqual(len(dashboard(self.owner)), 2)
+        self.assertIsNone(cache.get(key))
+        dashboard(self.owner)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(dashboard(self.owner)), 2)
@@ -0,0 +1,134 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from kanji import reviewlog
+from kanji.dashboard import dashboard
+from kanji.deletion import delete_collection, resume_deletions
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection, ReviewLog
+from kanji.search import search_cards
+
+User = get_user_model()
+
+
+class PurgeMixin(object):
+
+    def _create_cards(self):
+        reviewlog._take()
+        self.owner = User.objects.create(username='owner')
+        self.collection = KanjiCardCollection.objects.create(
+            owner=self.owner, name='default')
+        self.other = KanjiCardCollection.objects.create(
+            owner=self.owner, name='other')
+        for index in range(1, 6):
+            kanji = Kanji.objects.create(character=chr(0x4e00 + index),
+                                         keyword='keyword {}'.format(index),
+                                         heisig_index=index)
+            for collection in (self.collection, self.other):
+                KanjiCard.objects.create(
+                    kanji=kanji, collection=collection,
+                    mnemonic='samurai {}'.format(index))
+        self.collection.set_review_scores(
+            [(card.pk, 5) for card in self.collection.kanjicard_set.all()])
+        reviewlog.flush()
+        self.collection.refresh_from_db()
+
+    def assertPurged(self):
+        self.assertFalse(KanjiCardCollection.objects.filter(
+            pk=self.collection.pk).exists())
+        self.assertFalse(KanjiCard.objects.filter(
+            collection=self.collection.pk).exists())
+        self.assertEqual(self.other.kanjicard_set.count(), 5)
+        # History is kept, detached from the cards
+        self.assertEqual(ReviewLog.objects.filter(
+            user=self.owner, card=None).count(), 5)
+
+
+class PurgeTest(PurgeMixin, TestCase):
+
+    def setUp(self):
+        self._create_cards()
+        cache.clear()
+
+    def test_purge(self):
+        with mock.patch.object(KanjiCard, 'from_db') as from_db:
+            self.collection.purge()
+        self.assertFalse(from_db.called)
+        self.assertPurged()
+
+    def test_purge_in_chunks(self):
+        with mock.patch.object(KanjiCardCollection, 'recount',
+                               wraps=KanjiCardCollection.recount) as recount:
+            self.collection.purge(chunk_size=2)
+        self.assertPurged()
+        # After the first two chunks; the last is smaller
+        self.assertEqual(recount.call_count, 2)
+
+    def test_purge_removes_search_entries(self):
+        self.collection.purge()
+        self.assertEqual(
+            set(card.collection_id
+                for card in search_cards(self.owner, 'samurai')),
+            {self.other.pk})
+
+    def test_buffered_reviews_kept(self):
+        card = self.collection.kanjicard_set.earliest('pk')
+        card.set_review_score(5)
+        delete_collection(self.collection)
+        self.assertEqual(ReviewLog.objects.filter(
+            user=self.owner, card=None).count(), 6)
+
+    def test_delete_collection_invalidates_dashboard(self):
+        dashboard(self.owner)
+        self.assertIsNone(delete_collection(self.collection))
+        self.assertEqual([row['name'] for row in dashboard(self.owner)],
+                         ['other'])
+        self.assertPurged()
+
+
+@override_settings(COLLECTION_DELETE_CHUNK_SIZE=2)
+class BackgroundDeletionTest(PurgeMixin, TransactionTestCase):
+
+    def setUp(self):
+        self._create_cards()
+
+    def test_big_collection_deleted_in_background(self):
+        thread = delete_collection(self.collection)
+        thread.join()
+        self.assertPurged()
+
+    def test_small_collection_deleted_at_once(self):
+        KanjiCard.objects.filter(collection=self.collection).exclude(
+            pk=self.collection.kanjicard_set.earliest('pk').pk).delete()
+        self.collection.refresh_from_db()
+        self.assertIsNone(delete_collection(self.collection))
+        self.assertFalse(KanjiCardCollection.objects.filter(
+            pk=self.collection.pk).exists())
+
+    def _interrupt(self):
+        # The thread stops after the first chunk, as if the worker exited
+        with mock.patch.object(KanjiCardCollection, 'recount',
+                               side_effect=SystemExit):
+            delete_collection(self.collection).join()
+        self.collection.refresh_from_db()
+        self.assertTrue(self.collection.deleting)
+        self.assertEqual(self.collection.kanjicard_set.count(), 3)
+
+    def test_interrupted_deletion_finished_by_command(self):
+        self._interrupt()
+        self.assertFalse(self.other.deleting)
+        out = StringIO()
+        call_command('purge_collections', stdout=out)
+        self.assertEqual(out.getvalue(), 'Deleted 1 collections.\n')
+        self.assertPurged()
+        self.assertEqual(resume_deletions(), 0)
+
+    def test_interrupted_deletion_resumed_by_deleting_again(self):
+        self._interrupt()
+        delete_collection(self.collection).join()
+        self.assertPurged()
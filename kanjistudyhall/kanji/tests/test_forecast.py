@@ -0,0 +1,77 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from kanji.forecast import collection_forecast, forecast
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+
+class ForecastTest(TestCase):
+
+    def setUp(self):
+        self.today = datetime.date.today()
+
+    def _forecast_one_card(self, scores, days=14):
+        return forecast([2.5], [0], [0], [self.today], [self.today],
+                        days=days, today=self.today, scores=scores)
+
+    def test_new_card_follows_sm2_intervals(self):
+        due, reviews = self._forecast_one_card((5,))
+        # 1 day, 6 days, then (streak - 1) * efactor
+        self.assertEqual(list(due.nonzero()[0]), [0, 1, 7, 12])
+        self.assertEqual(list(due), list(reviews))
+
+    def test_missed_card_is_drilled_again_the_same_day(self):
+        due, reviews = self._forecast_one_card((1,), days=3)
+        self.assertEqual(list(due), [1, 1, 1])
+        self.assertEqual(list(reviews), [2, 2, 2])
+
+    def test_overdue_cards_are_due_today(self):
+        last_week = self.today - datetime.timedelta(days=7)
+        due, reviews = forecast([2.5, 2.5], [3, 3], [3, 3],
+                                [last_week] * 2, [last_week, self.today],
+                                days=2, today=self.today)
+        self.assertEqual(due[0], 2)
+
+    def test_empty_collection(self):
+        due, reviews = forecast([], [], [], [], [], days=5, today=self.today)
+        self.assertEqual(list(due), [0] * 5)
+
+
+class CollectionForecastTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(owner=owner,
+                                                             name='default')
+        self._create_card('日', 'day', 12)
+
+    def _create_card(self, character, keyword, index):
+        kanji = Kanji.objects.create(character=character,
+                                     keyword=keyword,
+                                     heisig_index=index)
+        return KanjiCard.objects.create(kanji=kanji,
+                                        mnemonic=keyword,
+                                        collection=self.collection)
+
+    def test_forecast_lists_each_day(self):
+        days = collection_forecast(self.collection, 30)
+        self.assertEqual(len(days), 30)
+        self.assertEqual(days[0]['date'], datetime.date.today())
+        self.assertEqual(days[0]['due'], 1)
+
+    def test_forecast_is_cached(self):
+        collection_forecast(self.collection, 30)
+        with self.assertNumQueries(0):
+            collection_forecast(self.collection, 30)
+
+    def test_forecast_recomputed_when_collection_changes(self):
+        collection_forecast(self.collection, 30)
+        self._create_card('月', 'month', 13)
+        days = collection_forecast(self.collection, 30)
+        self.assertEqual(days[0]['due'], 2)
@@ -0,0 +1,140 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DataError
+from django.test import TestCase
+
+from kanji.exports import export_csv
+from kanji.importers import import_cards
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+
+class ImportCardsTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(owner=self.owner,
+                                                             name='default')
+        for character, keyword, index in (('日', 'day', 12),
+                                          ('月', 'month', 13),
+                                          ('明', 'bright', 14)):
+            Kanji.objects.create(character=character,
+                                 keyword=keyword,
+                                 heisig_index=index)
+
+    def _import(self, text, **kwargs):
+        return import_cards(self.collection, text.splitlines(True), **kwargs)
+
+    def test_import_anki_tab_separated_deck(self):
+        result = self._import('Front\tBack\tEase\tIvl\tDue\tReps\n'
+                              '日\tmidday sun\t2500\t15\t2030-01-02\t9\n'
+                              '月\twaxing moon\t230\t0\t\t1\n')
+        self.assertEqual((result.imported, result.errors), (2, []))
+        sun = KanjiCard.objects.get(kanji__character='日')
+        self.assertEqual(sun.efactor, 2.5)
+        self.assertEqual(sun.consecutive_correct, 7)
+        self.assertEqual(sun.total_reviews, 9)
+        self.assertEqual(sun.next_review, datetime.date(2030, 1, 2))
+        moon = KanjiCard.objects.get(kanji__character='月')
+        self.assertEqual(moon.efactor, 2.3)
+        self.assertEqual(moon.consecutive_correct, 0)
+        self.assertEqual(moon.next_review, datetime.date.today())
+
+    def test_anki_due_days_counted_from_the_collection_creation(self):
+        deck = ('Front\tBack\tIvl\tDue\n'
+                '日\tmidday sun\t15\t1500\n'
+                '月\twaxing moon\t0\t3\n')
+        result = self._import(deck, day_zero=datetime.date(2020, 1, 1))
+        self.assertEqual((result.imported, result.errors), (2, []))
+        sun = KanjiCard.objects.get(kanji__character='日')
+        self.assertEqual(sun.next_review, datetime.date(2024, 2, 9))
+        # A new card's due is its place in the queue
+        moon = KanjiCard.objects.get(kanji__character='月')
+        self.assertEqual(moon.next_review, datetime.date.today())
+
+    def test_anki_due_days_without_creation_day_use_interval(self):
+        self._import('Front\tBack\tIvl\tDue\n日\tmidday sun\t15\t1500\n')
+        sun = KanjiCard.objects.get(kanji__character='日')
+        self.assertEqual(sun.next_review,
+                         datetime.date.today() + datetime.timedelta(days=15))
+
+    def test_anki_learning_card_due_time(self):
+        due = datetime.datetime(2030, 1, 2, 12)
+        self._import('Front\tBack\tIvl\tDue\n日\tmidday sun\t0\t{}\n'
+                     .format(int(due.timestamp())))
+        sun = KanjiCard.objects.get(kanji__character='日')
+        self.assertEqual(sun.next_review, datetime.date(2030, 1, 2))
+
+    def test_bad_anki_due_reported(self):
+        result = self._import('Front\tBack\tIvl\tDue\n'
+                              '日\tmidday sun\t15\tsoon\n'
+                              '月\twaxing moon\t15\t99999999999999\n',
+                              day_zero=datetime.date(2020, 1, 1))
+        self.assertEqual(result.imported, 0)
+        self.assertEqual([line for line, message in result.errors], [2, 3])
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        result = self._import('kanji,story,ease\n'
+                              '日,midday sun,2500\n'
+                              '火,fire,2500\n'
+                              '月,midday sun,2500\n'
+                              '明,sun and moon,lots\n'
+                              '日,again,2500\n'
+                              '月,waxing moon,2500\n')
+        self.assertEqual(result.imported, 2)
+        self.assertEqual([line for line, message in result.errors],
+                         [3, 4, 5, 6])
+        self.assertEqual(self.collection.kanjicard_set.count(), 2)
+
+    def test_numbers_out_of_range_are_reported(self):
+        result = self._import('character,mnemonic,efactor,interval,reps\n'
+                              '日,midday sun,nan,1,1\n'
+                              '月,waxing moon,2.5,inf,1\n'
+                              '明,sun and moon,2.5,nan,1\n'
+                              '日,noon,2.5,1e300,1\n'
+                              '月,new moon,2.5,1,99999999999\n')
+        self.assertEqual(result.imported, 0)
+        self.assertEqual([line for line, message in result.errors],
+                         [2, 3, 4, 5, 6])
+
+    def test_rows_the_database_rejects_are_reported(self):
+        with mock.patch.object(KanjiCard.objects, 'bulk_create',
+                               side_effect=DataError), \
+                mock.patch.object(KanjiCard, 'save', side_effect=[
+                    DataError, None]):
+            result = self._import('character,mnemonic\n'
+                                  '日,midday sun\n月,waxing moon\n')
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(result.errors, [(2, "a value is out of range")])
+
+    def test_import_in_batches(self):
+        result = self._import('character,mnemonic\n'
+                              '日,midday sun\n月,waxing moon\n明,sun+moon\n',
+                              batch_size=2)
+        self.assertEqual(result.imported, 3)
+
+    def test_header_without_mnemonic_rejected(self):
+        result = self._import('character,ease\n日,2500\n')
+        self.assertEqual(result.imported, 0)
+        self.assertEqual(result.error_count, 1)
+
+    def test_export_imports_into_new_collection(self):
+        card = KanjiCard.objects.create(
+            kanji=Kanji.objects.get(character='明'),
+            mnemonic='sun and moon',
+            collection=self.collection,
+            consecutive_correct=4,
+            efactor=1.9,
+            next_review=datetime.date(2031, 5, 6))
+        exported = ''.join(export_csv(self.collection))
+        self.collection = KanjiCardCollection.objects.create(owner=self.owner,
+                                                             name='copy')
+        result = self._import(exported)
+        self.assertEqual(result.imported, 1)
+        copy = self.collection.kanjicard_set.get()
+        self.assertEqual(
+            [getattr(copy, f) for f in KanjiCard.SCHEDULE_FIELDS],
+            [getattr(card, f) for f in KanjiCard.SCHEDULE_FIELDS])
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from prometheus_client import REGISTRY
+
+from kanji import metrics
+from kanji.models import KanjiCardCollection
+from kanji.pool import ConnectionPool
+
+User = get_user_model()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TimedCursorTest(TestCase):
+
+    def test_counts_queries(self):
+        metrics.instrument(connection)
+        metrics.start_request()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+            cursor.executemany(
+                'UPDATE kanji_kanji SET keyword = keyword WHERE id = %s',
+                [(1,), (2,)])
+        self.assertEqual(metrics._local.queries, 2)
+        self.assertGreater(metrics._local.db_time, 0)
+
+    def test_instruments_once(self):
+        metrics.instrument(connection)
+        make_cursor = connection.make_cursor
+        metrics.instrument(connection)
+        self.assertIs(connection.make_cursor, make_cursor)
+
+
+class MetricsMiddlewareTest(TestCase):
+
+    def setUp(self):
+        password = 'password'
+        user = User.objects.create_user(username='user', password=password)
+        self.client.login(username=user.username, password=password)
+        KanjiCardCollection.objects.create(owner=user, name='default')
+
+    def test_records_view_latency_and_queries(self):
+        count = sample('kanji_request_duration_seconds_count',
+                       view='get_collections', method='GET')
+        queries = sample('kanji_request_queries_sum', view='get_collections')
+        responses = sample('kanji_responses_total',
+                           view='get_collections', status='200')
+        self.client.get(reverse('get_collections'))
+        self.assertEqual(sample('kanji_request_duration_seconds_count',
+                                view='get_collections', method='GET'),
+                         count + 1)
+        self.assertGreater(sample('kanji_request_queries_sum',
+                                  view='get_collections'), queries)
+        self.assertEqual(sample('kanji_responses_total',
+                                view='get_collections', status='200'),
+                         responses + 1)
+
+    def test_unmatched_urls_share_a_label(self):
+        count = sample('kanji_responses_total',
+                       view=metrics.UNMATCHED, status='404')
+        self.client.get('/no/such/page/')
+        self.client.get('/nor/this/one/')
+        self.assertEqual(sample('kanji_responses_total',
+                                view=metrics.UNMATCHED, status='404'),
+                         count + 2)
+
+
+class MetricsViewTest(TestCase):
+
+    def test_renders_metrics(self):
+        self.client.get('/')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         metrics.CONTENT_TYPE_LATEST)
+        self.assertIn(b'kanji_request_duration_seconds_bucket{',
+                      response.content)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_forbidden_to_other_addresses(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_reads_worker_files_in_multiprocess_mode(self):
+        self.client.get('/')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.dict(os.environ,
+                             {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            body, content_type = metrics.render()
+        # No worker has written to the directory yet
+        self.assertNotIn(b'kanji_request_duration_seconds', body)
+
+
+class PoolCollectorTest(TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(mock.Mock, max_size=4)
+        patcher = mock.patch.dict(
+            'kanji.backends.postgresql_pool.base._pools',
+            {('default', 'kanji'): self.pool})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reports_pools(self):
+        connection = self.pool.checkout()
+        self.pool.checkin(connection)
+        self.pool.checkout()
+        for metric, value in (('kanji_db_pool_size', 1),
+                              ('kanji_db_pool_idle', 0),
+                              ('kanji_db_pool_max_size', 4),
+                              ('kanji_db_pool_checkouts_total', 2),
+                              ('kanji_db_pool_connects_total', 1)):
+            self.assertEqual(REGISTRY.get_sample_value(
+                metric, {'database': 'default', 'name': 'kanji'}), value)
+
+    def test_labelled_by_pid_in_multiprocess_mode(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.dict(os.environ,
+                             {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            body, content_type = metrics.render()
+        self.assertIn(
+            'kanji_db_pool_max_size{{database="default",name="kanji",'
+            'pid="{}"}} 4.0'.format(os.getpid()).encode(), body)
@@ -3,9 +3,12 @@ import datetime
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.db.utils import DataError, IntegrityError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
+from kanji import reviewlog
 from kanji.models import Kanji, KanjiCard, KanjiCardCollection
 
 User = get_user_model()
@@ -76,6 +79,10 @@ class KanjiTest(TestCase):
         
 class KanjiCardTest(TestCase):
 
+    def tearDown(self):
+        # Scoring buffers review log entries; see kanji.reviewlog
+        reviewlog._take()
+
     def _create_collection(self):
         owner = User.objects.create()
         collection = KanjiCardCollection(owner=owner, name='default')
@@ -193,13 +200,26 @@ class KanjiCardTest(TestCase):
                                   default_collection=collection)
         card1.efactor = 2.6
         card1.consecutive_correct = 6
+        card1.save()
         card2.efactor = 2.6
         card2.consecutive_correct = 6
+        card2.save()
         card1.set_review_score(5)
         card2.set_review_score(4)
         self.assertTrue(card1.next_review > card2.next_review)
 
 
+    def test_review_scores_from_the_saved_row(self):
+        card = self._create_card()
+        # Unsaved changes to the schedule are not what gets scored
+        card.efactor = 2.0
+        card.consecutive_correct = 6
+        card.set_review_score(5)
+        self.assertEqual(card.consecutive_correct, 1)
+        self.assertAlmostEqual(card.efactor, 2.6)
+        card.refresh_from_db()
+        self.assertEqual(card.consecutive_correct, 1)
+
     def test_review_total_increments_correctly(self):
         card = self._create_card()
         review_total = card.total_reviews
@@ -320,3 +340,226 @@ class KanjiCardCollectionTest(TestCase):
         second_card.set_review_score(4)
         third_card = collection.next_scheduled_card()
         self.assertEqual(third_card, first_card)
+
+    def test_next_card_after_cursor_skips_to_following_card(self):
+        collection = self._create_collection()
+        kanji1 = Kanji.objects.create(character='日',
+                                      keyword='day',
+                                      heisig_index=12)
+        kanji2 = Kanji.objects.create(character='月',
+                                      keyword='month',
+                                      heisig_index=13)
+        card1 = KanjiCard.objects.create(kanji=kanji1,
+                                         mnemonic='midday sun',
+                                         collection=collection,
+                                         consecutive_correct=1)
+        card2 = KanjiCard.objects.create(kanji=kanji2,
+                                         mnemonic='waxing moon',
+                                         collection=collection)
+        self.assertEqual(collection.next_scheduled_card(), card2)
+        self.assertEqual(collection.next_scheduled_card(after=card2), card1)
+        self.assertEqual(collection.next_scheduled_card(after=card1), None)
+
+    def test_review_queue_order_matches_next_scheduled_card(self):
+        collection = self._create_collection()
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        kanji = [
+            Kanji.objects.create(character=c, keyword=k, heisig_index=i)
+            for c, k, i in (('一', 'one', 1), ('二', 'two', 2),
+                            ('三', 'three', 3), ('四', 'four', 4))
+        ]
+        states = (
+            (yesterday, 0, 2.5),
+            (yesterday, 0, 1.9),
+            (datetime.date.today(), 3, 2.5),
+            (yesterday, 1, 1.3),
+        )
+        for k, (last_missed, streak, efactor) in zip(kanji, states):
+            card = KanjiCard.objects.create(kanji=k,
+                                            mnemonic=k.keyword,
+                                            collection=collection,
+                                            consecutive_correct=streak,
+                                            efactor=efactor)
+            card.last_missed = last_missed
+            card.save()
+        walked = []
+        card = collection.next_scheduled_card()
+        while card is not None:
+            walked.append(card.kanji.keyword)
+            card = collection.next_scheduled_card(after=card)
+        self.assertEqual(walked, ['three', 'two', 'one', 'four'])
+
+    def test_overdue_card_is_still_offered(self):
+        collection = self._create_collection()
+        kanji1 = Kanji.objects.create(character='日',
+                                      keyword='day',
+                                      heisig_index=12)
+        card1 = KanjiCard.objects.create(kanji=kanji1,
+                                         mnemonic='midday sun',
+                                         collection=collection)
+        card1.next_review = datetime.date.today() - datetime.timedelta(days=3)
+        card1.save()
+        self.assertEqual(collection.next_scheduled_card(), card1)
+
+    def test_most_overdue_card_reviewed_first(self):
+        collection = self._create_collection()
+        today = datetime.date.today()
+        kanji1 = Kanji.objects.create(character='日',
+                                      keyword='day',
+                                      heisig_index=12)
+        kanji2 = Kanji.objects.create(character='月',
+                                      keyword='month',
+                                      heisig_index=13)
+        card1 = KanjiCard.objects.create(kanji=kanji1,
+                                         mnemonic='midday sun',
+                                         collection=collection)
+        card2 = KanjiCard.objects.create(kanji=kanji2,
+                                         mnemonic='waxing moon',
+                                         collection=collection)
+        card1.next_review = today - datetime.timedelta(days=1)
+        card1.save()
+        card2.next_review = today - datetime.timedelta(days=5)
+        card2.save()
+        self.assertEqual(collection.next_scheduled_card(), card2)
+        self.assertEqual(collection.next_scheduled_card(after=card2), card1)
+
+    def _create_scored_cards(self, collection):
+        states = ((0, 2.5), (1, 2.36), (2, 1.3), (5, 2.18), (11, 2.7))
+        cards = []
+        for i, (streak, efactor) in enumerate(states):
+            kanji, _ = Kanji.objects.get_or_create(character=chr(0x4E00 + i),
+                                                   keyword='kanji{}'.format(i),
+                                                   heisig_index=i + 1)
+            cards.append(KanjiCard.objects.create(kanji=kanji,
+                                                  mnemonic=str(i),
+                                                  collection=collection,
+                                                  consecutive_correct=streak,
+                                                  efactor=efactor))
+        return cards
+
+    def test_batch_review_matches_single_reviews(self):
+        owner = User.objects.create()
+        single = KanjiCardCollection.objects.create(owner=owner, name='a')
+        batch = KanjiCardCollection.objects.create(owner=owner, name='b')
+        single_cards = self._create_scored_cards(single)
+        batch_cards = self._create_scored_cards(batch)
+        for score in range(6):
+            for card in single_cards:
+                card.set_review_score(score)
+            batch.set_review_scores([(card.pk, score) for card in batch_cards])
+        fields = KanjiCard.SCHEDULE_FIELDS
+        for expected, actual in zip(single_cards, batch_cards):
+            actual.refresh_from_db()
+            self.assertEqual([getattr(expected, f) for f in fields],
+                             [getattr(actual, f) for f in fields])
+
+    def test_batch_review_with_invalid_score_writes_nothing(self):
+        collection = self._create_collection()
+        cards = self._create_scored_cards(collection)
+        with self.assertRaises(ValueError):
+            collection.set_review_scores([(cards[0].pk, 4), (cards[1].pk, 6)])
+        cards[0].refresh_from_db()
+        self.assertEqual(cards[0].total_reviews, 0)
+
+    def test_batch_review_of_card_from_other_collection_fails(self):
+        collection = self._create_collection()
+        other = KanjiCardCollection.objects.create(owner=collection.owner,
+                                                   name='other')
+        card = self._create_scored_cards(other)[0]
+        with self.assertRaises(KanjiCard.DoesNotExist):
+            collection.set_review_scores([(card.pk, 4)])
+
+    def test_batch_review_is_one_update(self):
+        collection = self._create_collection()
+        cards = self._create_scored_cards(collection)
+        with CaptureQueriesContext(connection) as queries:
+            collection.set_review_scores([(card.pk, 5) for card in cards])
+        updates = [q for q in queries if 'UPDATE "kanji_kanjicard"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+
+    def _create_heisig_kanji(self):
+        for i, (character, keyword) in enumerate(
+                (('一', 'one'), ('二', 'two'), ('三', 'three'),
+                 ('四', 'four'), ('五', 'five')), 1):
+            Kanji.objects.create(character=character,
+                                 keyword=keyword,
+                                 heisig_index=i)
+
+    def test_add_heisig_range_creates_cards(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        self.assertEqual(collection.add_heisig_range(2, 4), (3, 0))
+        cards = collection.kanjicard_set.order_by('kanji__heisig_index')
+        self.assertEqual([card.kanji.keyword for card in cards],
+                         ['two', 'three', 'four'])
+        self.assertEqual(cards[0].mnemonic, 'Write a story for "two"')
+        self.assertEqual(cards[0].next_review, datetime.date.today())
+        self.assertEqual(cards[0].efactor, 2.5)
+        self.assertEqual(collection.next_scheduled_card(), cards[0])
+
+    def test_add_heisig_range_skips_existing_cards(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        KanjiCard.objects.create(kanji=Kanji.objects.get(heisig_index=2),
+                                 mnemonic='two sticks',
+                                 collection=collection)
+        self.assertEqual(collection.add_heisig_range(1, 3), (2, 1))
+        self.assertEqual(collection.add_heisig_range(1, 5), (2, 3))
+        self.assertEqual(collection.kanjicard_set.count(), 5)
+
+    def test_add_heisig_range_is_one_insert(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        with CaptureQueriesContext(connection) as queries:
+            collection.add_heisig_range(1, 5)
+        inserts = [q for q in queries if 'INSERT' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+
+    def test_chunked_iterates_over_every_card_once(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        collection.add_heisig_range(1, 5)
+        with self.assertNumQueries(3):
+            cards = list(collection.kanjicard_set.chunked(size=2))
+        self.assertEqual(
+            [card.pk for card in cards],
+            list(collection.kanjicard_set.order_by('pk').values_list(
+                'pk', flat=True)))
+
+    def _heisig_indexes(self, cards):
+        return [card.kanji.heisig_index for card in cards]
+
+    def test_heisig_page_walks_forward(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        collection.add_heisig_range(1, 5)
+        cards = collection.kanjicard_set
+        page, more = cards.heisig_page(size=2)
+        self.assertEqual((self._heisig_indexes(page), more), ([1, 2], True))
+        last = page[-1]
+        page, more = cards.heisig_page(after=(2, last.pk), size=2)
+        self.assertEqual((self._heisig_indexes(page), more), ([3, 4], True))
+        page, more = cards.heisig_page(after=(4, page[-1].pk), size=2)
+        self.assertEqual((self._heisig_indexes(page), more), ([5], False))
+
+    def test_heisig_page_walks_backward(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        collection.add_heisig_range(1, 5)
+        cards = collection.kanjicard_set
+        fifth = cards.get(kanji__heisig_index=5)
+        page, more = cards.heisig_page(before=(5, fifth.pk), size=2)
+        self.assertEqual((self._heisig_indexes(page), more), ([3, 4], True))
+        page, more = cards.heisig_page(before=(3, page[0].pk), size=2)
+        self.assertEqual((self._heisig_indexes(page), more), ([1, 2], False))
+
+    def test_heisig_page_is_one_query(self):
+        collection = self._create_collection()
+        self._create_heisig_kanji()
+        collection.add_heisig_range(1, 5)
+        second = collection.kanjicard_set.get(kanji__heisig_index=2)
+        with self.assertNumQueries(1):
+            page, more = collection.kanjicard_set.heisig_page(
+                after=(2, second.pk), size=2)
+            self.assertEqual([card.kanji.keyword for card in page],
+                             ['three', 'four'])
@@ -0,0 +1,318 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+from psycopg2 import extensions
+
+from kanji.backends.postgresql_pool import base as backend
+from kanji.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection(object):
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.working = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.time = 1000.0
+        patcher = mock.patch('kanji.pool.time.monotonic',
+                             side_effect=lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _connect(self):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def _ping(self, connection):
+        if not connection.working:
+            raise IOError("connection lost")
+
+    def _pool(self, **kwargs):
+        kwargs.setdefault('ping', self._ping)
+        kwargs.setdefault('is_broken', lambda connection: connection.closed)
+        return ConnectionPool(self._connect, **kwargs)
+
+    def test_connections_are_reused(self):
+        pool = self._pool()
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.stats['checkouts'], 2)
+        self.assertEqual(pool.stats['connects'], 1)
+
+    def test_grows_to_max_size(self):
+        pool = self._pool(max_size=2)
+        pool.checkout()
+        pool.checkout()
+        self.assertEqual(pool.size, 2)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_waits_for_a_free_connection(self):
+        pool = self._pool(max_size=1, timeout=5)
+        connection = pool.checkout()
+        checked_out = []
+        waiter = threading.Thread(
+            target=lambda: checked_out.append(pool.checkout()))
+        waiter.start()
+        while not pool.stats['waits']:
+            pass
+        pool.checkin(connection)
+        waiter.join()
+        self.assertEqual(checked_out, [connection])
+        self.assertEqual(pool.stats['waits'], 1)
+
+    def test_times_out_when_exhausted(self):
+        pool = self._pool(max_size=1, timeout=0)
+        pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats['timeouts'], 1)
+
+    def test_idle_connections_are_pinged(self):
+        pool = self._pool(check_idle=30)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.time += 10
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(pool.stats['pings'], 0)
+        pool.checkin(connection)
+        self.time += 31
+        connection.working = False
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats['pings'], 1)
+        self.assertEqual(pool.stats['errors'], 1)
+        self.assertEqual(pool.size, 1)
+
+    def test_every_checkout_pinged_by_default(self):
+        pool = self._pool()
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(pool.stats['pings'], 1)
+
+    def test_ping_does_not_hold_up_other_checkouts(self):
+        pinging = threading.Event()
+        release = threading.Event()
+
+        def slow_ping(connection):
+            pinging.set()
+            release.wait(5)
+
+        pool = self._pool(max_size=2, ping=slow_ping)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        checked_out = []
+        pinger = threading.Thread(
+            target=lambda: checked_out.append(pool.checkout()))
+        pinger.start()
+        self.assertTrue(pinging.wait(5))
+        # Opens a second connection while the first is being pinged
+        other = threading.Thread(
+            target=lambda: checked_out.append(pool.checkout()))
+        other.start()
+        other.join(2)
+        self.assertEqual(len(checked_out), 1)
+        self.assertIsNot(checked_out[0], connection)
+        release.set()
+        pinger.join()
+        self.assertIs(checked_out[1], connection)
+        self.assertEqual(pool.size, 2)
+
+    def test_failed_ping_tries_the_next_idle_connection(self):
+        pool = self._pool()
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+        second.working = False
+        self.assertIs(pool.checkout(), first)
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_no_pings_without_ping(self):
+        pool = self._pool(ping=None)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.time += 3600
+        pool.max_lifetime = 7200
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(pool.stats['pings'], 0)
+
+    def test_broken_connections_are_replaced(self):
+        pool = self._pool()
+        connection = pool.checkout()
+        connection.close()
+        pool.checkin(connection)
+        self.assertEqual(pool.idle, 0)
+        self.assertEqual(pool.size, 0)
+        self.assertIsNot(pool.checkout(), connection)
+
+    def test_old_connections_are_replaced(self):
+        pool = self._pool(max_lifetime=600)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.time += 601
+        self.assertIsNot(pool.checkout(), connection)
+        self.assertTrue(connection.closed)
+
+    def test_connections_that_cannot_be_reset_are_closed(self):
+        pool = self._pool(reset=lambda connection: False)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(mock.Mock(side_effect=IOError), max_size=1)
+        with self.assertRaises(IOError):
+            pool.checkout()
+        self.assertEqual(pool.size, 0)
+        self.assertEqual(pool.stats['errors'], 1)
+
+    def test_close_idle(self):
+        pool = self._pool()
+        connection = pool.checkout()
+        pool.checkin(connection)
+        pool.close_idle()
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.size, 0)
+
+
+class FakeCursor(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append(sql)
+
+    def close(self):
+        pass
+
+
+class FakePsycopgConnection(FakeConnection):
+    """Just enough of a psycopg2 connection for the pooled backend."""
+
+    def __init__(self, number):
+        super(FakePsycopgConnection, self).__init__(number)
+        self.autocommit = False
+        self.isolation_level = extensions.ISOLATION_LEVEL_READ_COMMITTED
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+        self.rolled_back = False
+        self.sessions = []
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.transaction_status
+
+    def rollback(self):
+        self.rolled_back = True
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def set_session(self, **kwargs):
+        self.sessions.append(kwargs)
+
+    def set_client_encoding(self, encoding):
+        pass
+
+    def get_parameter_status(self, parameter):
+        return 'UTC'
+
+
+class PooledDatabaseWrapperTest(SimpleTestCase):
+
+    def setUp(self):
+        self.opened = []
+        patcher = mock.patch.object(backend.Database, 'connect',
+                                    side_effect=self._connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(backend._pools.pop, ('pooltest', 'kanji'), None)
+
+    def _connect(self, **kwargs):
+        connection = FakePsycopgConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def _wrapper(self, **options):
+        return backend.DatabaseWrapper({
+            'ENGINE': 'kanji.backends.postgresql_pool',
+            'NAME': 'kanji', 'USER': '', 'PASSWORD': '', 'HOST': '',
+            'PORT': '', 'OPTIONS': options, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 0, 'TIME_ZONE': 'UTC',
+            'POOL': {'MAX_SIZE': 1, 'TIMEOUT': 0},
+        }, 'pooltest')
+
+    def test_closing_returns_the_connection_to_the_pool(self):
+        first = self._wrapper()
+        first.ensure_connection()
+        connection = first.connection
+        first.close()
+        self.assertFalse(connection.closed)
+        second = self._wrapper()
+        second.ensure_connection()
+        self.assertIs(second.connection, connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_open_transaction_rolled_back_on_checkin(self):
+        wrapper = self._wrapper()
+        connection = wrapper.get_new_connection({})
+        connection.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        wrapper.connection = connection
+        wrapper._close()
+        self.assertTrue(connection.rolled_back)
+        self.assertFalse(connection.autocommit)
+        self.assertEqual(wrapper.pool.idle, 1)
+
+    def test_broken_connection_discarded(self):
+        wrapper = self._wrapper()
+        connection = wrapper.get_new_connection({})
+        connection.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+        wrapper.connection = connection
+        wrapper._close()
+        self.assertTrue(connection.closed)
+        self.assertEqual(wrapper.pool.size, 0)
+
+    def test_connection_pinged_on_checkout(self):
+        wrapper = self._wrapper()
+        connection = wrapper.get_new_connection({})
+        wrapper.connection = connection
+        wrapper._close()
+        self.assertIs(wrapper.get_new_connection({}), connection)
+        self.assertEqual(connection.statements, ['SELECT 1'])
+
+    def test_exhausted_pool_is_an_operational_error(self):
+        wrapper = self._wrapper()
+        wrapper.get_new_connection({})
+        with self.assertRaises(backend.Database.OperationalError):
+            wrapper.get_new_connection({})
+
+    def test_isolation_level_option(self):
+        level = extensions.ISOLATION_LEVEL_SERIALIZABLE
+        wrapper = self._wrapper(isolation_level=level)
+        connection = wrapper.get_new_connection({})
+        self.assertEqual(connection.sessions, [{'isolation_level': level}])
+        self.assertEqual(wrapper.isolation_level, level)
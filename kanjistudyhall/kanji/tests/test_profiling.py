@@ -0,0 +1,177 @@
+import cProfile
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from kanji import profiling
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+
+class ProfilingTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(PROFILING_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _login_user(self, username, is_staff=False):
+        password = 'pass'
+        user = User.objects.create_user(username=username, password=password)
+        user.is_staff = is_staff
+        user.save()
+        self.client.login(username=user.username, password=password)
+        return user
+
+
+def _work():
+    return sorted(str(number) for number in range(1000))
+
+
+class StoreTest(ProfilingTestCase):
+
+    def _profile(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        _work()
+        profiler.disable()
+        return profiler
+
+    def test_saves_and_lists_profiles(self):
+        first = profiling.save(self._profile(), 'get_collection', 0.1234)
+        second = profiling.save(self._profile(), 'review_collection', 0.05)
+        self.assertEqual([profile.name for profile in profiling.profiles()],
+                         [second, first])
+        profile = profiling.profiles()[1]
+        self.assertEqual(profile.view, 'get_collection')
+        self.assertEqual(profile.duration, 123)
+        self.assertEqual(profile.pid, os.getpid())
+
+    @override_settings(PROFILING_MAX_FILES=2)
+    def test_keeps_only_the_newest(self):
+        names = [profiling.save(self._profile(), 'view', 0.01)
+                 for _ in range(3)]
+        self.assertEqual([profile.name for profile in profiling.profiles()],
+                         names[:0:-1])
+
+    def test_path_rejects_other_files(self):
+        name = profiling.save(self._profile(), 'view', 0.01)
+        self.assertIsNotNone(profiling.path(name))
+        self.assertIsNone(profiling.path('../' + name))
+        self.assertIsNone(profiling.path('missing.prof'))
+
+    def test_folded_stacks(self):
+        name = profiling.save(self._profile(), 'view', 0.01)
+        folded = profiling.folded_stacks(profiling.load(name))
+        lines = folded.splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, microseconds = line.rsplit(' ', 1)
+            self.assertGreater(int(microseconds), 0)
+        self.assertTrue(any('_work' in line for line in lines))
+
+
+class ProfilingMiddlewareTest(ProfilingTestCase):
+
+    def _create_card(self, user):
+        collection = KanjiCardCollection.objects.create(owner=user,
+                                                        name='default')
+        kanji = Kanji.objects.create(character='日', keyword='day',
+                                     heisig_index=12)
+        KanjiCard.objects.create(kanji=kanji, collection=collection)
+        return collection
+
+    def test_profiles_staff_with_a_token(self):
+        user = self._login_user('staff', is_staff=True)
+        collection = self._create_card(user)
+        response = self.client.get(
+            reverse('get_collection', kwargs={'slug': collection.name}),
+            {'profile': profiling.make_token(user)})
+        [profile] = profiling.profiles()
+        self.assertEqual(profile.view, 'get_collection')
+        self.assertEqual(response['X-Profile-Name'], profile.name)
+        folded = profiling.folded_stacks(profiling.load(profile.name))
+        self.assertIn('heisig_page', folded)
+
+    def test_token_in_a_header(self):
+        user = self._login_user('staff', is_staff=True)
+        self.client.get('/', HTTP_X_PROFILE=profiling.make_token(user))
+        self.assertEqual(len(profiling.profiles()), 1)
+
+    def test_ignores_tokens_of_non_staff(self):
+        user = self._login_user('user')
+        self.client.get('/', {'profile': profiling.make_token(user)})
+        self.assertEqual(profiling.profiles(), [])
+
+    def test_ignores_other_users_tokens(self):
+        other = User.objects.create(username='other', is_staff=True)
+        self._login_user('staff', is_staff=True)
+        self.client.get('/', {'profile': profiling.make_token(other)})
+        self.assertEqual(profiling.profiles(), [])
+
+    def test_ignores_expired_tokens(self):
+        user = self._login_user('staff', is_staff=True)
+        token = profiling.make_token(user)
+        with override_settings(PROFILING_TOKEN_MAX_AGE=-1):
+            self.client.get('/', {'profile': token})
+        self.assertEqual(profiling.profiles(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=10)
+    def test_samples_requests(self):
+        with mock.patch('random.randrange', side_effect=[0, 3]):
+            first = self.client.get('/')
+            self.client.get('/')
+        self.assertEqual(len(profiling.profiles()), 1)
+        # Only staff are told which profile their request made
+        self.assertNotIn('X-Profile-Name', first)
+
+    def test_off_by_default(self):
+        self.client.get('/')
+        self.assertEqual(profiling.profiles(), [])
+
+
+class ProfileViewsTest(ProfilingTestCase):
+
+    def setUp(self):
+        super(ProfileViewsTest, self).setUp()
+        self.user = self._login_user('staff', is_staff=True)
+        self.client.get('/', {'profile': profiling.make_token(self.user)})
+        [self.profile] = profiling.profiles()
+
+    def test_lists_profiles(self):
+        response = self.client.get(reverse('profiles'))
+        self.assertContains(response, self.profile.name)
+
+    def test_downloads_pstats(self):
+        response = self.client.get(
+            reverse('download_profile', kwargs={'name': self.profile.name}))
+        self.assertEqual(response.status_code, 200)
+        with open(profiling.path(self.profile.name), 'rb') as f:
+            self.assertEqual(b''.join(response.streaming_content), f.read())
+
+    def test_downloads_folded_stacks(self):
+        response = self.client.get(
+            reverse('download_profile', kwargs={'name': self.profile.name}),
+            {'format': 'folded'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.folded"', response['Content-Disposition'])
+        self.assertTrue(response.content)
+
+    def test_unknown_profile(self):
+        response = self.client.get(
+            reverse('download_profile', kwargs={'name': 'missing.prof'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_staff_only(self):
+        self._login_user('user')
+        response = self.client.get(reverse('profiles'))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,165 @@
+import copy
+import datetime
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from kanji import reviewlog
+from kanji.models import (Kanji, KanjiCard, KanjiCardCollection,
+                          KanjiCardQuerySet)
+
+User = get_user_model()
+
+
+class DatabaseReviewParityTest(TestCase):
+    """KanjiCardQuerySet.review must leave every card exactly as
+    KanjiCard.set_review_score would.
+
+    """
+    STREAKS = (0, 1, 2, 3, 4, 7, 15)
+    # 1.4999999999999998 is what repeated SM2 updates really produce, and
+    # lands an interval a hair below a whole number of days.
+    EFACTORS = (1.3, 1.36, 1.4999999999999998, 1.7, 2.18, 2.5, 2.96)
+
+    def setUp(self):
+        owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(owner=owner,
+                                                             name='default')
+        self.kanji = Kanji.objects.create(character='日',
+                                          keyword='day',
+                                          heisig_index=12)
+        self.long_ago = datetime.date.today() - datetime.timedelta(days=40)
+
+    def _create_card(self, streak, efactor):
+        card = KanjiCard.objects.create(kanji=self.kanji,
+                                        mnemonic='midday sun',
+                                        collection=self.collection,
+                                        total_reviews=streak + 3,
+                                        consecutive_correct=streak,
+                                        efactor=efactor)
+        card.last_missed = self.long_ago
+        card.last_reviewed = self.long_ago
+        card.save()
+        return card
+
+    def _assert_same_schedule(self, expected, actual):
+        for field in KanjiCard.SCHEDULE_FIELDS:
+            self.assertEqual(getattr(expected, field), getattr(actual, field),
+                             '{} differs'.format(field))
+
+    def test_review_matches_python_schedule(self):
+        for score in range(6):
+            for streak in self.STREAKS:
+                for efactor in self.EFACTORS:
+                    card = self._create_card(streak, efactor)
+                    expected = copy.copy(card)
+                    expected._calculate_next_review(score)
+                    [returned] = KanjiCard.objects.filter(
+                        pk=card.pk).review(score)
+                    with self.subTest(score=score, streak=streak,
+                                      efactor=efactor):
+                        self._assert_same_schedule(expected, returned)
+                        card.refresh_from_db()
+                        self._assert_same_schedule(expected, card)
+                    card.delete()
+
+    def test_repeated_reviews_match_python_schedule(self):
+        scores = (5, 4, 3, 5, 5, 1, 4, 5, 5, 3, 4, 5)
+        expected = self._create_card(0, 2.5)
+        card = expected
+        for score in scores:
+            expected = copy.copy(expected)
+            expected._calculate_next_review(score)
+            [card] = KanjiCard.objects.filter(pk=card.pk).review(score)
+            self._assert_same_schedule(expected, card)
+
+    def test_review_rejects_invalid_score(self):
+        card = self._create_card(0, 2.5)
+        with self.assertRaises(ValueError):
+            KanjiCard.objects.filter(pk=card.pk).review(6)
+
+    def test_review_is_one_statement(self):
+        card = self._create_card(3, 2.5)
+        with CaptureQueriesContext(connection) as queries:
+            KanjiCard.objects.filter(pk=card.pk).review(5)
+        # The rest are the locking read of the old values, and the
+        # collection's counters
+        cards = [q for q in queries
+                 if 'UPDATE "kanji_kanjicard"' in q['sql']]
+        self.assertEqual(len(cards), 1)
+
+    def test_review_without_returning_matches_python_schedule(self):
+        card = self._create_card(3, 1.4999999999999998)
+        expected = copy.copy(card)
+        expected._calculate_next_review(5)
+        with mock.patch.object(KanjiCardQuerySet, '_supports_returning',
+                               return_value=False):
+            [returned] = KanjiCard.objects.filter(pk=card.pk).review(5)
+        self._assert_same_schedule(expected, returned)
+
+    def test_stale_instances_dont_lose_reviews(self):
+        card = self._create_card(3, 2.5)
+        first = KanjiCard.objects.get(pk=card.pk)
+        second = KanjiCard.objects.get(pk=card.pk)
+        first.set_review_score(5)
+        # second still holds the row as it was before the first review
+        second.set_review_score(5)
+        card.refresh_from_db()
+        self.assertEqual(card.total_reviews, 8)
+        self.assertEqual(card.consecutive_correct, 5)
+        self.assertEqual(second.consecutive_correct, 5)
+
+    def test_review_of_deleted_card(self):
+        card = self._create_card(3, 2.5)
+        KanjiCard.objects.filter(pk=card.pk).delete()
+        with self.assertRaises(KanjiCard.DoesNotExist):
+            card.set_review_score(5)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            "The old values come back from the UPDATE only on PostgreSQL")
+class PostgreSQLReviewTest(TestCase):
+
+    def setUp(self):
+        reviewlog._take()
+        owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(owner=owner,
+                                                             name='default')
+        kanji = Kanji.objects.create(character='日', keyword='day',
+                                     heisig_index=12)
+        self.card = KanjiCard.objects.create(kanji=kanji,
+                                             mnemonic='midday sun',
+                                             collection=self.collection,
+                                             consecutive_correct=2,
+                                             efactor=2.2)
+
+    def tearDown(self):
+        reviewlog._take()
+
+    def test_lock_read_and_update_are_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            [card] = KanjiCard.objects.filter(pk=self.card.pk).review(5)
+        cards = [q['sql'] for q in queries
+                 if 'kanji_kanjicard"' in q['sql'] and
+                 'kanji_kanjicardcollection"' not in q['sql']]
+        self.assertEqual(len(cards), 1)
+        self.assertTrue(cards[0].startswith('WITH'))
+        self.assertIn('FOR UPDATE', cards[0])
+        self.assertIn('RETURNING', cards[0])
+        self.assertEqual(card.consecutive_correct, 3)
+
+    def test_old_values_returned(self):
+        expected = copy.copy(self.card)
+        expected._calculate_next_review(5)
+        [card] = KanjiCard.objects.filter(pk=self.card.pk).review(5)
+        for field in KanjiCard.SCHEDULE_FIELDS:
+            self.assertEqual(getattr(card, field), getattr(expected, field))
+        [entry] = reviewlog._take()
+        self.assertEqual(entry.efactor_before, 2.2)
+        self.assertAlmostEqual(entry.efactor_after, 2.3)
+        collection = KanjiCardCollection.objects.get(pk=self.collection.pk)
+        self.assertEqual(collection.learned_count, 1)
+        self.assertAlmostEqual(collection.efactor_sum, 2.3)
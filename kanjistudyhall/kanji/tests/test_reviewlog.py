@@ -0,0 +1,165 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.test import TestCase
+
+from kanji import reviewlog
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection, ReviewLog
+
+User = get_user_model()
+
+
+class ReviewLogTest(TestCase):
+
+    def setUp(self):
+        reviewlog._take()
+        self.owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(
+            owner=self.owner, name='default')
+        self.sun = self._create_card('日', 'day', 12, 'midday sun')
+        self.moon = self._create_card('月', 'month', 13, 'waxing moon')
+
+    def _create_card(self, character, keyword, index, mnemonic):
+        kanji = Kanji.objects.create(character=character,
+                                     keyword=keyword,
+                                     heisig_index=index)
+        return KanjiCard.objects.create(kanji=kanji,
+                                        mnemonic=mnemonic,
+                                        collection=self.collection)
+
+    def test_review_is_buffered(self):
+        self.sun.set_review_score(5)
+        self.assertEqual(reviewlog.pending(), 1)
+        self.assertFalse(ReviewLog.objects.exists())
+
+    def test_flush_writes_entries(self):
+        self.sun.consecutive_correct = 2
+        self.sun.save()
+        self.sun.set_review_score(5)
+        self.assertEqual(reviewlog.flush(), 1)
+        self.assertEqual(reviewlog.pending(), 0)
+        log = ReviewLog.objects.get()
+        self.assertEqual(log.card, self.sun)
+        self.assertEqual(log.user, self.owner)
+        self.assertEqual(log.score, 5)
+        self.assertEqual(log.efactor_before, 2.5)
+        self.assertAlmostEqual(log.efactor_after, 2.6)
+        self.assertEqual(log.interval, 5)
+
+    def test_flush_is_one_insert(self):
+        for score in (5, 4, 1):
+            self.sun.set_review_score(score)
+        # One query for the owners, one INSERT; the test's transaction
+        # turns the atomic block around it into a savepoint
+        with self.assertNumQueries(4):
+            reviewlog.flush()
+        self.assertEqual(ReviewLog.objects.count(), 3)
+
+    def test_batch_reviews_each_logged(self):
+        self.collection.set_review_scores([(self.sun.pk, 1),
+                                           (self.moon.pk, 4),
+                                           (self.sun.pk, 4)])
+        reviewlog.flush()
+        self.assertEqual(
+            list(ReviewLog.objects.order_by('id').values_list(
+                'card_id', 'score', 'interval')),
+            [(self.sun.pk, 1, 0), (self.moon.pk, 4, 1), (self.sun.pk, 4, 1)])
+
+    def test_queryset_review_logged(self):
+        KanjiCard.objects.filter(pk=self.moon.pk).review(3)
+        reviewlog.flush()
+        log = ReviewLog.objects.get()
+        self.assertEqual(log.card, self.moon)
+        self.assertEqual(log.efactor_before, 2.5)
+        self.assertEqual(log.interval, 0)
+
+    def test_deleted_card_entries_kept_without_card(self):
+        self.sun.set_review_score(5)
+        self.moon.set_review_score(5)
+        self.moon.delete()
+        self.assertEqual(reviewlog.flush(), 2)
+        self.assertEqual(
+            list(ReviewLog.objects.order_by('id').values_list(
+                'card_id', 'user_id', 'efactor_after')),
+            [(self.sun.pk, self.owner.pk, 2.6),
+             (None, self.owner.pk, 2.6)])
+
+    def test_deleted_collection_entries_dropped(self):
+        self.sun.set_review_score(5)
+        self.collection.purge()
+        with mock.patch.object(reviewlog.logger, 'warning') as warning:
+            self.assertEqual(reviewlog.flush(), 0)
+        self.assertTrue(warning.called)
+
+    def test_history_kept_when_card_deleted(self):
+        self.sun.set_review_score(5)
+        reviewlog.flush()
+        self.sun.delete()
+        log = ReviewLog.objects.get()
+        self.assertIsNone(log.card)
+        self.assertEqual(log.user, self.owner)
+
+    def test_request_finished_waits_for_a_batch(self):
+        self.sun.set_review_score(5)
+        request_finished.send(sender=None)
+        self.assertEqual(reviewlog.pending(), 1)
+        with mock.patch.object(reviewlog, 'BATCH_SIZE', 2):
+            self.moon.set_review_score(5)
+            request_finished.send(sender=None)
+        self.assertEqual(reviewlog.pending(), 0)
+        self.assertEqual(ReviewLog.objects.count(), 2)
+
+    def test_request_finished_writes_old_entries(self):
+        self.sun.set_review_score(5)
+        with mock.patch.object(reviewlog, 'MAX_DELAY', 0):
+            request_finished.send(sender=None)
+        self.assertEqual(ReviewLog.objects.count(), 1)
+
+    def test_failed_write_keeps_entries(self):
+        self.sun.set_review_score(5)
+        with mock.patch.object(ReviewLog.objects, 'bulk_create',
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                reviewlog.flush()
+        self.assertEqual(reviewlog.pending(), 1)
+        self.assertEqual(reviewlog.flush(), 1)
+        self.assertEqual(ReviewLog.objects.get().card, self.sun)
+
+    def test_failed_write_retried_after_a_delay(self):
+        self.sun.set_review_score(5)
+        with mock.patch.object(ReviewLog.objects, 'bulk_create',
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                reviewlog.flush()
+        with mock.patch.object(reviewlog, 'BATCH_SIZE', 1):
+            request_finished.send(sender=None)
+            self.assertEqual(reviewlog.pending(), 1)
+            with mock.patch.object(reviewlog, '_retry_after', 0):
+                request_finished.send(sender=None)
+        self.assertEqual(ReviewLog.objects.count(), 1)
+
+    def test_failed_writes_keep_at_most_max_pending(self):
+        self.sun.set_review_score(5)
+        self.moon.set_review_score(5)
+        with mock.patch.object(reviewlog, 'MAX_PENDING', 1), \
+                mock.patch.object(ReviewLog.objects, 'bulk_create',
+                                  side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                reviewlog.flush()
+        self.assertEqual(reviewlog.pending(), 1)
+        reviewlog.flush()
+        self.assertEqual(ReviewLog.objects.get().card, self.moon)
+
+    def test_user_time_range(self):
+        reviewed_at = datetime.datetime(2015, 8, 1, tzinfo=datetime.timezone.utc)
+        self.sun.set_review_score(5)
+        reviewlog.flush()
+        ReviewLog.objects.update(reviewed_at=reviewed_at)
+        logs = ReviewLog.objects.filter(
+            user=self.owner,
+            reviewed_at__range=(reviewed_at, reviewed_at +
+                                datetime.timedelta(days=1)))
+        self.assertEqual(logs.count(), 1)
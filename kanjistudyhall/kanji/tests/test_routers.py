@@ -0,0 +1,133 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import override_settings
+
+from kanji import routers
+from kanji.middleware import PIN_COOKIE, ReplicaPinningMiddleware
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+REPLICAS = override_settings(REPLICA_DATABASES=['replica'],
+                             REPLICA_PIN_SECONDS=5)
+
+
+@REPLICAS
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        routers.reset()
+        self.router = routers.ReplicaRouter()
+
+    def tearDown(self):
+        routers.reset()
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.router.db_for_read(KanjiCard), 'replica')
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(KanjiCard), 'default')
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        self.router.db_for_write(KanjiCard)
+        self.assertTrue(routers.has_written())
+        self.assertEqual(self.router.db_for_read(KanjiCard), 'default')
+
+    def test_pin_expires(self):
+        with mock.patch('kanji.routers.time.monotonic', return_value=100):
+            self.router.db_for_write(KanjiCard)
+        with mock.patch('kanji.routers.time.monotonic', return_value=106):
+            self.assertEqual(self.router.db_for_read(KanjiCard), 'replica')
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        with mock.patch('kanji.routers.connections') as connections:
+            connections.__getitem__().in_atomic_block = True
+            self.assertEqual(self.router.db_for_read(KanjiCard), 'default')
+
+    @override_settings(REPLICA_DATABASES=['replica', 'replica2'])
+    def test_one_replica_per_thread(self):
+        with mock.patch('kanji.routers.random.choice',
+                        side_effect=['replica2', 'replica']) as choice:
+            reads = [self.router.db_for_read(KanjiCard) for _ in range(3)]
+            self.assertEqual(reads, ['replica2'] * 3)
+            routers.reset()
+            self.assertEqual(self.router.db_for_read(KanjiCard), 'replica')
+        self.assertEqual(choice.call_count, 2)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.router.db_for_read(KanjiCard), 'default')
+
+
+@REPLICAS
+class ReplicaPinningMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        routers.reset()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaPinningMiddleware()
+        self.router = routers.ReplicaRouter()
+
+    def tearDown(self):
+        routers.reset()
+
+    def _process(self, request, write=False):
+        self.middleware.process_request(request)
+        read = self.router.db_for_read(KanjiCard)
+        if write:
+            self.router.db_for_write(KanjiCard)
+        return read, self.middleware.process_response(request, HttpResponse())
+
+    def test_get_reads_from_replica(self):
+        read, response = self._process(self.factory.get('/'))
+        self.assertEqual(read, 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_post_reads_from_primary(self):
+        read, response = self._process(self.factory.post('/'))
+        self.assertEqual(read, 'default')
+
+    def test_write_sets_pin_cookie(self):
+        read, response = self._process(self.factory.post('/'), write=True)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+    def test_pin_cookie_sends_reads_to_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        read, response = self._process(request)
+        self.assertEqual(read, 'default')
+
+    def test_pin_does_not_leak_into_the_next_request(self):
+        self._process(self.factory.post('/'), write=True)
+        read, response = self._process(self.factory.get('/'))
+        self.assertEqual(read, 'replica')
+
+
+class ReplicaPinningViewTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='goodguy', password='pass')
+        self.client.login(username='goodguy', password='pass')
+        self.collection = KanjiCardCollection.objects.create(owner=user,
+                                                             name='col')
+        kanji = Kanji.objects.create(character='日', keyword='day',
+                                     heisig_index=12)
+        self.card = KanjiCard.objects.create(kanji=kanji, mnemonic='sun',
+                                             collection=self.collection)
+
+    def test_review_sets_pin_cookie(self):
+        response = self.client.post(
+            reverse('review_collection', kwargs={'slug': 'col'}),
+            json.dumps({'reviews': [[self.card.pk, 5]]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_read_only_view_sets_no_cookie(self):
+        response = self.client.get(reverse('collections_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
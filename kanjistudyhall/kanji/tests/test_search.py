@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from kanji.catalog import get_catalog
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+from kanji.search import search_cards
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(
+            owner=self.owner, name='default')
+        self.sun = self._create_card('日', 'day', 12,
+                                     'a samurai at midday under the sun')
+        self.moon = self._create_card('月', 'month', 13, 'waxing moon')
+        self.bright = self._create_card('明', 'bright', 20,
+                                        'sun and moon together')
+
+    def _create_card(self, character, keyword, index, mnemonic,
+                     collection=None):
+        kanji = Kanji.objects.create(character=character,
+                                     keyword=keyword,
+                                     heisig_index=index)
+        return KanjiCard.objects.create(kanji=kanji,
+                                        mnemonic=mnemonic,
+                                        collection=collection or
+                                        self.collection)
+
+    def _search(self, query, **kwargs):
+        return [card.pk for card in search_cards(self.owner, query, **kwargs)]
+
+    def test_keyword_prefix(self):
+        self.assertEqual(self._search('mon'), [self.moon.pk])
+        self.assertEqual(self._search('D'), [self.sun.pk])
+
+    def test_mnemonic_word(self):
+        self.assertEqual(self._search('samurai'), [self.sun.pk])
+
+    def test_mnemonic_word_prefix(self):
+        self.assertEqual(self._search('samu'), [self.sun.pk])
+
+    def test_keyword_matches_come_first(self):
+        self.assertEqual(self._search('moon'), [self.moon.pk, self.bright.pk])
+
+    def test_no_duplicates(self):
+        self.assertEqual(self._search('mon'), [self.moon.pk])
+        self.assertEqual(self._search('bright'), [self.bright.pk])
+
+    def test_short_queries_only_match_keywords(self):
+        self.assertEqual(self._search('su'), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self._search('moon', limit=1)), 1)
+
+    def test_owned_kanji_past_the_limit_of_catalog_matches(self):
+        for index in range(30):
+            Kanji.objects.create(character=chr(0x4e00 + index),
+                                 keyword='s{:02}'.format(index),
+                                 heisig_index=100 + index)
+        last = KanjiCard.objects.create(
+            kanji=Kanji.objects.get(keyword='s29'), mnemonic='last',
+            collection=self.collection)
+        self.assertEqual(self._search('s', limit=20), [last.pk])
+
+    @mock.patch('kanji.search.KEYWORD_BATCH_SIZE', 2)
+    def test_keyword_matches_in_batches(self):
+        # No cards for the first batch
+        Kanji.objects.create(character='刺', keyword='stab', heisig_index=28)
+        Kanji.objects.create(character='積', keyword='stack', heisig_index=29)
+        self._create_card('星', 'star', 30, 'shining')
+        self._create_card('石', 'stone', 31, 'rolling')
+        self._create_card('寺', 'temple', 41, 'bell')
+        self.assertEqual(
+            [card.kanji.keyword for card in search_cards(self.owner, 'st')],
+            ['star', 'stone'])
+
+    def test_keyword_batches_fetch_only_what_is_needed(self):
+        for index in range(6):
+            self._create_card(chr(0x4e00 + index), 's{}'.format(index),
+                              100 + index, 'story {}'.format(index))
+        with CaptureQueriesContext(connection) as queries:
+            found = search_cards(self.owner, 's', limit=4)
+        self.assertEqual([card.kanji.keyword for card in found],
+                         ['s0', 's1', 's2', 's3'])
+        [select] = [q['sql'] for q in queries
+                    if 'FROM "kanji_kanjicard"' in q['sql']]
+        self.assertIn('ORDER BY', select)
+        self.assertIn('LIMIT 4', select)
+
+    def test_blank_query(self):
+        self.assertEqual(self._search('  '), [])
+
+    def test_quotes_in_query(self):
+        self.assertEqual(self._search('"samurai'), [self.sun.pk])
+
+    def test_only_the_users_cards(self):
+        other = User.objects.create(username='other')
+        collection = KanjiCardCollection.objects.create(owner=other,
+                                                        name='other')
+        self._create_card('侍', 'samurai', 500, 'samurai story',
+                          collection=collection)
+        self.assertEqual(self._search('samurai'), [self.sun.pk])
+
+    def test_index_follows_mnemonic_changes(self):
+        self.moon.mnemonic = 'a ninja moon'
+        self.moon.save()
+        self.assertEqual(self._search('ninja'), [self.moon.pk])
+        self.assertEqual(self._search('waxing'), [])
+        self.moon.delete()
+        self.assertEqual(self._search('ninja'), [])
+
+    def test_kanji_and_collection_attached(self):
+        get_catalog()
+        with self.assertNumQueries(1):
+            [card] = search_cards(self.owner, 'samurai')
+            self.assertEqual(card.kanji.keyword, 'day')
+            self.assertEqual(card.collection.name, 'default')
+
+    def test_catalog_keyword_prefix(self):
+        catalog = get_catalog()
+        self.assertEqual(catalog.keyword_prefix('B'), [self.bright.kanji])
+        self.assertEqual(catalog.keyword_prefix('m'), [self.moon.kanji])
+        self.assertEqual(len(catalog.keyword_prefix('', limit=2)), 2)
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from kanji import slowqueries
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+
+User = get_user_model()
+
+
+class ShapeTest(TestCase):
+
+    def test_in_lists_of_any_length_have_one_shape(self):
+        self.assertEqual(
+            slowqueries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            slowqueries.fingerprint(
+                'SELECT * FROM t WHERE id IN (%s, %s, %s, %s)'))
+
+    def test_limits_are_ignored(self):
+        self.assertEqual(slowqueries.shape('SELECT "T3"."id" LIMIT 21'),
+                         'SELECT "T3"."id" LIMIT 0')
+
+
+@override_settings(SLOW_QUERY_SECONDS=0)
+class SlowQueryTest(TestCase):
+
+    def setUp(self):
+        with override_settings(SLOW_QUERY_SECONDS=None):
+            owner = User.objects.create(username='user')
+            self.collection = KanjiCardCollection.objects.create(
+                owner=owner, name='default')
+            kanji = Kanji.objects.create(character='日', keyword='day',
+                                         heisig_index=12)
+            KanjiCard.objects.create(kanji=kanji, collection=self.collection)
+        cache.clear()
+
+    def test_records_call_site_and_plan(self):
+        self.collection.next_scheduled_card()
+        [query] = slowqueries.recent()
+        self.assertIn('kanji_kanjicard', query['sql'])
+        self.assertTrue(query['call_site'].startswith('models.py:'))
+        self.assertTrue(query['call_site'].endswith(
+            ' in next_scheduled_card'))
+        self.assertEqual(query['database'], 'default')
+        self.assertTrue(query['plan'])
+
+    def test_explains_each_shape_once(self):
+        with mock.patch('kanji.slowqueries.explain',
+                        return_value='plan') as explain:
+            for _ in range(3):
+                self.collection.next_scheduled_card()
+            list(KanjiCard.objects.filter(pk__in=[1, 2]))
+            list(KanjiCard.objects.filter(pk__in=[1, 2, 3]))
+        self.assertEqual(explain.call_count, 2)
+        self.assertEqual(len(slowqueries.recent()), 5)
+
+    def test_explain_does_not_run_statements(self):
+        KanjiCard.objects.update(mnemonic='changed')
+        [query] = slowqueries.recent()
+        self.assertTrue(query['plan'])
+        self.assertEqual(KanjiCard.objects.get().mnemonic, 'changed')
+
+    @override_settings(SLOW_QUERY_BUFFER_SIZE=3)
+    def test_keeps_only_the_newest(self):
+        for pk in range(5):
+            list(KanjiCard.objects.filter(pk=pk))
+        queries = slowqueries.recent()
+        self.assertEqual([query['params'] for query in queries],
+                         ['(4,)', '(3,)', '(2,)'])
+
+    @override_settings(SLOW_QUERY_SECONDS=None)
+    def test_off(self):
+        self.collection.next_scheduled_card()
+        self.assertEqual(slowqueries.recent(), [])
+
+    @override_settings(SLOW_QUERY_SECONDS=60)
+    def test_fast_queries_are_not_recorded(self):
+        self.collection.next_scheduled_card()
+        self.assertEqual(slowqueries.recent(), [])
+
+    def test_admin_page(self):
+        self.collection.next_scheduled_card()
+        with override_settings(SLOW_QUERY_SECONDS=None):
+            user = User.objects.create_user(username='staff',
+                                            password='pass')
+            user.is_staff = True
+            user.save()
+            self.client.login(username='staff', password='pass')
+            response = self.client.get(reverse('slow_queries'))
+        self.assertContains(response, 'next_scheduled_card')
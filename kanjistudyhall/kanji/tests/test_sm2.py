@@ -0,0 +1,82 @@
+import datetime
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from kanji import sm2
+from kanji.models import KanjiCard
+
+
+def reference_review(efactor, streak, total, last_missed, score, today):
+    """The original per-card implementation of the schedule."""
+    total += 1
+    if score > 2:
+        ef = efactor + (0.1 - (5 - score) * (0.08 + (5 - score) * 0.02))
+        if ef < 1.3:
+            ef = 1.3
+        efactor = ef
+        streak += 1
+    else:
+        streak = 0
+        last_missed = today
+    if score < 4:
+        next_review = today
+    else:
+        interval = 1
+        if streak == 2:
+            interval = 6
+        elif streak > 2:
+            interval = (streak - 1) * efactor
+        next_review = today + datetime.timedelta(days=interval)
+    return total, streak, today, last_missed, next_review, efactor
+
+
+class SM2Test(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(2015)
+        self.today = datetime.date.today()
+        self.size = 5000
+        self.efactor = [rng.choice((1.3, 1.4999999999999998, 2.5)) +
+                        rng.randint(0, 14) * 0.1 for _ in range(self.size)]
+        self.streak = [rng.randint(0, 20) for _ in range(self.size)]
+        self.total = [s + rng.randint(0, 9) for s in self.streak]
+        self.last_missed = [self.today - datetime.timedelta(rng.randint(0, 99))
+                            for _ in range(self.size)]
+        self.score = [rng.randint(0, 5) for _ in range(self.size)]
+
+    def test_columns_match_reference_implementation(self):
+        schedule = sm2.review(self.efactor, self.streak, self.total,
+                              self.last_missed, self.score, self.today)
+        for i in range(self.size):
+            expected = reference_review(self.efactor[i], self.streak[i],
+                                        self.total[i], self.last_missed[i],
+                                        self.score[i], self.today)
+            actual = tuple(column[i].item() for column in schedule)
+            self.assertEqual(expected, actual)
+
+    def test_columns_match_card_reviews(self):
+        schedule = sm2.review(self.efactor, self.streak, self.total,
+                              self.last_missed, self.score, self.today)
+        for i in range(0, self.size, 50):
+            card = KanjiCard(efactor=self.efactor[i],
+                             consecutive_correct=self.streak[i],
+                             total_reviews=self.total[i],
+                             last_missed=self.last_missed[i])
+            card._calculate_next_review(self.score[i])
+            self.assertEqual(
+                tuple(getattr(card, f) for f in KanjiCard.SCHEDULE_FIELDS),
+                tuple(column[i].item() for column in schedule))
+
+    def test_accepts_datetime64_columns(self):
+        schedule = sm2.review([2.5], [1], [5],
+                              np.array([self.today], dtype='datetime64[D]'),
+                              [5], np.datetime64(self.today))
+        self.assertEqual(schedule.next_review[0].item(),
+                         self.today + datetime.timedelta(days=6))
+
+    def test_invalid_score_rejected(self):
+        with self.assertRaises(ValueError):
+            sm2.review([2.5, 2.5], [0, 0], [0, 0],
+                       [self.today, self.today], [4, 6], self.today)
@@ -0,0 +1,111 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from kanji import reviewlog
+from kanji.models import Kanji, KanjiCard, KanjiCardCollection
+from kanji.study import CARD_FIELDS, StudySession
+
+User = get_user_model()
+
+
+class StudySessionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create()
+        self.collection = KanjiCardCollection.objects.create(owner=owner,
+                                                             name='default')
+        self.sun = self._create_card('日', 'day', 12, 'midday sun')
+        self.moon = self._create_card('月', 'month', 13, 'waxing moon')
+
+    def tearDown(self):
+        reviewlog._take()
+
+    def _create_card(self, character, keyword, index, mnemonic):
+        kanji = Kanji.objects.create(character=character,
+                                     keyword=keyword,
+                                     heisig_index=index)
+        return KanjiCard.objects.create(kanji=kanji,
+                                        mnemonic=mnemonic,
+                                        collection=self.collection)
+
+    def test_queue_loaded_in_review_order(self):
+        session = StudySession(self.collection)
+        self.assertEqual(session.card_ids(), [self.sun.pk, self.moon.pk])
+
+    def test_next_card_served_without_queries(self):
+        StudySession(self.collection).next_card()
+        session = StudySession(self.collection)
+        with self.assertNumQueries(0):
+            card = session.next_card()
+        self.assertEqual(card, self.sun)
+        self.assertEqual(card.mnemonic, 'midday sun')
+
+    def test_missed_card_requeued_at_tail(self):
+        session = StudySession(self.collection)
+        card = session.next_card()
+        # Reading the old row and updating it
+        with self.assertNumQueries(2):
+            session.set_review_score(card, 1)
+        self.assertEqual(session.card_ids(), [self.moon.pk, self.sun.pk])
+        with self.assertNumQueries(0):
+            requeued = StudySession(self.collection).card_ids()
+        self.assertEqual(requeued, [self.moon.pk, self.sun.pk])
+
+    def test_passed_card_leaves_queue(self):
+        session = StudySession(self.collection)
+        session.set_review_score(session.next_card(), 5)
+        self.assertEqual(StudySession(self.collection).card_ids(),
+                         [self.moon.pk])
+
+    def test_empty_queue_returns_none(self):
+        session = StudySession(self.collection)
+        session.set_review_score(session.next_card(), 5)
+        session.set_review_score(session.next_card(), 5)
+        self.assertEqual(session.next_card(), None)
+
+    def test_new_card_invalidates_queue(self):
+        StudySession(self.collection).card_ids()
+        star = self._create_card('星', 'star', 1000, 'shooting star')
+        self.assertIn(star.pk, StudySession(self.collection).card_ids())
+
+    def test_edited_card_invalidates_queue(self):
+        StudySession(self.collection).card_ids()
+        self.sun.next_review = datetime.date.today() + datetime.timedelta(3)
+        self.sun.save()
+        self.assertEqual(StudySession(self.collection).card_ids(),
+                         [self.moon.pk])
+
+    def test_change_during_load_not_cached_as_current(self):
+        session = StudySession(self.collection)
+        due = KanjiCard.queue.due
+
+        def edit_meanwhile(collection, date):
+            rows = list(due(collection, date).values_list(*CARD_FIELDS))
+            KanjiCard.objects.filter(pk=self.moon.pk).review(5)
+            return mock.Mock(values_list=lambda *fields: rows)
+
+        with mock.patch.object(KanjiCard.queue, 'due',
+                               side_effect=edit_meanwhile):
+            self.assertEqual(session.card_ids(), [self.sun.pk, self.moon.pk])
+        self.assertEqual(StudySession(self.collection).card_ids(),
+                         [self.sun.pk])
+
+    def test_change_during_scoring_not_carried_over(self):
+        session = StudySession(self.collection)
+        card = session.next_card()
+        review = KanjiCard.set_review_score
+
+        def edit_meanwhile(card, score):
+            review(card, score)
+            KanjiCard.objects.filter(pk=self.moon.pk).review(5)
+
+        with mock.patch.object(KanjiCard, 'set_review_score', autospec=True,
+                               side_effect=edit_meanwhile):
+            session.set_review_score(card, 1)
+        self.assertEqual(StudySession(self.collection).card_ids(),
+                         [self.sun.pk])
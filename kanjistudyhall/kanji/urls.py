@@ -13,6 +13,16 @@ urlpatterns = [
         view=views.KanjiCardCollectionCreateView.as_view(),
         name='create_kanji_collection'
     ),
+    url(
+        regex=r'^search/$',
+        view=views.KanjiCardSearchView.as_view(),
+        name='search_cards'
+    ),
+    url(
+        regex=r'^collections/dashboard/$',
+        view=views.KanjiCardCollectionDashboardView.as_view(),
+        name='collections_dashboard'
+    ),
     url(
         regex=r'^collections/(?P<slug>\w+)/$',
         view=views.KanjiCardCollectionDetailView.as_view(),
@@ -28,4 +38,34 @@ urlpatterns = [
         view=views.KanjiCardCollectionDeleteView.as_view(),
         name='delete_collection'
     ),
+    url(
+        regex=r'^collections/(?P<slug>\w+)/reviews/$',
+        view=views.KanjiCardCollectionReviewView.as_view(),
+        name='review_collection'
+    ),
+    url(
+        regex=r'^collections/(?P<slug>\w+)/study/$',
+        view=views.KanjiCardCollectionStudyView.as_view(),
+        name='study_collection'
+    ),
+    url(
+        regex=r'^collections/(?P<slug>\w+)/forecast/$',
+        view=views.KanjiCardCollectionForecastView.as_view(),
+        name='forecast_collection'
+    ),
+    url(
+        regex=r'^collections/(?P<slug>\w+)/cards/heisig/$',
+        view=views.KanjiCardCollectionAddRangeView.as_view(),
+        name='add_heisig_range'
+    ),
+    url(
+        regex=r'^collections/(?P<slug>\w+)/export/$',
+        view=views.KanjiCardCollectionExportView.as_view(),
+        name='export_collection'
+    ),
+    url(
+        regex=r'^collections/(?P<slug>\w+)/import/$',
+        view=views.KanjiCardCollectionImportView.as_view(),
+        name='import_collection'
+    ),
 ]
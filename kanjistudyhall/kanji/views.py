@@ -1,12 +1,27 @@
+import codecs
+
 from django.core.urlresolvers import reverse_lazy
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseForbidden, StreamingHttpResponse)
 from django.shortcuts import redirect, render, get_object_or_404
 from django.views.generic import (CreateView, DeleteView, DetailView,
-                                  ListView, UpdateView)
+                                  ListView, TemplateView, UpdateView, View)
+from django.views.generic.detail import SingleObjectMixin
 
-from braces.views import LoginRequiredMixin
+from braces.views import (JSONResponseMixin, JsonRequestResponseMixin,
+                          LoginRequiredMixin)
 
 from .models import KanjiCardCollection, KanjiCard
-from .forms import KanjiCardCollectionForm
+from . import exports, metrics, profiling, slowqueries
+from .dashboard import dashboard
+from .deletion import delete_collection
+from .forecast import collection_forecast
+from .forms import (ForecastForm, HeisigRangeForm, ImportForm,
+                    KanjiCardCollectionForm, SearchForm)
+from .importers import import_cards
+from .search import search_cards
+from .study import StudySession
 
 
 class KanjiCardCollectionListView(ListView):
@@ -15,7 +30,47 @@ class KanjiCardCollectionListView(ListView):
     template_name = 'kanji/user_collections.html'
 
     def get_queryset(self):
-        return KanjiCardCollection.objects.filter(owner=self.request.user)
+        # The card counts come from the collections' own counters
+        collections = list(
+            KanjiCardCollection.objects.filter(owner=self.request.user))
+        KanjiCardCollection.refresh_due_counts(collections)
+        return collections
+
+
+class KanjiCardCollectionDashboardView(LoginRequiredMixin,
+                                       JSONResponseMixin,
+                                       View):
+    """Review statistics for each of the user's collections, as JSON."""
+
+    def get(self, request, *args, **kwargs):
+        return self.render_json_response(
+            {'collections': dashboard(request.user)})
+
+
+class KanjiCardSearchView(LoginRequiredMixin, JSONResponseMixin, View):
+    """Searches the user's cards by kanji keyword prefix and by mnemonic.
+    Takes q and an optional limit (default 20) query parameters.
+
+    """
+
+    def get(self, request, *args, **kwargs):
+        form = SearchForm(request.GET)
+        if not form.is_valid():
+            return self.render_json_response({'errors': form.errors},
+                                             status=400)
+        cards = search_cards(request.user, form.cleaned_data['q'],
+                             form.cleaned_data['limit'])
+        return self.render_json_response({'cards': [
+            {
+                'id': card.pk,
+                'collection': card.collection.name,
+                'character': card.kanji.character,
+                'keyword': card.kanji.keyword,
+                'heisig_index': card.kanji.heisig_index,
+                'mnemonic': card.mnemonic,
+            }
+            for card in cards
+        ]})
 
 
 class KanjiCardCollectionDetailView(LoginRequiredMixin, DetailView):
@@ -23,10 +78,48 @@ class KanjiCardCollectionDetailView(LoginRequiredMixin, DetailView):
     slug_field = 'name'
     template_name = 'kanji/collection_detail.html'
     context_object_name = 'collection'
+    paginate_by = 50
+    # Only what the card list shows. The related manager checks every
+    # card's collection, so that is needed too.
+    card_fields = ('collection', 'mnemonic', 'next_review', 'kanji',
+                   'kanji__character', 'kanji__keyword', 'kanji__heisig_index')
 
     def get_queryset(self):
         return KanjiCardCollection.objects.filter(owner=self.request.user)
 
+    def _cursor(self, name):
+        """Parse an after/before cursor, "<heisig_index>-<card id>"."""
+        value = self.request.GET.get(name)
+        if value is None:
+            return None
+        try:
+            heisig_index, pk = (int(part) for part in value.split('-'))
+        except ValueError:
+            raise Http404("Invalid cursor")
+        return heisig_index, pk
+
+    def get_context_data(self, **kwargs):
+        context = super(KanjiCardCollectionDetailView,
+                        self).get_context_data(**kwargs)
+        after = self._cursor('after')
+        before = self._cursor('before')
+        cards, more = self.object.kanjicard_set.only(
+            *self.card_fields).heisig_page(after, before, self.paginate_by)
+        if before is None:
+            has_previous, has_next = after is not None, more
+        else:
+            has_previous, has_next = more, True
+        context['cards'] = cards
+        context['previous_cursor'] = None
+        context['next_cursor'] = None
+        if cards and has_previous:
+            context['previous_cursor'] = '{}-{}'.format(
+                cards[0].kanji.heisig_index, cards[0].pk)
+        if cards and has_next:
+            context['next_cursor'] = '{}-{}'.format(
+                cards[-1].kanji.heisig_index, cards[-1].pk)
+        return context
+
 
 class KanjiCardCollectionCreateView(LoginRequiredMixin, CreateView):
     model = KanjiCardCollection
@@ -51,6 +144,13 @@ class KanjiCardCollectionDeleteView(LoginRequiredMixin, DeleteView):
     def get_queryset(self):
         return KanjiCardCollection.objects.filter(owner=self.request.user)
 
+    def delete(self, request, *args, **kwargs):
+        # Set-based, and in the background for big collections; see
+        # kanji.deletion
+        self.object = self.get_object()
+        delete_collection(self.object)
+        return redirect(self.get_success_url())
+
     
 class KanjiCardCollectionUpdateView(LoginRequiredMixin, UpdateView):
     model = KanjiCardCollection
@@ -63,3 +163,289 @@ class KanjiCardCollectionUpdateView(LoginRequiredMixin, UpdateView):
     
     def get_queryset(self):
         return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+
+class KanjiCardCollectionReviewView(LoginRequiredMixin,
+                                    JsonRequestResponseMixin,
+                                    SingleObjectMixin,
+                                    View):
+    """Accepts a batch of review scores for cards in a collection, as JSON:
+    {"reviews": [[card_id, score], ...]}
+    Responds with the new schedule of every scored card.
+
+    """
+    model = KanjiCardCollection
+    slug_field = 'name'
+    require_json = True
+
+    def get_queryset(self):
+        return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+    def _parse_reviews(self):
+        try:
+            reviews = self.request_json['reviews']
+        except (KeyError, TypeError):
+            raise ValueError("Expected an object with a 'reviews' list")
+        if not isinstance(reviews, list):
+            raise ValueError("Expected an object with a 'reviews' list")
+        for review in reviews:
+            if (not isinstance(review, list) or len(review) != 2 or
+                    not all(type(value) is int for value in review)):
+                raise ValueError(
+                    "Each review must be a [card_id, score] pair of integers")
+        return reviews
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        try:
+            cards = self.object.set_review_scores(self._parse_reviews())
+        except (ValueError, KanjiCard.DoesNotExist) as e:
+            return self.render_bad_request_response({'errors': [str(e)]})
+        return self.render_json_response({'cards': [
+            {
+                'id': card.pk,
+                'total_reviews': card.total_reviews,
+                'consecutive_correct': card.consecutive_correct,
+                'efactor': card.efactor,
+                'next_review': card.next_review,
+            }
+            for card in cards
+        ]})
+
+
+class KanjiCardCollectionStudyView(LoginRequiredMixin,
+                                   JsonRequestResponseMixin,
+                                   SingleObjectMixin,
+                                   View):
+    """The day's review queue of a collection, one card at a time, from
+    its StudySession. GET responds with the next card, or null once the
+    day's reviews are done. POST scores a card in the queue, as JSON:
+    {"card": card_id, "score": score}
+    and responds with the card after it.
+
+    """
+    model = KanjiCardCollection
+    slug_field = 'name'
+
+    def get_queryset(self):
+        return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+    def _render_next_card(self, session):
+        card = session.next_card()
+        if card is not None:
+            card = {
+                'id': card.pk,
+                'character': card.kanji.character,
+                'keyword': card.kanji.keyword,
+                'heisig_index': card.kanji.heisig_index,
+                'mnemonic': card.mnemonic,
+                'next_review': card.next_review,
+            }
+        return self.render_json_response({'card': card,
+                                          'remaining': len(session)})
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return self._render_next_card(StudySession(self.object))
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        review = self.request_json
+        if (not isinstance(review, dict) or
+                not all(type(review.get(key)) is int
+                        for key in ('card', 'score'))):
+            return self.render_bad_request_response({'errors': [
+                "Expected an object with integer 'card' and 'score'"]})
+        session = StudySession(self.object)
+        if review['card'] not in session.card_ids():
+            return self.render_bad_request_response({'errors': [
+                "Card {} is not due for review".format(review['card'])]})
+        card = self.object.kanjicard_set.get(pk=review['card'])
+        try:
+            session.set_review_score(card, review['score'])
+        except ValueError as e:
+            return self.render_bad_request_response({'errors': [str(e)]})
+        return self._render_next_card(session)
+
+
+class KanjiCardCollectionForecastView(LoginRequiredMixin,
+                                      JSONResponseMixin,
+                                      SingleObjectMixin,
+                                      View):
+    """Projected reviews per day for a collection, as JSON.
+    Takes optional days (default 30) and scores (comma-separated scores
+    to assume, default 4) query parameters.
+
+    """
+    model = KanjiCardCollection
+    slug_field = 'name'
+
+    def get_queryset(self):
+        return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        form = ForecastForm(request.GET)
+        if not form.is_valid():
+            return self.render_json_response({'errors': form.errors},
+                                             status=400)
+        days = collection_forecast(self.object,
+                                   form.cleaned_data['days'],
+                                   form.cleaned_data['scores'])
+        return self.render_json_response({'days': days})
+
+
+class KanjiCardCollectionAddRangeView(LoginRequiredMixin,
+                                      JSONResponseMixin,
+                                      SingleObjectMixin,
+                                      View):
+    """Adds cards for a range of Heisig indexes (first and last) to a
+    collection. Responds with the number of cards inserted, and skipped
+    because the collection already had them.
+
+    """
+    model = KanjiCardCollection
+    slug_field = 'name'
+
+    def get_queryset(self):
+        return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        form = HeisigRangeForm(request.POST)
+        if not form.is_valid():
+            return self.render_json_response({'errors': form.errors},
+                                             status=400)
+        inserted, skipped = self.object.add_heisig_range(
+            form.cleaned_data['first'], form.cleaned_data['last'])
+        return self.render_json_response({'inserted': inserted,
+                                          'skipped': skipped})
+
+
+class KanjiCardCollectionExportView(LoginRequiredMixin,
+                                    SingleObjectMixin,
+                                    View):
+    """Downloads every card in a collection, with its mnemonic and
+    scheduling state, as CSV (the default) or JSON (?format=json).
+    The response is streamed, so memory use doesn't grow with the size
+    of the collection.
+
+    """
+    model = KanjiCardCollection
+    slug_field = 'name'
+
+    def get_queryset(self):
+        return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        file_format = request.GET.get('format', 'csv')
+        try:
+            export, content_type = exports.FORMATS[file_format]
+        except KeyError:
+            raise Http404("Unknown export format")
+        response = StreamingHttpResponse(export(self.object),
+                                         content_type=content_type)
+        response['Content-Disposition'] = (
+            'attachment; filename="{}.{}"'.format(self.object.name,
+                                                  file_format))
+        return response
+
+
+class KanjiCardCollectionImportView(LoginRequiredMixin,
+                                    JSONResponseMixin,
+                                    SingleObjectMixin,
+                                    View):
+    """Imports an uploaded deck (UTF-8 CSV or tab-separated, with a header
+    row) into a collection. Responds with the number of cards imported
+    and the rows that were skipped. For Anki decks, anki_created gives
+    the day the Anki collection was created, from which its due column
+    counts days.
+
+    """
+    model = KanjiCardCollection
+    slug_field = 'name'
+
+    def get_queryset(self):
+        return KanjiCardCollection.objects.filter(owner=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        form = ImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return self.render_json_response({'errors': form.errors},
+                                             status=400)
+        lines = codecs.iterdecode(form.cleaned_data['file'], 'utf-8-sig')
+        result = import_cards(self.object, lines,
+                              day_zero=form.cleaned_data['anki_created'])
+        return self.render_json_response({
+            'imported': result.imported,
+            'error_count': result.error_count,
+            'errors': [{'line': line, 'message': message}
+                       for line, message in result.errors],
+        })
+
+
+class MetricsView(View):
+    """Request metrics in the Prometheus text format, for the addresses in
+    METRICS_ALLOWED_IPS. See kanji.metrics.
+
+    """
+
+    def get(self, request, *args, **kwargs):
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+            return HttpResponseForbidden()
+        body, content_type = metrics.render()
+        return HttpResponse(body, content_type=content_type)
+
+
+class ProfileListView(TemplateView):
+    """The stored request profiles, and the current user's token for
+    profiling their own requests. See kanji.profiling.
+
+    """
+    template_name = 'kanji/profiles.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(ProfileListView, self).get_context_data(**kwargs)
+        context['profiles'] = profiling.profiles()
+        context['token'] = profiling.make_token(self.request.user)
+        context['token_max_age'] = settings.PROFILING_TOKEN_MAX_AGE
+        return context
+
+
+class ProfileDownloadView(View):
+    """Downloads a stored profile as a pstats file, or as folded stacks
+    for flamegraph.pl or speedscope (?format=folded).
+
+    """
+
+    def get(self, request, name, *args, **kwargs):
+        path = profiling.path(name)
+        if path is None:
+            raise Http404("No such profile")
+        if request.GET.get('format') == 'folded':
+            response = HttpResponse(
+                profiling.folded_stacks(profiling.load(name)),
+                content_type='text/plain; charset=utf-8')
+            name = name[:-len(profiling.SUFFIX)] + '.folded'
+        else:
+            response = FileResponse(open(path, 'rb'),
+                                    content_type='application/octet-stream')
+        response['Content-Disposition'] = (
+            'attachment; filename="{}"'.format(name))
+        return response
+
+
+class SlowQueryListView(TemplateView):
+    """The newest statements slower than SLOW_QUERY_SECONDS, with where
+    they were run from and their plans. See kanji.slowqueries.
+
+    """
+    template_name = 'kanji/slow_queries.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(SlowQueryListView, self).get_context_data(**kwargs)
+        context['queries'] = slowqueries.recent()
+        context['threshold'] = settings.SLOW_QUERY_SECONDS
+        return context